@@ -0,0 +1,520 @@
+"""
+Comparison cases run by run_benchmarks.py --cases: each one times an optimized path of the
+pipeline against the implementation it replaced, or against its own variants, on about
+--size bytes of seeded synthetic data, after checking that they give the same results.
+
+A case is a function of (size_bytes, tmp_dir) that returns one result row per variant
+(see result), registered in CASES by the @case decorator.
+"""
+import gc
+import os
+import shutil
+import time
+import tracemalloc
+
+from synthetic import (
+    SyntheticTibetan,
+    generate_conllu,
+    generate_evaluation,
+    generate_segpos,
+)
+
+CASES = {}
+BATCH_SIZE = 32  # records per training batch, for the padding of the splitting case
+
+
+def case(func):
+    CASES[func.__name__] = func
+    return func
+
+
+def timed(func, repeat=1):
+    # Like timeit, without the garbage collector, whose passes grow with the heap
+    seconds = None
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            value = func()
+            elapsed = time.perf_counter() - start
+            seconds = elapsed if seconds is None else min(seconds, elapsed)
+    finally:
+        gc.enable()
+    return value, seconds
+
+
+def traced(func):
+    # Runs func under tracemalloc (slower, so never timed) and returns the memory still
+    # held and the peak of Python allocations, in bytes; memory-mapped pages are not counted
+    tracemalloc.start()
+    try:
+        value = func()
+        held, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return value, held, peak
+
+
+def consume(records):
+    return sum(1 for _ in records)
+
+
+def result(variant, seconds, records, size=None, peak=None, note=""):
+    """Returns the row of one variant of a case; size and peak are in bytes."""
+    return {
+        "variant": variant,
+        "seconds": seconds,
+        "records": records,
+        "records_per_s": records / seconds if seconds else 0.0,
+        "mb_per_s": size / 1024**2 / seconds if size and seconds else None,
+        "peak_mb": peak / 1024**2 if peak is not None else None,
+        "note": note,
+    }
+
+
+def build_records(size, files=100):
+    """Returns synthetic records totalling about size bytes of text, in blocks of files."""
+    synthetic = SyntheticTibetan(seed=0)
+    records = []
+    written = 0
+    while written < size:
+        words = synthetic.sentence()
+        record = {"source": "".join(words), "target": " ".join(words)}
+        written += len(record["target"].encode("utf-8")) * 2
+        records.append(record)
+    per_file = -(-len(records) // files)
+    for index, record in enumerate(records):
+        record["filename"] = f"volume_{index // per_file}.txt"
+    return records
+
+
+@case
+def segpos_engine(size, tmp_dir):
+    """The SegPos engine (text and memory-mapped readers) against the per-word loop."""
+    from TibWordGathering.segpos_engine import (
+        KANGYUR_TENGYUR_MARKERS,
+        iter_file_data_points,
+    )
+    from TibWordGathering.utils import make_data_point
+
+    def legacy(file_path):
+        current_sentence = []
+        filename = os.path.basename(file_path)
+        with open(file_path, encoding="utf-8") as file:
+            for line in file:
+                for word in line.strip().split():
+                    if word == "<utt>":
+                        if current_sentence:
+                            yield make_data_point(current_sentence, filename)
+                            current_sentence = []
+                    elif word.startswith("p") and word[1:].isdigit():
+                        if current_sentence:
+                            yield make_data_point(current_sentence, filename)
+                        current_sentence = []
+                    elif word.startswith("ln") and word[2:].isdigit():
+                        continue
+                    else:
+                        current_sentence.append(word)
+        if current_sentence:
+            yield make_data_point(current_sentence, filename)
+
+    file_path = generate_segpos(
+        os.path.join(tmp_dir, "segpos.txt"), size, line_markers=True
+    )
+    readers = {
+        "legacy loop": legacy,
+        "engine": lambda path: iter_file_data_points(path, KANGYUR_TENGYUR_MARKERS),
+        "engine, mmap": lambda path: iter_file_data_points(
+            path, KANGYUR_TENGYUR_MARKERS, use_mmap=True
+        ),
+    }
+    expected = list(legacy(file_path))
+    for name, reader in readers.items():
+        assert list(reader(file_path)) == expected, name
+    del expected
+
+    rows = []
+    for name, reader in readers.items():
+        records, seconds = timed(lambda: consume(reader(file_path)))
+        _, _, peak = traced(lambda: consume(reader(file_path)))
+        rows.append(result(name, seconds, records, os.path.getsize(file_path), peak))
+    return rows
+
+
+@case
+def validation(size, tmp_dir):
+    """utils.is_valid_data_point and its batch form against the per-character comparison."""
+    from TibWordGathering.utils import (
+        diagnose_data_point,
+        is_valid_data_point,
+        manhattan_distance,
+        validate_data_points,
+    )
+
+    def legacy_is_valid_data_point(data_point):
+        source = data_point["source"].replace(" ", "")
+        target = data_point["target"].replace(" ", "")
+        if len(source) != len(target):
+            return False
+        return manhattan_distance(source, target) == 0
+
+    records = build_records(size)
+    # A tenth of the records invalid, their target cut in half and ending with a wrong character
+    for record in records[::10]:
+        record["target"] = record["target"][: len(record["target"]) // 2] + "X"
+    invalid = [record for record in records if not is_valid_data_point(record)]
+    variants = {
+        "legacy": lambda: [legacy_is_valid_data_point(r) for r in records],
+        "is_valid_data_point": lambda: [is_valid_data_point(r) for r in records],
+        "validate_data_points": lambda: validate_data_points(records),
+    }
+    assert variants["legacy"]() == variants["validate_data_points"]()
+
+    rows = []
+    for name, func in variants.items():
+        _, seconds = timed(func, repeat=5)
+        rows.append(result(name, seconds, len(records)))
+    _, seconds = timed(lambda: [diagnose_data_point(r) for r in invalid], repeat=5)
+    rows.append(
+        result("diagnose_data_point", seconds, len(invalid), note="invalid only")
+    )
+    return rows
+
+
+@case
+def normalization(size, tmp_dir):
+    """
+    SegPos parsing with and without a Normalizer, on clean and on noisy text, the records
+    normalized one by one against in batches, and the character replacements done with
+    str.replace against str.translate.
+    """
+    from TibWordGathering.normalization import Normalizer, iter_normalized
+    from TibWordGathering.segpos import iter_data_points
+
+    def add_noise(file_path):
+        # Every tenth tsheg non-breaking, a zero-width space before every shad
+        with open(file_path, encoding="utf-8") as f:
+            parts = f.read().split("་")
+        text = "".join(
+            part + ("༌" if index % 10 == 0 else "་")
+            for index, part in enumerate(parts[:-1])
+        )
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write((text + parts[-1]).replace("།", "​།"))
+
+    normalizer = Normalizer()
+    table = str.maketrans(normalizer.table)
+    file_path = generate_segpos(os.path.join(tmp_dir, "segpos.txt"), size)
+    rows = []
+    for text in ("clean", "noisy"):
+        if text == "noisy":
+            add_noise(file_path)
+        records, parse_seconds = timed(lambda: list(iter_data_points(file_path)))
+        # Before the records are normalized in place
+        fields = [record[field] for record in records for field in normalizer.fields]
+        copies = [dict(record) for record in records]
+        _, normalize_seconds = timed(lambda: [normalizer(r) for r in copies])
+        _, batch_seconds = timed(
+            lambda: consume(normalizer.normalize_data_points(records))
+        )
+        _, both_seconds = timed(
+            lambda: consume(iter_normalized(iter_data_points, normalizer, file_path))
+        )
+        _, replace_seconds = timed(
+            lambda: [normalizer.replace_characters(field) for field in fields]
+        )
+        _, translate_seconds = timed(
+            lambda: [field.translate(table) for field in fields]
+        )
+        overhead = f"{both_seconds / parse_seconds - 1:.0%} overhead"
+        rows += [
+            result(f"{text}: parse", parse_seconds, len(records), size),
+            result(f"{text}: normalize", normalize_seconds, len(records), size),
+            result(f"{text}: normalize, batch", batch_seconds, len(records), size),
+            result(f"{text}: both", both_seconds, len(records), size, note=overhead),
+            result(f"{text}: replace, str.replace", replace_seconds, len(fields)),
+            result(f"{text}: replace, translate", translate_seconds, len(fields)),
+        ]
+    return rows
+
+
+@case
+def decoding(size, tmp_dir):
+    """Evaluation files decoded in chunks, UTF-16 and UTF-8, against the line reader."""
+    from TibWordGathering.evaluation_tib_word import iter_tibetan_data
+
+    def previous(file_path, encoding="utf-16"):
+        filename = os.path.basename(file_path)
+        with open(file_path, encoding=encoding) as file:
+            for line in file:
+                line = line.strip()
+                if line:
+                    words = line.split("/")
+                    source = "".join(words)
+                    target = " ".join([word for word in words if word])
+                    yield {"source": source, "target": target, "filename": filename}
+
+    utf16_path = generate_evaluation(os.path.join(tmp_dir, "utf16.txt"), size)
+    utf8_path = os.path.join(tmp_dir, "utf8.txt")
+    with open(utf16_path, encoding="utf-16") as source, open(
+        utf8_path, "w", encoding="utf-8"
+    ) as target:
+        target.write(source.read())
+
+    rows = []
+    for name, reader, file_path in [
+        ("previous, UTF-16", previous, utf16_path),
+        ("detected, UTF-16", iter_tibetan_data, utf16_path),
+        ("detected, UTF-8", iter_tibetan_data, utf8_path),
+    ]:
+        records, seconds = timed(lambda: consume(reader(file_path)))
+        rows.append(result(name, seconds, records, os.path.getsize(file_path)))
+    return rows
+
+
+@case
+def prefetch(size, tmp_dir):
+    """
+    Listing and parsing a folder of 8 KB CoNLL-U files: os.walk + os.listdir against the
+    os.scandir walk, and parsing with and without reader threads. On a local disk the files
+    come from the page cache and prefetching mostly shows its overhead; its gain comes from
+    file systems with a high latency per file, such as NFS.
+    """
+    from TibWordGathering.conllu_parser import process_conllu_folder
+    from TibWordGathering.utils import list_subfolder_files
+
+    def list_subfolder_files_previous(folder_path, extension):
+        file_paths = []
+        for root, dirs, files in os.walk(folder_path):
+            for dir in dirs:
+                for filename in os.listdir(os.path.join(root, dir)):
+                    if filename.endswith(extension):
+                        file_paths.append(os.path.join(root, dir, filename))
+        return sorted(file_paths)
+
+    # The same files in one folder (for the CoNLL-U parser) and in 50 sub-folders
+    count = max(1, size // (8 * 1024))
+    flat_dir = os.path.join(tmp_dir, "flat")
+    input_dir = os.path.join(tmp_dir, "input")
+    os.makedirs(flat_dir)
+    sample_path = generate_conllu(os.path.join(tmp_dir, "sample.conllu"), 8 * 1024)
+    for index in range(count):
+        file_path = os.path.join(flat_dir, f"{index}.conllu")
+        shutil.copyfile(sample_path, file_path)
+        volume_dir = os.path.join(input_dir, f"volume{index % 50}")
+        os.makedirs(volume_dir, exist_ok=True)
+        os.link(file_path, os.path.join(volume_dir, f"{index}.conllu"))
+    total = count * os.path.getsize(sample_path)
+
+    previous, previous_seconds = timed(
+        lambda: list_subfolder_files_previous(input_dir, ".conllu")
+    )
+    walked, walk_seconds = timed(lambda: list_subfolder_files(input_dir, ".conllu"))
+    assert walked == previous
+    rows = [
+        result("listing, os.walk", previous_seconds, count, note="files/s"),
+        result("listing, os.scandir", walk_seconds, count, note="files/s"),
+    ]
+    for threads in [0, 4, 16]:
+        counts, seconds = timed(
+            lambda: process_conllu_folder(
+                flat_dir,
+                os.path.join(tmp_dir, f"valid_{threads}.jsonl"),
+                os.path.join(tmp_dir, f"invalid_{threads}.jsonl"),
+                workers=1,
+                prefetch=threads,
+            )
+        )
+        rows.append(result(f"parsing, prefetch={threads}", seconds, sum(counts), total))
+    return rows
+
+
+@case
+def record_store(size, tmp_dir):
+    """The records of a SegPos file held as a list of dicts and as a RecordStore."""
+    from TibWordGathering.records import RecordStore
+    from TibWordGathering.segpos import iter_data_points
+
+    def store(records):
+        records_store = RecordStore()
+        records_store.extend(records)
+        return records_store
+
+    file_path = generate_segpos(os.path.join(tmp_dir, "segpos.txt"), size)
+    rows = []
+    for name, build in [
+        ("list of dicts", lambda: list(iter_data_points(file_path))),
+        ("RecordStore", lambda: store(iter_data_points(file_path))),
+    ]:
+        records, seconds = timed(build)
+        _, iter_seconds = timed(lambda: consume(records))
+        # Only what is allocated after tracemalloc starts is counted as held
+        records, held, peak = traced(build)
+        note = f"holds {held / 1024**2:.1f} MB, iterated in {iter_seconds:.2f}s"
+        rows.append(result(name, seconds, len(records), size, peak, note))
+    return rows
+
+
+@case
+def codec(size, tmp_dir):
+    """Writing and reading records with the json module and with the selected backend."""
+    from TibWordGathering import codec as json_codec
+    from TibWordGathering.utils import iter_records, save_records
+
+    records = build_records(size)
+    backends = ["json"]
+    if json_codec.backend != "json":
+        backends.append(json_codec.backend)
+    rows = []
+    try:
+        for extension in [".jsonl", ".json"]:
+            file_path = os.path.join(tmp_dir, "records" + extension)
+            for name in backends:
+                json_codec.use_backend(name)
+                _, write_seconds = timed(lambda: save_records(records, file_path))
+                count, read_seconds = timed(lambda: consume(iter_records(file_path)))
+                file_size = os.path.getsize(file_path)
+                rows += [
+                    result(
+                        f"{extension} {name} write", write_seconds, count, file_size
+                    ),
+                    result(f"{extension} {name} read", read_seconds, count, file_size),
+                ]
+    finally:
+        json_codec.use_backend()
+    return rows
+
+
+@case
+def record_index(size, tmp_dir):
+    """Reading one file's records of a dataset through its sidecar index, or by a full scan."""
+    from TibWordGathering.record_index import RecordIndex
+    from TibWordGathering.utils import iter_records, save_records
+
+    records = build_records(size)
+    file_path = os.path.join(tmp_dir, "combined.json")
+    save_records(records, file_path, index=True)
+    filename = records[len(records) // 2]["filename"]
+    del records
+
+    def read_block():
+        with RecordIndex(file_path) as index:
+            return list(index.by_filename(filename))
+
+    def read_record():
+        with RecordIndex(file_path) as index:
+            return index[0]
+
+    expected, scan_seconds = timed(
+        lambda: [r for r in iter_records(file_path) if r["filename"] == filename]
+    )
+    block, block_seconds = timed(read_block)
+    assert block == expected
+    _, record_seconds = timed(read_record, repeat=5)
+    return [
+        result("full scan and filter", scan_seconds, len(expected), note="one file"),
+        result("index, one filename", block_seconds, len(block), note="one file"),
+        result("index, one record", record_seconds, 1),
+    ]
+
+
+@case
+def labels(size, tmp_dir):
+    """Training labels computed from target strings against slices of the exported arrays."""
+    from TibWordGathering.labels import open_npy, write_label_arrays
+
+    def labels_from_strings(records):
+        # Per-record string processing, as done by the data loaders on every epoch
+        batches = []
+        for record in records:
+            token_labels = []
+            for token in record["target"].split(" "):
+                if len(token) == 1:
+                    token_labels.append(3)
+                elif token:
+                    token_labels.extend([0] + [1] * (len(token) - 2) + [2])
+            batches.append(([ord(char) for char in record["source"]], token_labels))
+        return batches
+
+    def labels_from_arrays(output_dir):
+        text = open_npy(os.path.join(output_dir, "text.npy"))
+        label_array = open_npy(os.path.join(output_dir, "labels_bmes.npy"))
+        offsets = open_npy(os.path.join(output_dir, "offsets.npy"))
+        batches = []
+        for index in range(offsets.shape[0] - 1):
+            start, end = offsets[index, 0], offsets[index + 1, 0]
+            batches.append((text[start:end], label_array[start:end]))
+        return batches
+
+    records = build_records(size)
+    _, export_seconds = timed(
+        lambda: write_label_arrays(records, tmp_dir, schemes=["bmes"])
+    )
+    from_strings, strings_seconds = timed(lambda: labels_from_strings(records))
+    from_arrays, arrays_seconds = timed(lambda: labels_from_arrays(tmp_dir))
+    assert [batch for _, batch in from_strings] == [
+        batch.tolist() for _, batch in from_arrays
+    ]
+    return [
+        result("export (once)", export_seconds, len(records)),
+        result("labels from strings", strings_seconds, len(records), note="per epoch"),
+        result("slices of the arrays", arrays_seconds, len(records), note="per epoch"),
+    ]
+
+
+@case
+def splitting(size, tmp_dir):
+    """
+    Splitting long records and bucketing them by length, on a SegPos corpus without
+    '<utt>' markers, where every page is one record: the padding of batches of 32 records
+    in file order and drawn from length buckets.
+    """
+    from TibWordGathering.segpos import process_folder
+    from TibWordGathering.splitting import write_length_buckets
+    from TibWordGathering.utils import iter_records
+
+    def padding_ratio(lengths):
+        # Share of padding when every batch is padded to its longest record
+        padded = used = 0
+        for start in range(0, len(lengths), BATCH_SIZE):
+            batch = lengths[start : start + BATCH_SIZE]  # noqa: E203
+            padded += max(batch) * len(batch)
+            used += sum(batch)
+        return 1 - used / padded if padded else 0.0
+
+    volume_dir = os.path.join(tmp_dir, "input", "volume")
+    os.makedirs(volume_dir)
+    sample_path = generate_segpos(os.path.join(tmp_dir, "sample.txt"), size)
+    with open(sample_path, encoding="utf-8") as source, open(
+        os.path.join(volume_dir, "segpos.txt"), "w", encoding="utf-8"
+    ) as target:
+        for line in source:
+            target.write(line.replace(" <utt>", ""))
+
+    rows = []
+    for max_length in [None, 512, 256]:
+        valid_file = os.path.join(tmp_dir, f"valid_{max_length}.jsonl")
+        counts, seconds = timed(
+            lambda: process_folder(
+                os.path.join(tmp_dir, "input"),
+                valid_file,
+                os.path.join(tmp_dir, "invalid.jsonl"),
+                workers=1,
+                max_length=max_length,
+            )
+        )
+        lengths = [len(record["source"]) for record in iter_records(valid_file)]
+        bucket_dir = os.path.join(tmp_dir, f"buckets_{max_length}")
+        bucket_counts = write_length_buckets(iter_records(valid_file), bucket_dir)
+        bucket_padding = sum(
+            padding_ratio([len(r["source"]) for r in iter_records(file_path)]) * count
+            for file_path, count in bucket_counts.items()
+        )
+        note = (
+            f"longest {max(lengths):,}, padding {padding_ratio(lengths):.1%} in file "
+            f"order, {bucket_padding / len(lengths):.1%} in buckets"
+        )
+        rows.append(
+            result(f"max_length={max_length}", seconds, len(lengths), size, note=note)
+        )
+    return rows
@@ -0,0 +1,297 @@
+"""
+Benchmark harness for every ingestion path of the pipeline.
+
+A seeded synthetic corpus (see synthetic.py) is generated once per size and seed, then
+each stage runs in its own Python process so that its peak RSS is measured in isolation.
+For every stage the harness reports records/s, MB/s and peak RSS, can save the results
+as a baseline and can fail when a later run regresses against that baseline.
+
+The comparison cases of cases.py (e.g. the SegPos engine against the per-word loop) run
+with --cases, each on about --size bytes of data, and are saved and compared the same way.
+
+Usage:
+    PYTHONPATH=src python benchmarks/run_benchmarks.py --size 10MB
+    PYTHONPATH=src python benchmarks/run_benchmarks.py --size 1GB --save-baseline baseline.json
+    PYTHONPATH=src python benchmarks/run_benchmarks.py --size 1GB --compare baseline.json
+    PYTHONPATH=src python benchmarks/run_benchmarks.py --size 20MB --cases segpos_engine codec
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+from cases import CASES  # noqa: E402
+from synthetic import generate_corpus  # noqa: E402
+
+STAGES = [
+    "segpos",
+    "segpos_kang_and_eteng",
+    "conllu_parser",
+    "evaluation_tib_word",
+    "manual_dataset",
+    "combine_word_seg",
+]
+UNITS = {"KB": 1024, "MB": 1024**2, "GB": 1024**3}
+
+
+def parse_size(size):
+    """Parses sizes such as '10MB' or '5GB' into a number of bytes."""
+    size = size.strip().upper()
+    for unit, factor in UNITS.items():
+        if size.endswith(unit):
+            return int(float(size[: -len(unit)]) * factor)
+    return int(size)
+
+
+def folder_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path)
+        for name in files
+    )
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return own / 1024**2, children / 1024**2
+
+
+def run_stage(stage, data_dir, output_dir, workers):
+    """Runs one stage in the current process and returns (records, input bytes)."""
+    layout = {
+        "SegPos": os.path.join(data_dir, "SegPos"),
+        "SegPos-eKangyur-eTengyur": os.path.join(data_dir, "SegPos-eKangyur-eTengyur"),
+        "Conllu": os.path.join(data_dir, "Conllu"),
+        "Tibetan": os.path.join(data_dir, "Tibetan"),
+        "Manual-dataset": os.path.join(data_dir, "Manual-dataset", "manual_data.json"),
+    }
+
+    def outputs(name):
+        return (
+            os.path.join(output_dir, f"{name}_valid_data.json"),
+            os.path.join(output_dir, f"{name}_invalid_data.json"),
+        )
+
+    if stage == "segpos":
+        from TibWordGathering.segpos import process_folder
+
+        counts = process_folder(layout["SegPos"], *outputs(stage), workers=workers)
+        return sum(counts), folder_size(layout["SegPos"])
+    if stage == "segpos_kang_and_eteng":
+        from TibWordGathering.segpos_kang_and_eteng import process_folder
+
+        source = layout["SegPos-eKangyur-eTengyur"]
+        counts = process_folder(source, *outputs(stage), workers=workers)
+        return sum(counts), folder_size(source)
+    if stage == "conllu_parser":
+        from TibWordGathering.conllu_parser import process_conllu_folder
+
+        counts = process_conllu_folder(
+            layout["Conllu"], *outputs(stage), workers=workers
+        )
+        return sum(counts), folder_size(layout["Conllu"])
+    if stage == "evaluation_tib_word":
+        from TibWordGathering.evaluation_tib_word import process_folder
+
+        counts = process_folder(layout["Tibetan"], *outputs(stage), workers=workers)
+        return sum(counts), folder_size(layout["Tibetan"])
+    if stage == "manual_dataset":
+        from TibWordGathering.manual_dataset import process_data
+
+        counts = process_data(layout["Manual-dataset"], *outputs(stage))
+        return sum(counts), folder_size(layout["Manual-dataset"])
+    if stage == "combine_word_seg":
+        from TibWordGathering.combine_word_seg import combine_json_files
+
+        file_paths = [outputs(name)[0] for name in STAGES[:-1]]
+        file_paths = [path for path in file_paths if os.path.exists(path)]
+        counts = combine_json_files(
+            file_paths, os.path.join(output_dir, "combined_word_seg_data.json")
+        )
+        return sum(counts.values()), sum(folder_size(path) for path in file_paths)
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def measure_stage(stage, data_dir, output_dir, workers):
+    """Runs a stage in a fresh Python process and returns its measurements."""
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--run-stage",
+        stage,
+        "--data-dir",
+        data_dir,
+        "--output-dir",
+        output_dir,
+        "--workers",
+        str(workers),
+    ]
+    result = subprocess.run(command, check=True, capture_output=True, text=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_case(name, size):
+    """Runs a comparison case of cases.py in a temporary folder and returns its rows."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        return CASES[name](size, tmp_dir)
+
+
+def print_case(name, rows):
+    print(f"{name}")
+    for row in rows:
+        mb_per_s = "" if row["mb_per_s"] is None else f"{row['mb_per_s']:.1f}"
+        peak = "" if row["peak_mb"] is None else f"{row['peak_mb']:.1f} MB"
+        print(
+            f"  {row['variant']:<26}{row['seconds']:>9.3f} s{row['records_per_s']:>14,.0f}"
+            f"{mb_per_s:>10}{peak:>12}  {row['note']}".rstrip()
+        )
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the list of regressions of results against the baseline: stages and variants
+    of cases whose throughput dropped or whose peak memory grew by more than tolerance.
+    """
+    measurements = dict(results.get("stages", {}))
+    references = dict(baseline.get("stages", {}))
+    for section, store in [(results, measurements), (baseline, references)]:
+        for name, rows in section.get("cases", {}).items():
+            for row in rows:
+                store[f"{name}: {row['variant']}"] = row
+    regressions = []
+    for name, result in measurements.items():
+        reference = references.get(name)
+        if reference is None:
+            continue
+        if result["records_per_s"] < reference["records_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['records_per_s']:,.0f} records/s, "
+                f"baseline {reference['records_per_s']:,.0f}"
+            )
+        for key in ["peak_rss_mb", "peak_mb"]:
+            if result.get(key) is None or reference.get(key) is None:
+                continue
+            if result[key] > reference[key] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: peak {result[key]:.1f} MB, baseline {reference[key]:.1f} MB"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", default="10MB", help="corpus size per source")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--files-per-source", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=STAGES,
+        help="pipeline stages to run (default: all of them, unless --cases is given)",
+    )
+    parser.add_argument(
+        "--cases", nargs="+", choices=sorted(CASES), default=[], help="comparison cases"
+    )
+    parser.add_argument("--data-dir", help="where the synthetic corpus is kept")
+    parser.add_argument("--output-dir", help="where stage outputs are written")
+    parser.add_argument("--save-baseline", help="save the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed relative throughput drop or RSS growth before failing",
+    )
+    parser.add_argument("--run-stage", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        start = time.perf_counter()
+        records, size = run_stage(
+            args.run_stage, args.data_dir, args.output_dir, args.workers
+        )
+        seconds = time.perf_counter() - start
+        own_rss, children_rss = peak_rss_mb()
+        print(
+            json.dumps(
+                {
+                    "seconds": seconds,
+                    "records": records,
+                    "bytes": size,
+                    "records_per_s": records / seconds,
+                    "mb_per_s": size / 1024**2 / seconds,
+                    "peak_rss_mb": max(own_rss, children_rss),
+                }
+            )
+        )
+        return
+
+    size = parse_size(args.size)
+    stages = args.stages if args.stages is not None else [] if args.cases else STAGES
+    report = {
+        "size": args.size,
+        "seed": args.seed,
+        "workers": args.workers,
+        "python": sys.version.split()[0],
+        "stages": {},
+        "cases": {},
+    }
+    if stages:
+        report["stages"] = run_stages(args, stages, size)
+    for name in args.cases:
+        report["cases"][name] = run_case(name, size)
+        print_case(name, report["cases"][name])
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
+
+
+def run_stages(args, stages, size):
+    """Runs the pipeline stages on the synthetic corpus and returns their measurements."""
+    data_dir = args.data_dir or os.path.join(
+        BENCHMARK_DIR, ".data", f"{args.size}-seed{args.seed}-{args.files_per_source}"
+    )
+    output_dir = args.output_dir or os.path.join(data_dir, "output")
+    if not os.path.exists(os.path.join(data_dir, "Manual-dataset")):
+        print(f"Generating a {args.size} synthetic corpus in {data_dir}")
+        generate_corpus(data_dir, size, args.seed, args.files_per_source)
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = {}
+    print(f"{'stage':<24}{'records/s':>14}{'MB/s':>10}{'peak RSS':>12}")
+    for stage in stages:
+        result = measure_stage(stage, data_dir, output_dir, args.workers)
+        results[stage] = result
+        print(
+            f"{stage:<24}{result['records_per_s']:>14,.0f}"
+            f"{result['mb_per_s']:>10.1f}{result['peak_rss_mb']:>9.1f} MB"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    main()
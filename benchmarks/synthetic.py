@@ -0,0 +1,199 @@
+"""
+Seeded generator of synthetic Tibetan corpora in every input format of the pipeline:
+SegPos, SegPos eKangyur/eTengyur, CoNLL-U, slash-delimited evaluation files (UTF-16)
+and the manual JSON Lines dataset.
+
+The same seed and size always produce the same files. Files are written in a streaming
+way, so corpora of several GB can be generated without holding them in memory.
+"""
+import json
+import os
+import random
+
+CONSONANTS = list("ཀཁགངཅཆཇཉཏཐདནཔཕབམཙཚཛཝཞཟའཡརལཤསཧཨ")
+PREFIXES = ["", "", "", "ག", "ད", "བ", "མ", "འ"]
+SUPERSCRIPTS = ["", "", "", "ར", "ལ", "ས"]
+SUBSCRIPTS = ["", "", "", "ྱ", "ྲ", "ླ"]  # ya, ra, la btags
+VOWELS = ["", "", "ི", "ུ", "ེ", "ོ"]  # a, i, u, e, o
+SUFFIXES = ["", "", "ག", "ང", "ད", "ན", "བ", "མ", "འ", "ར", "ལ", "ས"]
+TSHEG = "་"
+SHAD = "།"
+
+
+class SyntheticTibetan:
+    """
+    Produces random but realistic-looking Tibetan syllables, words and sentences.
+
+    Parameters:
+    seed (int): Seed of the random generator.
+    vocabulary_size (int): Number of distinct words to draw from (Zipf distributed).
+    """
+
+    def __init__(self, seed=0, vocabulary_size=20_000):
+        self.rng = random.Random(seed)
+        self.vocabulary = [self._word() for _ in range(vocabulary_size)]
+        # Zipf-like weights so that frequent words dominate like in real text
+        self.cum_weights = []
+        total = 0.0
+        for rank in range(1, vocabulary_size + 1):
+            total += 1.0 / rank
+            self.cum_weights.append(total)
+
+    def _syllable(self):
+        rng = self.rng
+        root = rng.choice(CONSONANTS)
+        superscript = rng.choice(SUPERSCRIPTS)
+        if superscript:
+            # Write the root as a subjoined letter below the superscript
+            root = superscript + chr(ord(root) + 0x50)
+        return (
+            rng.choice(PREFIXES)
+            + root
+            + rng.choice(SUBSCRIPTS)
+            + rng.choice(VOWELS)
+            + rng.choice(SUFFIXES)
+        )
+
+    def _word(self):
+        syllables = [self._syllable() for _ in range(self.rng.choice([1, 1, 2, 2, 3]))]
+        return TSHEG.join(syllables) + TSHEG
+
+    def words(self, count):
+        return self.rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=count)
+
+    def sentence(self, min_words=3, max_words=25):
+        words = self.words(self.rng.randint(min_words, max_words))
+        words.append(SHAD)
+        return words
+
+
+def _write_until(file_path, size_bytes, produce, encoding="utf-8"):
+    """Calls produce() for text blocks until the file reaches size_bytes."""
+    written = 0
+    with open(file_path, "w", encoding=encoding, newline="\n") as f:
+        while written < size_bytes:
+            block = produce()
+            f.write(block)
+            written += len(block.encode(encoding))
+    return file_path
+
+
+def generate_segpos(file_path, size_bytes, seed=0, line_markers=False):
+    """
+    Writes a SegPos file: space-separated words, '<utt>' after each sentence and a page
+    marker every few sentences. With line_markers, 'lnN' markers are added like in the
+    eKangyur/eTengyur files.
+    """
+    text = SyntheticTibetan(seed)
+    state = {"page": 0, "line": 0}
+
+    def produce():
+        state["page"] += 1
+        lines = [f"p{state['page']}"]
+        for _ in range(text.rng.randint(5, 15)):
+            words = text.sentence()
+            if line_markers:
+                state["line"] += 1
+                words.insert(0, f"ln{state['line']}")
+            lines.append(" ".join(words) + " <utt>")
+        return "\n".join(lines) + "\n"
+
+    return _write_until(file_path, size_bytes, produce)
+
+
+def generate_conllu(file_path, size_bytes, seed=0):
+    """Writes a CoNLL-U file with '# text' metadata and one token line per word."""
+    text = SyntheticTibetan(seed)
+    state = {"sentence": 0}
+
+    def produce():
+        state["sentence"] += 1
+        words = text.sentence()
+        lines = [
+            f"# sent_id = synthetic:{state['sentence']}",
+            f"# text = {''.join(words)}",
+        ]
+        for index, word in enumerate(words, 1):
+            lines.append(f"{index}\t{word}\t{word}\tNOUN\t_\t_\t0\troot\t_\t_")
+        return "\n".join(lines) + "\n\n"
+
+    return _write_until(file_path, size_bytes, produce)
+
+
+def generate_evaluation(file_path, size_bytes, seed=0):
+    """Writes a UTF-16 evaluation file with one '/'-delimited segmented sentence per line."""
+    text = SyntheticTibetan(seed)
+
+    def produce():
+        return "\n".join("/".join(text.sentence()) for _ in range(100)) + "\n"
+
+    return _write_until(file_path, size_bytes, produce, encoding="utf-16")
+
+
+def generate_manual(file_path, size_bytes, seed=0, invalid_ratio=0.02):
+    """Writes a JSON Lines file of source/target pairs, a few of them deliberately invalid."""
+    text = SyntheticTibetan(seed)
+
+    def produce():
+        lines = []
+        for _ in range(100):
+            words = text.sentence()
+            source = "".join(words)
+            if text.rng.random() < invalid_ratio:
+                source = source[:-2]
+            record = {"source": source, "target": " ".join(words)}
+            lines.append(json.dumps(record, ensure_ascii=False))
+        return "\n".join(lines) + "\n"
+
+    return _write_until(file_path, size_bytes, produce)
+
+
+def generate_corpus(output_dir, size_bytes, seed=0, files_per_source=4):
+    """
+    Generates a complete input tree like data/input, with each source split over
+    files_per_source files totalling about size_bytes per source.
+
+    Returns:
+    dict: The input folder (or file) of each source.
+    """
+    file_size = max(1, size_bytes // files_per_source)
+    layout = {
+        "SegPos": os.path.join(output_dir, "SegPos"),
+        "SegPos-eKangyur-eTengyur": os.path.join(
+            output_dir, "SegPos-eKangyur-eTengyur"
+        ),
+        "Conllu": os.path.join(output_dir, "Conllu"),
+        "Tibetan": os.path.join(output_dir, "Tibetan"),
+        "Manual-dataset": os.path.join(
+            output_dir, "Manual-dataset", "manual_data.json"
+        ),
+    }
+    for index in range(files_per_source):
+        file_seed = seed * 1000 + index
+        volume = os.path.join(layout["SegPos"], f"volume{index:03d}")
+        os.makedirs(volume, exist_ok=True)
+        generate_segpos(os.path.join(volume, "text.txt"), file_size, file_seed)
+
+        volume = os.path.join(layout["SegPos-eKangyur-eTengyur"], f"volume{index:03d}")
+        os.makedirs(volume, exist_ok=True)
+        generate_segpos(
+            os.path.join(volume, "text.txt"), file_size, file_seed, line_markers=True
+        )
+
+        os.makedirs(layout["Conllu"], exist_ok=True)
+        generate_conllu(
+            os.path.join(layout["Conllu"], f"text{index:03d}.conllu"),
+            file_size,
+            file_seed,
+        )
+
+        os.makedirs(layout["Tibetan"], exist_ok=True)
+        generate_evaluation(
+            os.path.join(layout["Tibetan"], f"text{index:03d}.txt"),
+            file_size,
+            file_seed,
+        )
+
+    os.makedirs(os.path.dirname(layout["Manual-dataset"]), exist_ok=True)
+    generate_manual(layout["Manual-dataset"], size_bytes, seed)
+    return layout
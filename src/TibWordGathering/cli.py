@@ -0,0 +1,72 @@
+import argparse
+import json
+import sys
+
+from TibWordGathering.metrics import disable_metrics, enable_metrics
+from TibWordGathering.pipeline import DEFAULT_CONFIG, load_config, run_pipeline
+
+
+def main(argv=None):
+    """Entry point of the 'tibwords' command."""
+    parser = argparse.ArgumentParser(
+        prog="tibwords",
+        description="Gather Tibetan word segmentation data from every source, then combine, "
+        "deduplicate and export it.",
+    )
+    parser.add_argument(
+        "-c", "--config", help="JSON config file (default: the built-in data/ layout)"
+    )
+    parser.add_argument(
+        "--stages", nargs="+", help="only run these stages, e.g. segpos combine"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="run stages even if they are up to date"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only print which stages would run"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="worker processes per source (default: CPUs / sources)",
+    )
+    parser.add_argument(
+        "--metrics-json", help="write a JSON metrics report to this file"
+    )
+    parser.add_argument(
+        "--metrics-prom", help="write Prometheus text metrics to this file"
+    )
+    parser.add_argument(
+        "--print-config",
+        action="store_true",
+        help="print the default config and exit",
+    )
+    args = parser.parse_args(argv)
+
+    if args.print_config:
+        json.dump(DEFAULT_CONFIG, sys.stdout, indent=2)
+        print()
+        return 0
+
+    config = load_config(args.config)
+    metrics = enable_metrics() if args.metrics_json or args.metrics_prom else None
+    try:
+        status = run_pipeline(
+            config,
+            stages=args.stages,
+            force=args.force,
+            dry_run=args.dry_run,
+            workers=args.workers,
+        )
+    finally:
+        disable_metrics()
+    if metrics is not None:
+        if args.metrics_json:
+            metrics.write_json(args.metrics_json)
+        if args.metrics_prom:
+            metrics.write_prometheus(args.metrics_prom)
+    return 1 if "failed" in status.values() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+JSON encoding and decoding for every reader and writer of the package.
+
+The fastest available backend is used: orjson, then msgspec, then the standard library.
+The TIBWORDS_JSON environment variable ('orjson', 'msgspec' or 'json') forces one. Every
+backend writes the same compact UTF-8 output, so files do not depend on which one is installed.
+"""
+import json
+import os
+
+BACKENDS = ["orjson", "msgspec", "json"]
+RECORD_FIELDS = ["source", "target", "filename"]
+
+
+def _orjson():
+    import orjson
+
+    def dumps(obj, indent=False):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+
+    return dumps, orjson.loads
+
+
+def _msgspec():
+    import msgspec
+
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+
+    def dumps(obj, indent=False):
+        data = encoder.encode(obj)
+        return msgspec.json.format(data, indent=2) if indent else data
+
+    def loads(data):
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+
+    return dumps, loads
+
+
+def _json():
+    def dumps(obj, indent=False):
+        if indent:
+            return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode(
+            "utf-8"
+        )
+
+    return dumps, json.loads
+
+
+_LOADERS = {"orjson": _orjson, "msgspec": _msgspec, "json": _json}
+# The standard library until use_backend() picks the fastest backend installed
+_dumps, _loads = _json()
+
+
+def use_backend(name=None):
+    """
+    Selects the JSON backend: one of BACKENDS, or None for the fastest one installed.
+    Returns the name of the selected backend.
+    """
+    global backend, _dumps, _loads
+    if name is not None:
+        if name not in _LOADERS:
+            raise ValueError(f"Unknown JSON backend: {name}")
+        candidates = [name]
+    else:
+        candidates = BACKENDS
+    for candidate in candidates:
+        try:
+            _dumps, _loads = _LOADERS[candidate]()
+        except ImportError:
+            if name is not None:
+                raise
+            continue
+        backend = candidate
+        return backend
+
+
+def dumps(obj, indent=False):
+    """Encodes obj as UTF-8 JSON bytes, compact unless indent is True (2 spaces)."""
+    return _dumps(obj, indent)
+
+
+def loads(data):
+    """Decodes JSON from bytes or str. Raises ValueError on invalid JSON."""
+    return _loads(data)
+
+
+def decode_record(data):
+    """
+    Decodes one record, checking that it is an object whose 'source', 'target' and
+    'filename', when present, are strings. Raises ValueError otherwise.
+    """
+    record = _loads(data)
+    if not isinstance(record, dict):
+        raise ValueError("a record must be a JSON object")
+    for field in RECORD_FIELDS:
+        value = record.get(field)
+        if value is not None and value.__class__ is not str:
+            raise ValueError(f"the '{field}' of a record must be a string")
+    return record
+
+
+backend = None
+use_backend(os.environ.get("TIBWORDS_JSON") or None)
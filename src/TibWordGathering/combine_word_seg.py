@@ -1,46 +1,70 @@
-import json
 import os
 
+from TibWordGathering.metrics import stage
+from TibWordGathering.utils import RecordWriter, is_json_records_path, iter_records
 
-def combine_json_files(file_paths, output_file):
-    """_summary_
+
+def corpus_name(file_path):
+    """Returns the name of the corpus a file belongs to, i.e. the name of its folder."""
+    return os.path.basename(os.path.dirname(os.path.abspath(file_path)))
+
+
+def combine_json_files(file_paths, output_file, tag_source=False, index=False):
+    """
+    Streams the records of several JSON or JSON Lines files into one output file, without
+    loading any of them fully into memory. The output format follows the output file name
+    (see utils.RecordWriter).
 
     Args:
-        file_paths (_type_): _description_
-        output_file (_type_): _description_
+        file_paths (list): The files to combine, in order. Files that are not '.json' or
+            '.jsonl' files (optionally compressed) are skipped.
+        output_file (str): The file where the combined data will be saved.
+        tag_source (bool): Add a 'corpus' field with the name of the source corpus
+            (the folder of the source file) to every record.
+        index (bool): Also write a sidecar index of the output, so that single records or
+            the records of one 'filename' can be read without loading the whole file
+            (see record_index.RecordIndex).
+
+    Returns:
+        dict: The number of records read from each source file.
     """
-    combined_data = []
-
-    # Iterate through each file path
-    for file_path in file_paths:
-        if file_path.endswith(".json"):  # Check if the file is a JSON file
-            # Open and read the JSON file
-            with open(file_path, encoding="utf-8") as file:
-                data = json.load(file)
-
-                # Append data to the combined list
-                combined_data.extend(data)
-
-    # Save the combined data to the output file
-    with open(output_file, "w", encoding="utf-8") as output:
-        json.dump(combined_data, output, ensure_ascii=False, indent=2)
-
-    print(f"Combined {len(combined_data)} records into {output_file}")
-
-
-# Usage example:
-file_paths = [
-    "data/output/conllu_tib_words/conllu_valid_data.json",
-    "data/output/segpos_ekangyur_eTengyur_tib_word/segpos_ekangyur_eTengyur_tib_word_valid_data.json",
-    "data/output/segpos_tib_word/segpos_tib_word_valid_data.json",
-    "data/output/evaluate_tib_word/evaluate_valid_data.json",
-    "data/output/Manual-dataset/manual_data_valid_data.json"
-    # Add as many file paths as you need
-]
-
-output_file = "data/output/combined_word_seg_data/combined_word_seg_data.json"  # noqa  # The file where combined data will be saved
-output_dir = os.path.dirname(output_file)
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
-    print(f"Created directory {output_dir}")
-combine_json_files(file_paths, output_file)
+    counts = {}
+    with RecordWriter(output_file, index=index) as writer:
+        # Iterate through each file path
+        for file_path in file_paths:
+            if not is_json_records_path(file_path):  # Check if the file is a JSON file
+                continue
+            corpus = corpus_name(file_path)
+            count = 0
+            with stage("combine", file_path) as entry:
+                for record in iter_records(file_path):
+                    if tag_source:
+                        record["corpus"] = corpus
+                    writer.write(record)
+                    count += 1
+                entry.records_in = entry.records_out = count
+                entry.bytes_read = os.path.getsize(file_path)
+            counts[str(file_path)] = count
+            print(f"Read {count} records from {file_path}")
+
+    print(f"Combined {writer.count} records into {output_file}")
+    return counts
+
+
+if __name__ == "__main__":
+    # Usage example:
+    file_paths = [
+        "data/output/conllu_tib_words/conllu_valid_data.json",
+        "data/output/segpos_ekangyur_eTengyur_tib_word/segpos_ekangyur_eTengyur_tib_word_valid_data.json",
+        "data/output/segpos_tib_word/segpos_tib_word_valid_data.json",
+        "data/output/evaluate_tib_word/evaluate_valid_data.json",
+        "data/output/Manual-dataset/manual_data_valid_data.json"
+        # Add as many file paths as you need
+    ]
+
+    output_file = "data/output/combined_word_seg_data/combined_word_seg_data.json"  # noqa  # The file where combined data will be saved
+    output_dir = os.path.dirname(output_file)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        print(f"Created directory {output_dir}")
+    combine_json_files(file_paths, output_file)
@@ -1,51 +1,140 @@
+import io
 import os
+from collections import Counter
 from pathlib import Path
+from typing import List, Optional, TextIO
 
-import conllu
+from TibWordGathering.metrics import current_stage
+from TibWordGathering.parallel import process_files
+from TibWordGathering.utils import list_folder_files, partition_data_points
 
-from TibWordGathering.utils import is_valid_data_point, save_json
 
+def _data_point(source_text, forms, file_path):
+    return {
+        "source": source_text,
+        "target": " ".join(forms).strip(),
+        "filename": os.path.basename(file_path),
+    }
 
-def process_conllu_file(file_path):
-    valid_data = []
-    invalid_data = []  # List to store invalid data
-    current_data = {"source": "", "target": "", "filename": ""}
-
-    # Open and read the conllu file
-    with open(file_path, encoding="utf-8") as file:
-        # Parse the file using conllu library
-        sentences = conllu.parse(file.read(), fields=["id", "form"])
-
-    # Extract the source text from the metadata
-    for sentence in sentences:
-        # Get the source from the metadata (e.g., # text = ...)
-        try:
-            target_text = ""
-            if "text" in sentence.metadata:
-                source_text = sentence.metadata["text"]
-
-            # Extract the target text from the first column (the token)
-            for token in sentence:
-                target_text += token.get("form", "") + " "
-            target_text = target_text.strip()
-
-            # Add filename and append to the respective list
-            current_data = {
-                "source": source_text,
-                "target": target_text,
-                "filename": os.path.basename(file_path),
-            }
-            if is_valid_data_point(current_data):
-                valid_data.append(current_data)
-            else:
-                invalid_data.append(current_data)  # Append invalid data
-        except Exception as e:
-            print(f"Error parsing file {file_path}: {e}")
+
+def _iter_lean_sentences(file):
+    """
+    Yields (first line number, '# text' value or None, token forms or None) for each
+    sentence of a CoNLL-U file, reading one line at a time. Only the 'text' comment and
+    the FORM column are looked at, so no Token dicts are built. forms is None when a
+    token line has no FORM column.
+    """
+    start = None
+    source_text = None
+    forms: Optional[List[str]] = []
+    for line_number, line in enumerate(file, 1):
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            if start is not None:
+                yield start, source_text, forms
+            start = None
+            source_text = None
+            forms = []
+            continue
+        if start is None:
+            start = line_number
+        if line.startswith("#"):
+            key, sep, value = line[1:].partition("=")
+            if sep and key.strip() == "text":
+                source_text = value.strip()
             continue
-    return valid_data, invalid_data  # Return both valid and invalid data
+        if forms is None:
+            continue
+        columns = line.split("\t", 2)
+        if len(columns) < 2:
+            forms = None
+            continue
+        forms.append(columns[1])
+    if start is not None:
+        yield start, source_text, forms
+
+
+def iter_conllu_file(file_path, lean=True, errors=None, data=None):
+    """
+    Parses a CoNLL-U file one sentence at a time and yields one data point per sentence.
+    'source' is taken from the '# text' metadata and 'target' is the token forms
+    separated by spaces.
 
+    Sentences without a '# text' comment or with malformed token lines are skipped and
+    counted by reason; the counts are printed once the file is done, and their total is
+    added to the 'skipped' counter of the stage being measured, if any (see
+    metrics.current_stage).
 
-def process_conllu_folder(folder_path, valid_output_file, invalid_output_file):
+    Parameters:
+    file_path (str): The path to the CoNLL-U file.
+    lean (bool): Read only the '# text' comment and the FORM column line by line. With
+        lean=False, sentences are parsed with conllu.parse_incr.
+    errors (Counter): If given, the number of skipped sentences per reason is added to it.
+    data (bytes): The content of the file, if it was already read (see prefetch).
+    """
+    skipped: "Counter[str]" = Counter()
+    file: TextIO
+    if data is not None:
+        file = io.StringIO(data.decode("utf-8"))
+    else:
+        file = open(file_path, encoding="utf-8")
+    with file:
+        if lean:
+            for line_number, source_text, forms in _iter_lean_sentences(file):
+                if forms is None:
+                    skipped["malformed token line"] += 1
+                elif source_text is None:
+                    skipped["missing '# text'"] += 1
+                else:
+                    yield _data_point(source_text, forms, file_path)
+        else:
+            import conllu
+            from conllu.exceptions import ParseException
+
+            sentences = conllu.parse_incr(file, fields=["id", "form"])
+            while True:
+                try:
+                    sentence = next(sentences)
+                except StopIteration:
+                    break
+                except ParseException as e:
+                    # parse_incr cannot resume after a parse error
+                    print(f"Error parsing file {file_path}: {e}")
+                    skipped["parse error"] += 1
+                    break
+                if "text" not in sentence.metadata:
+                    skipped["missing '# text'"] += 1
+                    continue
+                forms = [token.get("form", "") for token in sentence]
+                yield _data_point(sentence.metadata["text"], forms, file_path)
+
+    if skipped:
+        reasons = ", ".join(f"{count} {reason}" for reason, count in skipped.items())
+        print(f"Skipped {sum(skipped.values())} sentences in {file_path}: {reasons}")
+        if errors is not None:
+            errors.update(skipped)
+        entry = current_stage()
+        if entry is not None:
+            entry.skipped += sum(skipped.values())
+
+
+def process_conllu_file(file_path):
+    # Return both valid and invalid data
+    return partition_data_points(iter_conllu_file(file_path))
+
+
+def process_conllu_folder(
+    folder_path,
+    valid_output_file,
+    invalid_output_file,
+    workers=None,
+    chunksize=1,
+    cache_dir=None,
+    omit_source=False,
+    normalizer=None,
+    diagnostics=False,
+    prefetch=0,
+):
     """
     Processes all CoNLL-U files in the given folder and saves the results to separate JSON files for valid and invalid data.
 
@@ -53,24 +142,36 @@ def process_conllu_folder(folder_path, valid_output_file, invalid_output_file):
     folder_path (str): The path to the folder containing CoNLL-U files.
     valid_output_file (str): The path to the output JSON file where valid data will be saved.
     invalid_output_file (str): The path to the output JSON file where invalid data will be saved.
+    workers (int): Number of worker processes. None uses one per CPU core, 1 runs in-process.
+    chunksize (int): Number of files handed to a worker process at a time.
+    cache_dir (str): Folder where per-file results and a manifest are kept, so that a rerun
+        only processes new or changed files.
+    omit_source (bool): Write valid records without their 'source', which the readers in
+        utils derive from the target.
+    normalizer (Normalizer): Normalizes the source and target of every data point.
+    diagnostics (bool): Write why each invalid data point is invalid, and an error report.
+    prefetch (int): Number of threads reading files ahead of the parser (0: none).
+
+    Output paths ending in '.jsonl' (optionally '.jsonl.gz' or '.jsonl.zst') are written as JSON Lines.
+
+    Returns:
+    tuple: The number of valid and invalid data points written.
     """  # noqa
-    combined_valid_data = []
-    combined_invalid_data = []
-
-    # Process each CoNLL-U file in the folder
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".conllu"):
-            file_path = os.path.join(folder_path, filename)
-
-            valid_data, invalid_data = process_conllu_file(file_path)
-            combined_valid_data.extend(valid_data)
-            combined_invalid_data.extend(invalid_data)
-
-    # Save the valid data into one JSON file
-    save_json(combined_valid_data, valid_output_file)
-
-    # Save the invalid data into another JSON file
-    save_json(combined_invalid_data, invalid_output_file)
+    file_paths = list_folder_files(folder_path, ".conllu")
+    return process_files(
+        iter_conllu_file,
+        file_paths,
+        valid_output_file,
+        invalid_output_file,
+        workers=workers,
+        chunksize=chunksize,
+        cache_dir=cache_dir,
+        lazy_invalid=False,
+        omit_source=omit_source,
+        normalizer=normalizer,
+        diagnostics=diagnostics,
+        prefetch=prefetch,
+    )
 
 
 if __name__ == "__main__":
@@ -88,5 +189,8 @@ if __name__ == "__main__":
 
     # Process all .conllu files and save valid/invalid data to separate JSON files
     process_conllu_folder(
-        conllu_file_dir, valid_output_file_path, invalid_output_file_path
+        conllu_file_dir,
+        valid_output_file_path,
+        invalid_output_file_path,
+        cache_dir="./data/cache/conllu_tib_words",
     )
@@ -0,0 +1,131 @@
+import codecs
+import io
+import os
+import shutil
+
+from TibWordGathering import codec
+from TibWordGathering.utils import open_binary
+
+# UTF-32 LE must come before UTF-16 LE, whose BOM it starts with
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+SAMPLE_SIZE = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+TIBETAN_BLOCK = 0x0F  # high byte of the Tibetan Unicode block U+0F00-U+0FFF
+QUARANTINE_LOG = "quarantine.jsonl"
+
+
+def detect_encoding(sample):
+    """
+    Guesses the encoding of a file from its first bytes: a byte order mark if there is one,
+    else UTF-16 when most characters have a high byte of 0x00 (ASCII) or 0x0F (Tibetan)
+    in the same position of every byte pair, else UTF-8 if the sample decodes as UTF-8.
+
+    Parameters:
+    sample (bytes): The first bytes of the file.
+
+    Returns:
+    str: The name of the encoding, or None if the sample is neither UTF-8 nor UTF-16.
+    """
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    sample = sample[: len(sample) - len(sample) % 2]
+    low, high = sample[0::2], sample[1::2]
+    # Text in UTF-8 has no 0x00 bytes, and 0x0F only for the unused control character SI
+    low_score = low.count(0) + low.count(TIBETAN_BLOCK)
+    high_score = high.count(0) + high.count(TIBETAN_BLOCK)
+    if max(low_score, high_score) > len(high) // 2:
+        encoding = "utf-16-le" if high_score > low_score else "utf-16-be"
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample)
+            return encoding
+        except UnicodeDecodeError:
+            return None
+    try:
+        # Not final: the sample may end in the middle of a character
+        codecs.getincrementaldecoder("utf-8")().decode(sample)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return None
+
+
+def _read_start(f, encoding, chunk_size):
+    # Reads the first chunk and detects the encoding from it if it is not given
+    data = f.read(chunk_size)
+    if encoding is None:
+        encoding = detect_encoding(data[:SAMPLE_SIZE])
+        if encoding is None:
+            raise UnicodeError("cannot detect the encoding")
+    return encoding, data
+
+
+def check_decoding(file_path, encoding=None, chunk_size=CHUNK_SIZE, data=None):
+    """
+    Decodes a whole text file chunk by chunk without keeping the text, to find out
+    whether it can be read before any of its lines are used.
+
+    Parameters: see iter_lines.
+
+    Returns:
+    str: The encoding of the file, detected if it was not given.
+
+    Raises:
+    UnicodeError: If the encoding cannot be detected or the file does not decode.
+    """
+    with io.BytesIO(data) if data is not None else open_binary(file_path) as f:
+        encoding, data = _read_start(f, encoding, chunk_size)
+        decoder = codecs.getincrementaldecoder(encoding)()
+        while data:
+            decoder.decode(data)
+            data = f.read(chunk_size)
+        decoder.decode(b"", final=True)
+    return encoding
+
+
+def iter_lines(file_path, encoding=None, chunk_size=CHUNK_SIZE, data=None):
+    """
+    Yields the lines of a text file, decoded chunk by chunk with an incremental decoder so
+    that a large file is never held in memory. Lines are split on '\\n' only and lose it;
+    a '\\r' before it is kept.
+
+    Parameters:
+    file_path (str): The file to read ('.gz' and '.zst' files are decompressed).
+    encoding (str): The encoding of the file, or None to detect it (see detect_encoding).
+    chunk_size (int): Number of bytes decoded at a time.
+    data (bytes): The content of the file, if it was already read; the file is then not opened.
+
+    Raises:
+    UnicodeError: If the encoding cannot be detected or the file does not decode.
+    """
+    with io.BytesIO(data) if data is not None else open_binary(file_path) as f:
+        encoding, data = _read_start(f, encoding, chunk_size)
+        decoder = codecs.getincrementaldecoder(encoding)()
+        rest = ""
+        while data:
+            lines = (rest + decoder.decode(data)).split("\n")
+            rest = lines.pop()
+            yield from lines
+            data = f.read(chunk_size)
+        lines = (rest + decoder.decode(b"", final=True)).split("\n")
+        if not lines[-1]:
+            lines.pop()
+        yield from lines
+
+
+def quarantine_file(file_path, quarantine_dir, error):
+    """
+    Copies a file that could not be read into quarantine_dir and appends the reason to
+    the quarantine.jsonl log in that folder. The input file itself is left in place.
+    """
+    os.makedirs(quarantine_dir, exist_ok=True)
+    shutil.copy2(file_path, os.path.join(quarantine_dir, os.path.basename(file_path)))
+    entry = {"file": str(file_path), "error": str(error)}
+    # One short write in append mode, so workers can share the log
+    with open(os.path.join(quarantine_dir, QUARANTINE_LOG), "ab") as f:
+        f.write(codec.dumps(entry) + b"\n")
@@ -0,0 +1,312 @@
+import hashlib
+import heapq
+import os
+import random
+import tempfile
+from array import array
+from typing import List, Optional
+
+from TibWordGathering.metrics import stage
+from TibWordGathering.normalization import Normalizer
+from TibWordGathering.utils import RecordWriter, iter_records
+
+# Rough memory used by one entry of a Python set of 64-bit hashes (int object + slot)
+SET_ENTRY_BYTES = 80
+# Bits of a merged sort key that hold the record index (up to ~1 trillion records)
+INDEX_BITS = 40
+TSHEG = "་"
+# Prime modulus of the MinHash permutations (a * h + b) % MERSENNE_PRIME of 32-bit hashes
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+SOURCE_NORMALIZER = Normalizer()
+
+
+def normalize_source(text):
+    """
+    Returns the text normalized like the output of the extractors (see
+    normalization.Normalizer) and without any whitespace, which is how duplicates are
+    compared: the NFC and NFD forms of a text are the same source.
+    """
+    return "".join(SOURCE_NORMALIZER.normalize(text).split())
+
+
+def source_hash(text):
+    """Returns a 64-bit hash of the normalized text."""
+    digest = hashlib.blake2b(
+        normalize_source(text).encode("utf-8"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _write_run(keys, tmp_dir):
+    # keys are (hash << INDEX_BITS) | index; stored as sorted (hash, index) pairs of uint64
+    keys.sort()
+    index_mask = (1 << INDEX_BITS) - 1
+    pairs = array("Q")
+    for key in keys:
+        pairs.append(key >> INDEX_BITS)
+        pairs.append(key & index_mask)
+    fd, path = tempfile.mkstemp(suffix=".run", dir=tmp_dir)
+    with os.fdopen(fd, "wb") as f:
+        pairs.tofile(f)
+    return path
+
+
+def _read_run(path, block_pairs=1 << 16):
+    with open(path, "rb") as f:
+        while True:
+            block = array("Q", f.read(block_pairs * 16))
+            if not block:
+                return
+            for i in range(0, len(block), 2):
+                yield (block[i] << INDEX_BITS) | block[i + 1]
+
+
+def _write_indices(indices, tmp_dir):
+    # indices are sorted record indices, stored as uint64
+    fd, path = tempfile.mkstemp(suffix=".dup", dir=tmp_dir)
+    with os.fdopen(fd, "wb") as f:
+        indices.tofile(f)
+    return path
+
+
+def _read_indices(path, block_size=1 << 16):
+    with open(path, "rb") as f:
+        while True:
+            block = array("Q", f.read(block_size * 8))
+            if not block:
+                return
+            yield from block
+
+
+def find_exact_duplicates(records, memory_budget_mb=512, tmp_dir=None):
+    """
+    Yields, in increasing order, the indices of the records whose normalized 'source' was
+    already seen in an earlier record.
+
+    Hashes are kept in a set while they fit in memory_budget_mb. Past that, (hash, index)
+    keys are sorted in runs that are spilled to disk and merged. The duplicate indices are
+    spilled too, in sorted runs of the same size, so the memory used stays bounded whatever
+    the size of the corpus and the number of duplicates. Records are all hashed before the
+    first index is yielded, and the spilled runs are deleted once the indices are consumed.
+    """
+    max_entries = max(1, memory_budget_mb * 1024 * 1024 // SET_ENTRY_BYTES)
+    index_mask = (1 << INDEX_BITS) - 1
+    seen = set()
+    duplicates = array("Q")
+    keys: Optional[List[int]] = None  # sorted runs on disk once the set is full
+    runs = []
+    duplicate_runs = []
+    try:
+        for index, record in enumerate(records):
+            hash_value = source_hash(record["source"])
+            if keys is None:
+                if hash_value in seen:
+                    # Found in record order: the runs of these indices are already sorted
+                    duplicates.append(index)
+                    if len(duplicates) >= max_entries:
+                        duplicate_runs.append(_write_indices(duplicates, tmp_dir))
+                        duplicates = array("Q")
+                    continue
+                seen.add(hash_value)
+                if len(seen) < max_entries:
+                    continue
+                # The set is full: spill it as a first sorted run, with index 0 since these
+                # are all first occurrences, and sort every later record externally
+                runs.append(
+                    _write_run([value << INDEX_BITS for value in seen], tmp_dir)
+                )
+                seen = set()
+                keys = []
+                continue
+            keys.append((hash_value << INDEX_BITS) | index)
+            if len(keys) >= max_entries:
+                runs.append(_write_run(keys, tmp_dir))
+                keys = []
+        if keys:
+            runs.append(_write_run(keys, tmp_dir))
+
+        if not runs:
+            # Every index was found in record order
+            for path in duplicate_runs:
+                yield from _read_indices(path)
+            yield from duplicates
+            return
+
+        # Merging finds the indices in hash order: sort them in bounded runs
+        previous_hash = None
+        for key in heapq.merge(*(_read_run(path) for path in runs)):
+            hash_value = key >> INDEX_BITS
+            if hash_value == previous_hash:
+                duplicates.append(key & index_mask)
+                if len(duplicates) >= max_entries:
+                    duplicates = array("Q", sorted(duplicates))
+                    duplicate_runs.append(_write_indices(duplicates, tmp_dir))
+                    duplicates = array("Q")
+            previous_hash = hash_value
+        duplicates = array("Q", sorted(duplicates))
+        yield from heapq.merge(
+            *(_read_indices(path) for path in duplicate_runs), duplicates
+        )
+    finally:
+        for path in runs + duplicate_runs:
+            os.remove(path)
+
+
+class MinHashLSH:
+    """
+    Near-duplicate detector based on MinHash signatures of syllable shingles and
+    locality-sensitive hashing.
+
+    A record is a near duplicate when it shares at least one LSH band with an earlier
+    record and the estimated Jaccard similarity of their shingle sets is at least threshold.
+    Signatures of kept records are held in memory (4 bytes per permutation per record).
+
+    Parameters:
+    threshold (float): The minimum estimated Jaccard similarity of near duplicates.
+    num_perm (int): Number of MinHash permutations.
+    bands (int): Number of LSH bands; num_perm must be divisible by it.
+    shingle_size (int): Number of syllables per shingle.
+    seed (int): Seed of the permutations.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=16, shingle_size=3, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        # Random linear permutations: min-wise independent enough for MinHash, unlike
+        # XOR masks of a single hash, whose minima are strongly correlated across masks
+        rng = random.Random(seed)
+        self.permutations = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        self.buckets = {}
+        self.signatures = []
+
+    def shingles(self, text):
+        syllables = [s for s in normalize_source(text).split(TSHEG) if s]
+        size = self.shingle_size
+        if len(syllables) <= size:
+            return {TSHEG.join(syllables)}
+        return {
+            TSHEG.join(syllables[i : i + size])  # noqa: E203
+            for i in range(len(syllables) - size + 1)
+        }
+
+    def signature(self, text):
+        hashes = [
+            int.from_bytes(
+                hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(),
+                "little",
+            )
+            for shingle in self.shingles(text)
+        ]
+        return array(
+            "I",
+            [
+                min([((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes])
+                for a, b in self.permutations
+            ],
+        )
+
+    def similarity(self, signature, other):
+        return sum(a == b for a, b in zip(signature, other)) / self.num_perm
+
+    def is_duplicate(self, text):
+        """
+        Returns True if text is a near duplicate of an earlier text, otherwise indexes it
+        and returns False.
+        """
+        signature = self.signature(text)
+        data = signature.tobytes()
+        width = self.rows * 4
+        band_keys = [
+            (band, data[band * width : (band + 1) * width])  # noqa: E203
+            for band in range(self.bands)
+        ]
+        checked = set()
+        for key in band_keys:
+            candidate = self.buckets.get(key)
+            if candidate is None or candidate in checked:
+                continue
+            checked.add(candidate)
+            if self.similarity(signature, self.signatures[candidate]) >= self.threshold:
+                return True
+        record_id = len(self.signatures)
+        self.signatures.append(signature)
+        for key in band_keys:
+            self.buckets.setdefault(key, record_id)
+        return False
+
+
+def deduplicate(
+    input_file,
+    output_file,
+    memory_budget_mb=512,
+    near_duplicates=False,
+    threshold=0.8,
+    num_perm=64,
+    bands=16,
+    tmp_dir=None,
+):
+    """
+    Removes duplicate records from a JSON or JSON Lines file, keeping the first occurrence.
+
+    Exact duplicates are records with the same 'source' once whitespace is removed. With
+    near_duplicates, records whose source is similar to an earlier kept record (MinHash/LSH
+    over syllable shingles) are removed as well.
+
+    Parameters:
+    input_file (str): The combined dataset.
+    output_file (str): Where the deduplicated dataset will be saved.
+    memory_budget_mb (int): Memory allowed for the exact-duplicate hashes before spilling
+        sorted hashes to disk.
+    near_duplicates (bool): Also remove near duplicates.
+    threshold (float): Minimum estimated Jaccard similarity of near duplicates.
+    num_perm (int): Number of MinHash permutations.
+    bands (int): Number of LSH bands.
+    tmp_dir (str): Folder for the spilled hash runs (default: the system temp folder).
+
+    Returns:
+    dict: The number of records read, exact and near duplicates removed, and records kept.
+    """
+    with stage("dedup", input_file) as entry:
+        duplicates = find_exact_duplicates(
+            iter_records(input_file), memory_budget_mb, tmp_dir
+        )
+        lsh = MinHashLSH(threshold, num_perm, bands) if near_duplicates else None
+
+        stats = {"records": 0, "exact_duplicates": 0, "near_duplicates": 0}
+        duplicate = next(duplicates, None)
+        with RecordWriter(output_file) as writer:
+            for index, record in enumerate(iter_records(input_file)):
+                stats["records"] += 1
+                if index == duplicate:
+                    stats["exact_duplicates"] += 1
+                    duplicate = next(duplicates, None)
+                    continue
+                if lsh is not None and lsh.is_duplicate(record["source"]):
+                    stats["near_duplicates"] += 1
+                    continue
+                writer.write(record)
+        entry.records_in = stats["records"]
+        entry.records_out = writer.count
+        entry.bytes_read = os.path.getsize(input_file)
+    stats["kept"] = writer.count
+    print(
+        f"Kept {stats['kept']} of {stats['records']} records "
+        f"({stats['exact_duplicates']} exact and {stats['near_duplicates']} near duplicates removed)"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    deduplicate(
+        "data/output/combined_word_seg_data/combined_word_seg_data.json",
+        "data/output/combined_word_seg_data/deduplicated_word_seg_data.json",
+    )
@@ -1,45 +1,105 @@
 import os
+from functools import partial
 from pathlib import Path
 
-from TibWordGathering.utils import is_valid_data_point, save_json
+from TibWordGathering.decoding import check_decoding, iter_lines, quarantine_file
+from TibWordGathering.parallel import process_files
+from TibWordGathering.utils import list_folder_files, partition_data_points
 
 
-def read_and_process_tibetan_data(file_path, encoding="utf-16"):
+def iter_tibetan_data(file_path, encoding=None, quarantine_dir=None, data=None):
     """
-    Reads the Tibetan labeled data file, processes each line, and returns a list of dictionaries.
+    Reads the Tibetan labeled data file line by line and yields one dictionary per non-empty line.
     Each dictionary contains 'source', 'target', and 'filename' keys, where 'source' is the original sentence text,
     'target' is the tokenized words separated by spaces, and 'filename' is the name of the processed file.
-    """
-    with open(file_path, encoding=encoding) as file:
-        lines = file.readlines()
-
-    # Prepare the lists for valid and invalid data
-    valid_data = []
-    invalid_data = []
 
+    The encoding is detected from the file when it is not given (see decoding.detect_encoding).
+    The whole file is decoded once without keeping the text before any line is yielded, so
+    that a file that cannot be decoded yields nothing: it is reported, and copied to
+    quarantine_dir if one is given. data is the content of the file, if it was already read
+    (see prefetch).
+    """
     # Extract filename
     filename = os.path.basename(file_path)
 
-    for line in lines:
+    try:
+        encoding = check_decoding(file_path, encoding, data=data)
+    except UnicodeError as error:
+        print(f"Could not decode {file_path}: {error}")
+        if quarantine_dir is not None:
+            quarantine_file(file_path, quarantine_dir, error)
+        return
+
+    for line in iter_lines(file_path, encoding, data=data):
         # Strip whitespace and split by slash
         line = line.strip()
-        if line:  # Check if the line is not empty
-            words = line.split("/")
-            source = "".join(words)  # Join words to form the source sentence
-            target = " ".join(
-                [word for word in words if word]
-            )  # Join words with space but skip empty strings
+        if not line:
+            continue
+        if "//" in line or line[0] == "/" or line[-1] == "/":
+            words = [word for word in line.split("/") if word]  # skip empty strings
+            line = "/".join(words)
+        source = line.replace("/", "")  # Join words to form the source sentence
+        target = line.replace("/", " ")  # Join words with space
 
-            # Create a dictionary with source, target, and filename
-            data_point = {"source": source, "target": target, "filename": filename}
+        # Create a dictionary with source, target, and filename
+        yield {"source": source, "target": target, "filename": filename}
 
-            # Classify data as valid or invalid based on criteria
-            if is_valid_data_point(data_point):
-                valid_data.append(data_point)
-            else:
-                invalid_data.append(data_point)
 
-    return valid_data, invalid_data
+def read_and_process_tibetan_data(file_path, encoding=None):
+    """
+    Reads the Tibetan labeled data file, processes each line, and returns a list of dictionaries.
+    Each dictionary contains 'source', 'target', and 'filename' keys, where 'source' is the original sentence text,
+    'target' is the tokenized words separated by spaces, and 'filename' is the name of the processed file.
+    """
+    # Classify data as valid or invalid based on criteria
+    return partition_data_points(iter_tibetan_data(file_path, encoding))
+
+
+def process_folder(
+    folder_path,
+    valid_output_file,
+    invalid_output_file,
+    workers=None,
+    chunksize=1,
+    cache_dir=None,
+    omit_source=False,
+    normalizer=None,
+    quarantine_dir=None,
+    diagnostics=False,
+    prefetch=0,
+):
+    """
+    Processes every '.txt' file in the folder and streams the valid data into one JSON file
+    and the invalid data into another. The invalid file is only written if there is invalid data.
+    Output paths ending in '.jsonl' (optionally '.jsonl.gz' or '.jsonl.zst') are written as JSON Lines.
+    Files are parsed by `workers` processes (None: one per CPU core) and written in file name order.
+    With a `cache_dir`, per-file results are kept there so that a rerun only processes new or changed files.
+    With `omit_source`, valid records are written without the 'source' that can be derived from the target.
+    With a `normalizer`, the source and target of every data point are normalized first.
+    The encoding of every file is detected; files that cannot be decoded are skipped and copied to
+    `quarantine_dir` if one is given. With `diagnostics`, invalid records say why they are invalid.
+    With `prefetch` reader threads, files are read ahead of the parser.
+
+    Returns:
+    tuple: The number of valid and invalid data points written.
+    """
+    file_paths = list_folder_files(folder_path, ".txt")
+    return process_files(
+        partial(iter_tibetan_data, quarantine_dir=quarantine_dir),
+        file_paths,
+        valid_output_file,
+        invalid_output_file,
+        workers=workers,
+        chunksize=chunksize,
+        cache_dir=cache_dir,
+        # source is built from the target words, so every data point is valid,
+        # unless normalization changed one of them
+        validate=normalizer is not None,
+        omit_source=omit_source,
+        normalizer=normalizer,
+        diagnostics=diagnostics,
+        prefetch=prefetch,
+    )
 
 
 if __name__ == "__main__":
@@ -52,25 +112,10 @@ if __name__ == "__main__":
     valid_output_data_file = output_folder / "evaluate_valid_data.json"
     invalid_output_data_file = output_folder / "evaluate_invalid_data.json"
 
-    # Initialize lists to store all valid and invalid data
-    all_valid_data = []
-    all_invalid_data = []
-
-    # Process each file in the folder
-    for file_name in os.listdir(folder_path):
-        if file_name.endswith(".txt"):
-            file_path = os.path.join(folder_path, file_name)
-
-            # Read and process the file
-            valid_data, invalid_data = read_and_process_tibetan_data(file_path)
-
-            # Append to the final list of valid and invalid data
-            all_valid_data.extend(valid_data)
-            all_invalid_data.extend(invalid_data)
-
-    # Save all valid data into a single JSON file
-    save_json(all_valid_data, valid_output_data_file)
-
-    # Save all invalid data into a separate JSON file
-    if all_invalid_data:
-        save_json(all_invalid_data, invalid_output_data_file)
+    process_folder(
+        folder_path,
+        valid_output_data_file,
+        invalid_output_data_file,
+        cache_dir="data/cache/evaluate_tib_word",
+        quarantine_dir="data/quarantine/evaluate_tib_word",
+    )
@@ -0,0 +1,177 @@
+import os
+import shutil
+from typing import Any, Dict, List, Optional
+
+from TibWordGathering.metrics import stage
+from TibWordGathering.utils import iter_records
+
+COLUMNS = ["source", "target", "filename"]
+
+
+def _record_bytes(record, columns=COLUMNS):
+    # Approximate UTF-8 size: Tibetan characters take 3 bytes each
+    return sum(len(record.get(column) or "") for column in columns) * 3
+
+
+def write_shards(
+    records,
+    output_dir,
+    max_records_per_shard=500_000,
+    max_shard_bytes=256 * 1024 * 1024,
+    batch_size=10_000,
+    file_format="parquet",
+    prefix="train",
+    columns=COLUMNS,
+):
+    """
+    Writes records into size-bounded Parquet or Arrow shards straight from a record iterator
+    and yields the path of each shard as soon as it is complete, so that shards can be
+    uploaded while the next ones are still being written. Only one batch of records is held
+    in memory at a time.
+
+    Parameters:
+    records (iterable): The records to export, e.g. utils.iter_records(json_file).
+    output_dir (str): The folder where the shards are written.
+    max_records_per_shard (int): Maximum number of records in one shard.
+    max_shard_bytes (int): Approximate maximum size of the (uncompressed) text in one shard.
+    batch_size (int): Number of records converted and written at once.
+    file_format (str): 'parquet' or 'arrow' (Arrow IPC stream files).
+    prefix (str): Shard file name prefix, e.g. the split name.
+    columns (list): The columns to export. Leaving out 'source' keeps only the segmented
+        'target', from which the source is recovered by removing the spaces.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file_format not in ("parquet", "arrow"):
+        raise ValueError(f"Unknown shard format: {file_format}")
+    os.makedirs(output_dir, exist_ok=True)
+    schema = pa.schema([(column, pa.string()) for column in columns])
+
+    shard_index = 0
+    writer: Any = None  # a parquet or arrow writer of the current shard
+    shard_path = None
+    shard_records = 0
+    shard_bytes = 0
+    batch: Dict[str, List[Optional[str]]] = {column: [] for column in columns}
+
+    def flush():
+        if batch[columns[0]]:
+            writer.write_table(pa.table(batch, schema=schema))
+            for column in columns:
+                batch[column] = []
+
+    def close():
+        flush()
+        writer.close()
+
+    # Measured as one 'export' stage; the time includes waiting for the consumer
+    with stage("export", output_dir) as entry:
+        for record in records:
+            if writer is None:
+                shard_path = os.path.join(
+                    output_dir, f"{prefix}-{shard_index:05d}.{file_format}"
+                )
+                if file_format == "parquet":
+                    writer = pq.ParquetWriter(shard_path, schema)
+                else:
+                    writer = pa.ipc.new_stream(shard_path, schema)
+            for column in columns:
+                batch[column].append(record.get(column))
+            entry.records_in += 1
+            shard_records += 1
+            shard_bytes += _record_bytes(record, columns)
+            if len(batch[columns[0]]) >= batch_size:
+                flush()
+            if shard_records >= max_records_per_shard or shard_bytes >= max_shard_bytes:
+                close()
+                yield shard_path
+                writer = None
+                shard_index += 1
+                shard_records = 0
+                shard_bytes = 0
+        if writer is not None:
+            close()
+            yield shard_path
+        entry.records_out = entry.records_in
+
+
+def publish_shards(shard_paths, repo_id=None, path_in_repo="data", dry_run_dir=None):
+    """
+    Publishes shards as they are produced. Each shard is uploaded in a background thread
+    while the next one is being written, and at most one upload is pending at a time.
+
+    Parameters:
+    shard_paths (iterable): Shard paths, typically the generator returned by write_shards.
+    repo_id (str): The Hugging Face dataset repository to upload to.
+    path_in_repo (str): The folder of the repository the shards are uploaded to.
+    dry_run_dir (str): If given, shards are copied to this local folder (mirroring the
+        repository layout) instead of being uploaded to the Hub.
+
+    Returns:
+    list: The paths of the published shards inside the repository (or dry-run folder).
+    """
+    if dry_run_dir is not None:
+
+        def upload(shard_path, target):
+            target_path = os.path.join(dry_run_dir, target)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            shutil.copyfile(shard_path, target_path)
+
+    else:
+        from huggingface_hub import HfApi
+
+        api = HfApi()
+        api.create_repo(repo_id, repo_type="dataset", exist_ok=True)
+
+        def upload(shard_path, target):
+            api.upload_file(
+                path_or_fileobj=shard_path,
+                path_in_repo=target,
+                repo_id=repo_id,
+                repo_type="dataset",
+            )
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    published = []
+    pending = None
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        for shard_path in shard_paths:
+            if pending is not None:
+                pending.result()
+            target = f"{path_in_repo}/{os.path.basename(shard_path)}"
+            pending = executor.submit(upload, shard_path, target)
+            published.append(target)
+            print(f"Publishing {target}")
+        if pending is not None:
+            pending.result()
+    return published
+
+
+def load_dataset_from_records(file_path):
+    """
+    Builds a Hugging Face Dataset from a JSON or JSON Lines file with Dataset.from_generator,
+    which streams records into an Arrow cache instead of going through pandas.
+    """
+    from datasets import Dataset
+
+    return Dataset.from_generator(iter_records, gen_kwargs={"file_path": file_path})
+
+
+def export_to_hub(
+    json_file,
+    repo_id=None,
+    shard_dir="data/output/shards",
+    dry_run_dir=None,
+    **shard_options,
+):
+    """
+    Exports a JSON or JSON Lines dataset as Parquet shards and publishes them to the Hub
+    (or to dry_run_dir), uploading each shard as soon as it is written.
+
+    Returns:
+    list: The paths of the published shards inside the repository (or dry-run folder).
+    """
+    shard_paths = write_shards(iter_records(json_file), shard_dir, **shard_options)
+    return publish_shards(shard_paths, repo_id, dry_run_dir=dry_run_dir)
@@ -0,0 +1,206 @@
+import ast
+import mmap
+import os
+import struct
+import sys
+from array import array
+from itertools import accumulate
+from typing import Any, BinaryIO, Dict, Optional
+
+from TibWordGathering.metrics import stage
+from TibWordGathering.utils import iter_records, save_json
+
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+NPY_HEADER_SIZE = 128  # room for any shape, so the header can be rewritten in place
+SCHEMES = {
+    "bmes": ["B", "M", "E", "S"],
+    "bio": ["B", "I", "O"],  # O is never used: every character belongs to a token
+}
+# (typecode, NumPy descr) of each kind of array
+TEXT_TYPE = ("I", "<u4")
+LABEL_TYPE = ("B", "|u1")
+OFFSET_TYPE = ("q", "<i8")
+NPY_TYPES = [TEXT_TYPE, LABEL_TYPE, OFFSET_TYPE]
+
+
+class NpyWriter:
+    """
+    Streams a one- or two-dimensional array to a '.npy' file (NumPy format 1.0) without
+    needing NumPy: the header is written with room to spare and filled in with the final
+    shape when the writer is closed. The file can then be opened with numpy.load(...,
+    mmap_mode='r') or with open_npy.
+
+    Parameters:
+    file_path (str): The '.npy' file to write.
+    descr (str): The little-endian NumPy type of the items, e.g. '<u4'.
+    columns (int): The number of columns of a two-dimensional array, or None.
+    """
+
+    def __init__(self, file_path, descr, columns=None):
+        self.file_path = file_path
+        self.descr = descr
+        self.itemsize = int(descr[2:])
+        self.columns = columns
+        self.size = 0  # number of bytes of data
+        self._file: Optional[BinaryIO] = open(file_path, "wb")
+        self._file.write(b" " * NPY_HEADER_SIZE)
+
+    def write(self, data):
+        """Appends items given as little-endian bytes (or an array of the right type)."""
+        if self._file is None:
+            raise ValueError(f"{self.file_path} is closed")
+        if isinstance(data, array):
+            if sys.byteorder != "little":
+                data = array(data.typecode, data)
+                data.byteswap()
+            data = data.tobytes()
+        self._file.write(data)
+        self.size += len(data)
+
+    def _header(self):
+        items = self.size // self.itemsize
+        if self.columns is None:
+            shape = f"({items},)"
+        else:
+            shape = f"({items // self.columns}, {self.columns})"
+        header = (
+            f"{{'descr': '{self.descr}', 'fortran_order': False, 'shape': {shape}, }}"
+        )
+        encoded = header.encode("latin-1")
+        prefix = len(NPY_MAGIC) + 2
+        padding = NPY_HEADER_SIZE - prefix - len(encoded) - 1
+        return (
+            NPY_MAGIC
+            + struct.pack("<H", padding + len(encoded) + 1)
+            + encoded
+            + b" " * padding
+            + b"\n"
+        )
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.seek(0)
+        self._file.write(self._header())
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_npy(file_path):
+    """
+    Memory-maps a '.npy' file written by NpyWriter and returns a read-only memoryview of
+    its items, with the shape of the array, so that it can be sliced without copying and
+    without NumPy. Little-endian machines only.
+
+    Returns:
+    memoryview: The items of the array.
+    """
+    with open(file_path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[: len(NPY_MAGIC)] != NPY_MAGIC:
+        raise ValueError(f"{file_path} is not a version 1.0 .npy file")
+    (header_size,) = struct.unpack_from("<H", buffer, len(NPY_MAGIC))
+    start = len(NPY_MAGIC) + 2
+    header = ast.literal_eval(
+        buffer[start : start + header_size].decode("latin-1")  # noqa: E203
+    )
+    typecodes: Dict[str, Any] = {descr: typecode for typecode, descr in NPY_TYPES}
+    data = memoryview(buffer)[start + header_size :]  # noqa: E203
+    return data.cast(typecodes[header["descr"]], tuple(header["shape"]))
+
+
+def _token_labels(length, scheme):
+    # Label codes of one token of `length` characters: indexes into SCHEMES[scheme]
+    if scheme == "bmes":
+        return b"\x03" if length == 1 else b"\x00" + b"\x01" * (length - 2) + b"\x02"
+    return b"\x00" + b"\x01" * (length - 1)
+
+
+def write_label_arrays(records, output_dir, schemes=("bmes", "bio")):
+    """
+    Writes the segmentation of records as memory-mappable NumPy arrays, so that training
+    data loaders can slice characters and labels without any string processing:
+
+    - text.npy: the source characters of all records, concatenated, as uint32 code points
+    - boundaries.npy: the offset in text of the first character of every token, then the
+      length of text (int64)
+    - labels_<scheme>.npy: one label per character of text (uint8, see SCHEMES)
+    - offsets.npy: one (character, token) row per record, where the record starts in text
+      and in boundaries, then a row with the totals (int64, shape (records + 1, 2))
+    - labels.json: the number of records, characters and tokens and the label names
+
+    The tokens of a record are its 'target' split on spaces; its source is their
+    concatenation (see utils.derive_source).
+
+    Parameters:
+    records (iterable): The records to export, e.g. utils.iter_records(json_file).
+    output_dir (str): The folder where the arrays are written.
+    schemes (list): The labelling schemes: 'bmes' and/or 'bio'.
+
+    Returns:
+    dict: The content of labels.json.
+    """
+    for scheme in schemes:
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown labelling scheme: {scheme}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    def writer(name, types, columns=None):
+        return NpyWriter(os.path.join(output_dir, name), types[1], columns)
+
+    text = writer("text.npy", TEXT_TYPE)
+    boundaries = writer("boundaries.npy", OFFSET_TYPE)
+    offsets = writer("offsets.npy", OFFSET_TYPE, columns=2)
+    labels = {scheme: writer(f"labels_{scheme}.npy", LABEL_TYPE) for scheme in schemes}
+    caches: Dict[str, Dict[int, bytes]] = {scheme: {} for scheme in schemes}
+    characters = tokens_count = records_count = 0
+
+    npy_writers = [text, boundaries, offsets, *labels.values()]
+    try:
+        with stage("labels", output_dir) as entry:
+            for record in records:
+                tokens = [token for token in record["target"].split(" ") if token]
+                lengths = [len(token) for token in tokens]
+                offsets.write(array("q", [characters, tokens_count]))
+                starts = array("q", accumulate(lengths, initial=characters))
+                characters = starts.pop()
+                boundaries.write(starts)
+                text.write("".join(tokens).encode("utf-32-le"))
+                for scheme, cache in caches.items():
+                    for length in lengths:
+                        if length not in cache:
+                            cache[length] = _token_labels(length, scheme)
+                    labels[scheme].write(
+                        b"".join([cache[length] for length in lengths])
+                    )
+                tokens_count += len(tokens)
+                records_count += 1
+            entry.records_in = entry.records_out = records_count
+
+        offsets.write(array("q", [characters, tokens_count]))
+        boundaries.write(array("q", [characters]))
+    finally:
+        for npy_writer in npy_writers:
+            npy_writer.close()
+    metadata = {
+        "records": records_count,
+        "characters": characters,
+        "tokens": tokens_count,
+        "schemes": {scheme: SCHEMES[scheme] for scheme in schemes},
+    }
+    save_json(metadata, os.path.join(output_dir, "labels.json"), indent=True)
+    print(
+        f"Wrote labels of {records_count} records ({characters} characters) to {output_dir}"
+    )
+    return metadata
+
+
+def export_labels(json_file, output_dir, schemes=("bmes", "bio")):
+    """Writes the label arrays of a JSON or JSON Lines dataset (see write_label_arrays)."""
+    return write_label_arrays(iter_records(json_file), output_dir, schemes)
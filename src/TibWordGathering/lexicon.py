@@ -0,0 +1,504 @@
+import bisect
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import Counter
+from functools import partial
+from typing import Optional, Set
+
+from TibWordGathering import codec
+from TibWordGathering.manifest import (
+    MANIFEST_FILENAME,
+    Manifest,
+    processor_key,
+    shard_paths,
+)
+from TibWordGathering.parallel import resolve_workers
+from TibWordGathering.utils import iter_records
+
+BINARY_MAGIC = b"TIBLEX01"
+UINT64 = struct.Struct("<Q")
+
+
+class Lexicon:
+    """
+    Word frequencies of a set of records: how often each token of the segmented 'target'
+    occurs, in how many files it occurs (by the 'filename' of the records), and optionally
+    how often each pair of consecutive tokens occurs.
+
+    Lexicons are mergeable: counts made separately for files, workers or sources are added
+    together with update(), and partial counts can be saved and loaded again, so that a
+    corpus never has to be scanned twice. A file whose records are split over several
+    partial counts is counted once in each of them.
+    """
+
+    def __init__(self, bigrams=False):
+        self.tokens: "Counter[str]" = Counter()
+        self.files: "Counter[str]" = Counter()
+        self.bigrams: "Optional[Counter[str]]" = Counter() if bigrams else None
+        self.records = 0
+
+    def add_records(self, records):
+        """Counts the tokens of records, e.g. the records of one input file."""
+        tokens_counter = self.tokens
+        bigrams_counter = self.bigrams
+        seen: Set[str] = set()
+        filename = None
+        for record in records:
+            tokens = record["target"].split()
+            tokens_counter.update(tokens)
+            if bigrams_counter is not None:
+                bigrams_counter.update(map(" ".join, zip(tokens, tokens[1:])))
+            if record.get("filename") != filename:
+                # Records are grouped by file, so a file's tokens are complete here
+                self.files.update(seen)
+                seen = set()
+                filename = record.get("filename")
+            seen.update(tokens)
+            self.records += 1
+        self.files.update(seen)
+        return self
+
+    def update(self, other):
+        """Adds the counts of another Lexicon to this one."""
+        self.tokens.update(other.tokens)
+        self.files.update(other.files)
+        if self.bigrams is not None and other.bigrams is not None:
+            self.bigrams.update(other.bigrams)
+        self.records += other.records
+        return self
+
+    def to_dict(self):
+        return {
+            "records": self.records,
+            "tokens": self.tokens,
+            "files": self.files,
+            "bigrams": self.bigrams,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        lexicon = cls(bigrams=data.get("bigrams") is not None)
+        lexicon.records = data["records"]
+        lexicon.tokens.update(data["tokens"])
+        lexicon.files.update(data["files"])
+        if lexicon.bigrams is not None:
+            lexicon.bigrams.update(data["bigrams"])
+        return lexicon
+
+    def save(self, file_path):
+        """Saves the partial counts as JSON, to be merged later with load()/update()."""
+        with open(file_path, "wb") as f:
+            f.write(codec.dumps(self.to_dict()))
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path, "rb") as f:
+            return cls.from_dict(codec.loads(f.read()))
+
+    def write_tsv(self, file_path, min_count=1):
+        """
+        Writes the frequency table as TSV with the columns token, count and files, from the
+        most to the least frequent token (ties sorted by token). Returns the number of rows.
+        """
+        rows = sorted(
+            (item for item in self.tokens.items() if item[1] >= min_count),
+            key=lambda item: (-item[1], item[0]),
+        )
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("token\tcount\tfiles\n")
+            for token, count in rows:
+                f.write(f"{token}\t{count}\t{self.files[token]}\n")
+        return len(rows)
+
+    def write_bigrams_tsv(self, file_path, min_count=1):
+        """Writes the bigram table as TSV with the columns first, second and count."""
+        if self.bigrams is None:
+            raise ValueError("bigrams were not counted")
+        rows = sorted(
+            (item for item in self.bigrams.items() if item[1] >= min_count),
+            key=lambda item: (-item[1], item[0]),
+        )
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("first\tsecond\tcount\n")
+            for bigram, count in rows:
+                first, second = bigram.split(" ")
+                f.write(f"{first}\t{second}\t{count}\n")
+        return len(rows)
+
+    def write_binary(self, file_path):
+        """Writes the token counts in the binary format read by LexiconIndex."""
+        write_lexicon_index(self.tokens, self.files, file_path)
+
+
+def _little_endian(values):
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def write_lexicon_index(tokens, files, file_path):
+    """
+    Writes token counts as a binary table sorted by the UTF-8 bytes of the tokens:
+    the magic bytes, the number of tokens n, n + 1 offsets into the token blob, n counts
+    and n file counts (all little-endian uint64), followed by the token blob.
+    """
+    encoded = sorted((token.encode("utf-8"), token) for token in tokens)
+    offsets = array("Q", [0])
+    for data, _ in encoded:
+        offsets.append(offsets[-1] + len(data))
+    counts = array("Q", (tokens[token] for _, token in encoded))
+    file_counts = array("Q", (files[token] for _, token in encoded))
+    with open(file_path, "wb") as f:
+        f.write(BINARY_MAGIC)
+        f.write(_little_endian(array("Q", [len(encoded)])).tobytes())
+        f.write(_little_endian(offsets).tobytes())
+        f.write(_little_endian(counts).tobytes())
+        f.write(_little_endian(file_counts).tobytes())
+        for data, _ in encoded:
+            f.write(data)
+
+
+class _Column:
+    # Sequence view over one uint64 column of the memory-mapped table
+    def __init__(self, buffer, start, length):
+        self.buffer = buffer
+        self.start = start
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        return UINT64.unpack_from(self.buffer, self.start + index * 8)[0]
+
+
+class _Tokens:
+    # Sequence view over the sorted token blob, for bisect
+    def __init__(self, buffer, offsets, blob_start):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.blob_start = blob_start
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start = self.blob_start + self.offsets[index]
+        end = self.blob_start + self.offsets[index + 1]
+        return self.buffer[start:end]
+
+
+class LexiconIndex:
+    """
+    Read-only, memory-mapped view of a binary lexicon written by Lexicon.write_binary.
+    Looking up a token is a binary search over the mapped file, so opening even a very
+    large lexicon is instant and uses no memory up front.
+    """
+
+    def __init__(self, file_path):
+        self._file = open(file_path, "rb")
+        self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._buffer[: len(BINARY_MAGIC)] != BINARY_MAGIC:
+            raise ValueError(f"{file_path} is not a binary lexicon")
+        start = len(BINARY_MAGIC)
+        (size,) = UINT64.unpack_from(self._buffer, start)
+        start += 8
+        self._offsets = _Column(self._buffer, start, size + 1)
+        start += (size + 1) * 8
+        self._counts = _Column(self._buffer, start, size)
+        start += size * 8
+        self._files = _Column(self._buffer, start, size)
+        start += size * 8
+        self._tokens = _Tokens(self._buffer, self._offsets, start)
+
+    def __len__(self):
+        return len(self._counts)
+
+    def _find(self, token):
+        key = token.encode("utf-8")
+        index = bisect.bisect_left(self._tokens, key)
+        if index < len(self) and self._tokens[index] == key:
+            return index
+        return None
+
+    def __contains__(self, token):
+        return self._find(token) is not None
+
+    def get(self, token, default=0):
+        """Returns the count of token, or default if it is not in the lexicon."""
+        index = self._find(token)
+        return default if index is None else self._counts[index]
+
+    def files(self, token):
+        """Returns the number of files token occurs in."""
+        index = self._find(token)
+        return 0 if index is None else self._files[index]
+
+    def __getitem__(self, token):
+        index = self._find(token)
+        if index is None:
+            raise KeyError(token)
+        return self._counts[index]
+
+    def items(self):
+        """Yields (token, count) pairs in token order."""
+        for index in range(len(self)):
+            yield self._tokens[index].decode("utf-8"), self._counts[index]
+
+    def close(self):
+        self._buffer.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def count_file(iter_func, file_path, bigrams=False):
+    """Counts the tokens of the records that iter_func yields for one file."""
+    return Lexicon(bigrams).add_records(iter_func(file_path))
+
+
+def _count_chunk(iter_func, file_paths, bigrams):
+    # Runs inside a worker process: one partial Lexicon per file
+    return [count_file(iter_func, file_path, bigrams) for file_path in file_paths]
+
+
+def iter_file_lexicons(iter_func, file_paths, workers=None, chunksize=1, bigrams=False):
+    """Yields the Lexicon of each file, in the order of file_paths, counted by `workers` processes."""
+    file_paths = list(file_paths)
+    if resolve_workers(workers) == 1 or len(file_paths) < 2:
+        for file_path in file_paths:
+            yield count_file(iter_func, file_path, bigrams)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(1, chunksize)
+    chunks = [
+        file_paths[i : i + chunksize]  # noqa: E203
+        for i in range(0, len(file_paths), chunksize)
+    ]
+    workers = min(resolve_workers(workers), len(chunks))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for lexicons in executor.map(
+            partial(_count_chunk, iter_func, bigrams=bigrams), chunks
+        ):
+            yield from lexicons
+
+
+def iter_cached_lexicons(
+    file_paths,
+    iter_func=iter_records,
+    workers=None,
+    chunksize=1,
+    bigrams=False,
+    cache_dir=None,
+):
+    """
+    Yields the Lexicon of each file, in the order of file_paths. With a cache_dir, the
+    partial counts of every file are kept there with a manifest, and only new or changed
+    files are counted again; the others are loaded from their saved counts.
+    """
+    file_paths = list(file_paths)
+    if cache_dir is None:
+        yield from iter_file_lexicons(
+            iter_func, file_paths, workers, chunksize, bigrams
+        )
+        return
+
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = Manifest(
+        os.path.join(cache_dir, MANIFEST_FILENAME),
+        processor_key(partial(count_file, iter_func, bigrams=bigrams)),
+    )
+    stale_paths = [path for path in file_paths if manifest.get(path) is None]
+    partials = iter_file_lexicons(iter_func, stale_paths, workers, chunksize, bigrams)
+    for file_path, partial_lexicon in zip(stale_paths, partials):
+        shards = shard_paths(cache_dir, file_path, ("counts",), ".json")
+        partial_lexicon.save(shards["counts"])
+        manifest.record(file_path, shards, records=partial_lexicon.records)
+    manifest.compact(keep=file_paths)
+    for file_path in file_paths:
+        yield Lexicon.load(manifest.get(file_path)["shards"]["counts"])
+
+
+def iter_input_lexicons(
+    source_cache_dir, workers=None, chunksize=1, bigrams=False, cache_dir=None
+):
+    """
+    Yields the Lexicon of every input file of a source processed with a cache (see
+    parallel.process_files_incremental), counted from the valid shard the source keeps for
+    that file, so that the files are counted in parallel whatever the number of outputs.
+    With a cache_dir, the counts are kept under the manifest entry of each input file and
+    only the input files that are new, changed or processed differently are counted again.
+
+    Returns:
+    iterator: The lexicons, in the order of the input files.
+    """
+    source_manifest = Manifest(
+        os.path.join(source_cache_dir, MANIFEST_FILENAME), processor=None
+    )
+    input_paths = sorted(source_manifest.entries)
+    valid_shards = {
+        path: entry["shards"]["valid"]
+        for path, entry in source_manifest.entries.items()
+    }
+    if cache_dir is None:
+        yield from iter_file_lexicons(
+            iter_records,
+            [valid_shards[path] for path in input_paths],
+            workers,
+            chunksize,
+            bigrams,
+        )
+        return
+
+    # The counts also depend on how the source processed its input files
+    source_processors = sorted(
+        {entry["processor"] for entry in source_manifest.entries.values()}
+    )
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = Manifest(
+        os.path.join(cache_dir, MANIFEST_FILENAME),
+        f"{processor_key(partial(count_file, iter_records, bigrams=bigrams))}"
+        f" of {', '.join(source_processors)}",
+    )
+    stale_paths = [path for path in input_paths if manifest.get(path) is None]
+    partials = iter_file_lexicons(
+        iter_records,
+        [valid_shards[path] for path in stale_paths],
+        workers,
+        chunksize,
+        bigrams,
+    )
+    for input_path, partial_lexicon in zip(stale_paths, partials):
+        shards = shard_paths(cache_dir, input_path, ("counts",), ".json")
+        partial_lexicon.save(shards["counts"])
+        manifest.record(input_path, shards, records=partial_lexicon.records)
+    manifest.compact(keep=input_paths)
+    for input_path in input_paths:
+        yield Lexicon.load(manifest.get(input_path)["shards"]["counts"])
+
+
+def build_lexicon(
+    file_paths,
+    iter_func=iter_records,
+    workers=None,
+    chunksize=1,
+    bigrams=False,
+    cache_dir=None,
+):
+    """
+    Counts the tokens of every file in parallel and merges the per-file counts.
+
+    Parameters:
+    file_paths (list): The files to count, e.g. the valid outputs of the sources.
+    iter_func (callable): A module-level function yielding the records of one file; by
+        default the files are read as JSON or JSON Lines records. An extractor such as
+        segpos.iter_data_points counts the input files directly.
+    workers (int): Number of worker processes. None uses one per CPU core.
+    chunksize (int): Number of files handed to a worker at a time.
+    bigrams (bool): Also count pairs of consecutive tokens.
+    cache_dir (str): If given, the partial counts of every file are kept in this folder
+        and only new or changed files are counted again (see iter_cached_lexicons).
+
+    Returns:
+    Lexicon: The merged counts.
+    """
+    lexicon = Lexicon(bigrams)
+    for partial_lexicon in iter_cached_lexicons(
+        file_paths, iter_func, workers, chunksize, bigrams, cache_dir
+    ):
+        lexicon.update(partial_lexicon)
+    return lexicon
+
+
+def write_lexicon(lexicon, output_dir, name="lexicon", min_count=1):
+    """
+    Writes '<name>.tsv', '<name>.bin' and, if bigrams were counted, '<name>.bigrams.tsv'
+    to output_dir and returns their paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [
+        os.path.join(output_dir, f"{name}.tsv"),
+        os.path.join(output_dir, f"{name}.bin"),
+    ]
+    lexicon.write_tsv(paths[0], min_count)
+    lexicon.write_binary(paths[1])
+    if lexicon.bigrams is not None:
+        paths.append(os.path.join(output_dir, f"{name}.bigrams.tsv"))
+        lexicon.write_bigrams_tsv(paths[2], min_count)
+    print(
+        f"Wrote {len(lexicon.tokens)} tokens from {lexicon.records} records to {paths[0]}"
+    )
+    return paths
+
+
+def build_source_lexicons(
+    sources,
+    output_dir,
+    workers=None,
+    bigrams=False,
+    cache_dir=None,
+    min_count=1,
+    source_cache_dirs=None,
+):
+    """
+    Builds one lexicon per source and a merged lexicon of all of them. Sources processed
+    with a cache are counted per input file from their shards (see iter_input_lexicons);
+    the record files of the other sources are counted in one parallel pass.
+
+    Parameters:
+    sources (dict): Source name -> list of record files (e.g. its valid output).
+    output_dir (str): Where '<source>.tsv/.bin' and 'lexicon.tsv/.bin' are written.
+    workers (int): Number of worker processes. None uses one per CPU core.
+    bigrams (bool): Also count pairs of consecutive tokens.
+    cache_dir (str): Where the partial counts of every file are kept between runs.
+    min_count (int): Tokens seen fewer times are left out of the tables.
+    source_cache_dirs (dict): Source name -> the cache_dir the source was processed with.
+        Sources without one, or whose cache has no manifest, are counted from their
+        record files.
+
+    Returns:
+    Lexicon: The merged lexicon.
+    """
+    source_cache_dirs = {
+        name: source_cache_dir
+        for name, source_cache_dir in (source_cache_dirs or {}).items()
+        if name in sources
+        and source_cache_dir
+        and os.path.exists(os.path.join(source_cache_dir, MANIFEST_FILENAME))
+    }
+    file_paths = [
+        str(path)
+        for name, paths in sources.items()
+        if name not in source_cache_dirs
+        for path in paths
+    ]
+    lexicons = iter_cached_lexicons(
+        file_paths, workers=workers, bigrams=bigrams, cache_dir=cache_dir
+    )
+    total = Lexicon(bigrams)
+    for name, paths in sources.items():
+        lexicon = Lexicon(bigrams)
+        if name in source_cache_dirs:
+            for partial_lexicon in iter_input_lexicons(
+                source_cache_dirs[name],
+                workers=workers,
+                bigrams=bigrams,
+                cache_dir=cache_dir and os.path.join(cache_dir, name),
+            ):
+                lexicon.update(partial_lexicon)
+        else:
+            for _ in paths:
+                lexicon.update(next(lexicons))
+        write_lexicon(lexicon, output_dir, name, min_count)
+        total.update(lexicon)
+    write_lexicon(total, output_dir, "lexicon", min_count)
+    return total
@@ -0,0 +1,149 @@
+import hashlib
+import os
+from functools import partial
+
+from TibWordGathering import codec
+
+MANIFEST_FILENAME = "manifest.jsonl"
+
+
+def file_sha256(file_path, block_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _argument_key(value):
+    # Functions are identified by name: their repr contains a memory address
+    if isinstance(value, partial) or hasattr(value, "__qualname__"):
+        return processor_key(value)
+    return repr(value)
+
+
+def processor_key(func):
+    """
+    Returns a string identifying a processing function and its bound arguments, so that
+    cached results are discarded when the processor changes.
+    """
+    if isinstance(func, partial):
+        arguments = [_argument_key(arg) for arg in func.args] + [
+            f"{key}={_argument_key(value)}"
+            for key, value in sorted(func.keywords.items())
+        ]
+        return f"{processor_key(func.func)}({', '.join(arguments)})"
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+class Manifest:
+    """
+    Remembers, for every input file, its size, modification time, content hash and the
+    output shards it was processed into.
+
+    The manifest is an append-only JSON Lines journal: one line is appended as soon as a
+    file is done, so an interrupted run resumes after the last finished file. Later lines
+    override earlier ones, and compact() rewrites the journal with one line per file.
+
+    Parameters:
+    manifest_path (str): The path to the manifest file.
+    processor (str): Identifies how the files are processed; entries recorded by another
+        processor are ignored. None reads the entries of every processor, e.g. to use the
+        shards of another step.
+    """
+
+    def __init__(self, manifest_path, processor=""):
+        self.manifest_path = str(manifest_path)
+        self.processor = processor
+        self.entries = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = codec.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by an interrupted run
+                    if processor is None or entry.get("processor") == processor:
+                        self.entries[entry["path"]] = entry
+
+    @staticmethod
+    def _key(file_path):
+        return os.path.normpath(str(file_path))
+
+    def get(self, file_path):
+        """
+        Returns the entry of file_path if the file has not changed since it was recorded
+        and its shards still exist, otherwise None.
+        """
+        entry = self.entries.get(self._key(file_path))
+        if entry is None:
+            return None
+        if not all(os.path.exists(shard) for shard in entry["shards"].values()):
+            return None
+        stat = os.stat(file_path)
+        if stat.st_size != entry["size"]:
+            return None
+        if stat.st_mtime_ns != entry["mtime_ns"]:
+            # Touched but maybe not modified: fall back to the content hash
+            if file_sha256(file_path) != entry["sha256"]:
+                return None
+            entry["mtime_ns"] = stat.st_mtime_ns
+            self._append(entry)
+        return entry
+
+    def record(self, file_path, shards, **info):
+        """
+        Records that file_path has been processed into the given shards and appends the
+        entry to the journal. Extra keyword arguments are stored with the entry.
+        """
+        stat = os.stat(file_path)
+        entry = {
+            "path": self._key(file_path),
+            "processor": self.processor,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_sha256(file_path),
+            "shards": shards,
+            **info,
+        }
+        self.entries[entry["path"]] = entry
+        self._append(entry)
+        return entry
+
+    def _append(self, entry):
+        directory = os.path.dirname(self.manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.manifest_path, "ab") as f:
+            f.write(codec.dumps(entry) + b"\n")
+
+    def compact(self, keep=None):
+        """
+        Rewrites the journal with one line per file. If keep is given, entries of files
+        that are not in keep are dropped and their shards deleted.
+        """
+        if keep is not None:
+            keep = {self._key(file_path) for file_path in keep}
+            for key in list(self.entries):
+                if key not in keep:
+                    for shard in self.entries.pop(key)["shards"].values():
+                        if os.path.exists(shard):
+                            os.remove(shard)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for entry in self.entries.values():
+                f.write(codec.dumps(entry) + b"\n")
+        os.replace(tmp_path, self.manifest_path)
+
+
+def shard_paths(cache_dir, file_path, kinds=("valid", "invalid"), extension=".jsonl"):
+    """
+    Returns the shard paths used to cache the results of one input file, by default its
+    valid and invalid records.
+    """
+    name = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:16]
+    stem = f"{os.path.splitext(os.path.basename(file_path))[0]}-{name}"
+    return {
+        kind: os.path.join(cache_dir, f"{stem}.{kind}{extension}") for kind in kinds
+    }
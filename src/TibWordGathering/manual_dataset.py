@@ -1,11 +1,19 @@
-import json
 import os
 
-from TibWordGathering.utils import is_valid_data_point, save_json
+from TibWordGathering import codec
+from TibWordGathering.metrics import stage
+from TibWordGathering.records import RecordStore
+from TibWordGathering.utils import is_valid_data_point, save_records
 
 
 # Main function to process data points
-def process_data(input_file, output_file_valid, output_file_invalid):
+def process_data(
+    input_file,
+    output_file_valid,
+    output_file_invalid,
+    normalizer=None,
+    diagnostics=False,
+):
     # Ensure the output directory exists
     output_dir_valid = os.path.dirname(output_file_valid)
     output_dir_invalid = os.path.dirname(output_file_invalid)
@@ -19,34 +27,49 @@ def process_data(input_file, output_file_valid, output_file_invalid):
         print(f"Created directory {output_dir_invalid}")
 
     # Load the data from the input file
-    with open(input_file, encoding="utf-8") as f:
-        data = [json.loads(line) for line in f]
+    with stage("parse", input_file) as entry:
+        data = RecordStore()
+        with open(input_file, "rb") as f:
+            data.extend(codec.decode_record(line) for line in f if line.strip())
+        entry.bytes_read = os.path.getsize(input_file)
+        entry.records_out = len(data)
 
-    valid_data = []
-    invalid_data = []
+    valid_data = RecordStore()
+    invalid_data = RecordStore()
 
     # Add filename to each data point and validate it
     filename = os.path.basename(input_file)  # Extract filename from the input file path
-    for data_point in data:
-        data_point["filename"] = filename  # Add the filename field to each data point
+    with stage("validate", input_file) as entry:
+        for data_point in data:
+            # Add the filename field to each data point
+            data_point["filename"] = filename
+            if normalizer is not None:
+                normalizer(data_point)
 
-        if is_valid_data_point(data_point):
-            valid_data.append(data_point)
-        else:
-            invalid_data.append(data_point)
+            if is_valid_data_point(data_point):
+                valid_data.append(data_point)
+            else:
+                invalid_data.append(data_point)
+        entry.records_in = len(data)
+        entry.records_out = entry.valid = len(valid_data)
+        entry.invalid = len(invalid_data)
 
-    # Save valid data to the output file
-    save_json(valid_data, output_file_valid)
-    print(f"Saved {len(valid_data)} valid data points to {output_file_valid}")
+    with stage("write", input_file) as entry:
+        # Save valid data to the output file
+        save_records(valid_data, output_file_valid)
+        print(f"Saved {len(valid_data)} valid data points to {output_file_valid}")
 
-    # Save invalid data to the output file
-    save_json(invalid_data, output_file_invalid)
+        # Save invalid data to the output file
+        save_records(invalid_data, output_file_invalid, diagnose=diagnostics)
+        entry.records_in = entry.records_out = len(data)
     print(f"Saved {len(invalid_data)} invalid data points to {output_file_invalid}")
+    return len(valid_data), len(invalid_data)
 
 
-# Example usage
-input_file = "data/input/Manual-dataset/manual_data.json"  # Your input file path
-output_file_valid = "data/output/Manual-dataset/manual_data_valid_data.json"  # Where valid data will be stored
-output_file_invalid = "data/output/Manual-dataset/manual_data_invalid_data.json"  # Where invalid data will be stored
+if __name__ == "__main__":
+    # Example usage
+    input_file = "data/input/Manual-dataset/manual_data.json"  # Your input file path
+    output_file_valid = "data/output/Manual-dataset/manual_data_valid_data.json"  # Where valid data will be stored
+    output_file_invalid = "data/output/Manual-dataset/manual_data_invalid_data.json"  # noqa  # Where invalid data will be stored
 
-process_data(input_file, output_file_valid, output_file_invalid)
+    process_data(input_file, output_file_valid, output_file_invalid)
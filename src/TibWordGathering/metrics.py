@@ -0,0 +1,244 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+from TibWordGathering import codec
+
+COUNTERS = ["records_in", "records_out", "valid", "invalid", "skipped", "bytes_read"]
+
+_active = None
+# StageMetrics of the stages being measured in this process, innermost last
+_running: List["StageMetrics"] = []
+
+
+def peak_rss_bytes():
+    """
+    Returns the peak resident memory of the current process so far, or 0 on platforms
+    without the resource module (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class StageMetrics:
+    """
+    Measurements of one stage on one input (a file, a shard or a whole dataset).
+    The counters are updated by the code running the stage; the wall time and peak
+    memory are filled in when the stage ends.
+    """
+
+    __slots__ = ["stage", "file", "seconds", "peak_rss_bytes"] + COUNTERS
+
+    def __init__(self, stage, file_path=None):
+        self.stage = stage
+        self.file = None if file_path is None else str(file_path)
+        self.seconds = 0.0
+        self.peak_rss_bytes = 0
+        for counter in COUNTERS:
+            setattr(self, counter, 0)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Metrics:
+    """
+    Collects per-stage, per-input measurements of a pipeline run: wall time, records in
+    and out, valid and invalid records, bytes read and peak memory. Peak memory is the
+    high-water mark of the process running the stage (a worker process for files parsed
+    in parallel) at the end of the stage, and 0 where it cannot be measured.
+
+    Parameters:
+    profile_stage (str): Name of a stage to profile, or None.
+    profiler (str): 'cprofile' or 'pyinstrument' (requires the optional 'pyinstrument' package).
+    profile_dir (str): Where the profile of profile_stage is written by write_profile.
+    """
+
+    def __init__(self, profile_stage=None, profiler="cprofile", profile_dir="."):
+        if profiler not in ("cprofile", "pyinstrument"):
+            raise ValueError(f"Unknown profiler: {profiler}")
+        self.entries = []
+        self.profile_stage = profile_stage
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+        self._profile: Any = None  # a cProfile.Profile or a pyinstrument.Profiler
+
+    def _start_profile(self):
+        if self._profile is None:
+            if self.profiler == "pyinstrument":
+                from pyinstrument import Profiler
+
+                self._profile = Profiler()
+            else:
+                import cProfile
+
+                self._profile = cProfile.Profile()
+        if self.profiler == "pyinstrument":
+            self._profile.start()
+        else:
+            self._profile.enable()
+
+    def _stop_profile(self):
+        if self.profiler == "pyinstrument":
+            self._profile.stop()
+        else:
+            self._profile.disable()
+
+    @contextmanager
+    def stage(self, name, file_path=None):
+        """Times the enclosed block as stage name and yields its StageMetrics."""
+        entry = StageMetrics(name, file_path)
+        profiling = name == self.profile_stage
+        if profiling:
+            self._start_profile()
+        _running.append(entry)
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry.seconds = time.perf_counter() - start
+            _running.remove(entry)
+            if profiling:
+                self._stop_profile()
+            entry.peak_rss_bytes = peak_rss_bytes()
+            self.entries.append(entry.to_dict())
+
+    def add(self, entries):
+        """Adds entries measured elsewhere, e.g. in a worker process."""
+        self.entries.extend(entries)
+
+    def summary(self):
+        """Returns the totals of every stage, with the valid ratio and overall peak memory."""
+        totals: Dict[str, Dict[str, Any]] = {}
+        for entry in self.entries:
+            total = totals.setdefault(
+                entry["stage"],
+                dict(
+                    inputs=0,
+                    seconds=0.0,
+                    peak_rss_bytes=0,
+                    **dict.fromkeys(COUNTERS, 0),
+                ),
+            )
+            total["inputs"] += 1
+            total["seconds"] += entry["seconds"]
+            total["peak_rss_bytes"] = max(
+                total["peak_rss_bytes"], entry["peak_rss_bytes"]
+            )
+            for counter in COUNTERS:
+                total[counter] += entry[counter]
+        for total in totals.values():
+            checked = total["valid"] + total["invalid"]
+            total["valid_ratio"] = total["valid"] / checked if checked else None
+        return totals
+
+    def write_json(self, file_path):
+        """Writes the per-input measurements and the per-stage summary as JSON."""
+        with open(file_path, "wb") as f:
+            f.write(
+                codec.dumps(
+                    {"summary": self.summary(), "stages": self.entries}, indent=True
+                )
+            )
+
+    def write_prometheus(self, file_path, prefix="tibwords"):
+        """
+        Writes the per-stage summary in the Prometheus text exposition format, e.g. for the
+        node_exporter textfile collector.
+        """
+        metrics = [
+            ("seconds", "counter", "Wall time spent in the stage."),
+            ("inputs", "counter", "Number of inputs (files, shards) processed."),
+            ("records_in", "counter", "Records read by the stage."),
+            ("records_out", "counter", "Records produced by the stage."),
+            ("valid", "counter", "Valid records."),
+            ("invalid", "counter", "Invalid records."),
+            ("skipped", "counter", "Records dropped by the extractors as unusable."),
+            ("bytes_read", "counter", "Bytes read by the stage."),
+            ("valid_ratio", "gauge", "Share of checked records that are valid."),
+            (
+                "peak_rss_bytes",
+                "gauge",
+                "Peak resident memory while running the stage.",
+            ),
+        ]
+        summary = self.summary()
+        lines = []
+        for name, kind, description in metrics:
+            metric = f"{prefix}_stage_{name}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for stage_name, total in summary.items():
+                if total[name] is not None:
+                    lines.append(f'{metric}{{stage="{stage_name}"}} {total[name]}')
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def write_profile(self):
+        """
+        Writes the profile of profile_stage to profile_dir ('<stage>.prof' for cProfile,
+        '<stage>.html' for pyinstrument) and returns its path, or None if nothing was profiled.
+        """
+        if self._profile is None:
+            return None
+        os.makedirs(self.profile_dir, exist_ok=True)
+        if self.profiler == "pyinstrument":
+            file_path = os.path.join(self.profile_dir, f"{self.profile_stage}.html")
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write(self._profile.output_html())
+        else:
+            file_path = os.path.join(self.profile_dir, f"{self.profile_stage}.prof")
+            self._profile.dump_stats(file_path)
+        return file_path
+
+
+def enable_metrics(**options):
+    """
+    Starts collecting metrics for the stages run from now on and returns the Metrics
+    collector. Options are passed to Metrics.
+    """
+    global _active
+    _active = Metrics(**options)
+    return _active
+
+
+def disable_metrics():
+    """Stops collecting metrics and returns the collector that was active, if any."""
+    global _active
+    metrics, _active = _active, None
+    return metrics
+
+
+def get_metrics():
+    """Returns the active Metrics collector, or None when metrics are disabled."""
+    return _active
+
+
+def current_stage():
+    """
+    Returns the StageMetrics of the innermost stage being measured in this process, also
+    in a worker process, so that code running inside it (e.g. an extractor) can update its
+    counters. Returns None when no stage is being measured.
+    """
+    return _running[-1] if _running else None
+
+
+@contextmanager
+def stage(name, file_path=None):
+    """
+    Measures the enclosed block as stage name when metrics are enabled. Yields a
+    StageMetrics whose counters the caller updates; when metrics are disabled the
+    counters are simply discarded.
+    """
+    if _active is None:
+        yield StageMetrics(name, file_path)
+    else:
+        with _active.stage(name, file_path) as entry:
+            yield entry
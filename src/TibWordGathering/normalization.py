@@ -0,0 +1,212 @@
+import re
+import unicodedata
+from itertools import islice
+
+from TibWordGathering.prefetch import extract
+
+TSHEG = "\u0f0b"
+NON_BREAKING_TSHEG = "\u0f0c"
+# Characters that Unicode discourages, replaced by their decomposition
+DEPRECATED_TIBETAN = {
+    "\u0f77": "\u0fb2\u0f71\u0f80",  # vocalic rr
+    "\u0f79": "\u0fb3\u0f71\u0f80",  # vocalic ll
+}
+# Zero-width spaces and joiners, word joiner, byte order mark and soft hyphen
+ZERO_WIDTH = ["\u200b", "\u200c", "\u200d", "\u2060", "\ufeff", "\u00ad"]
+WHITESPACE = (
+    ["\t", "\n", "\r", "\v", "\f", "\u0085", "\u00a0", "\u1680"]
+    + [chr(code) for code in range(0x2000, 0x200B)]
+    + ["\u2028", "\u2029", "\u202f", "\u205f", "\u3000"]
+)
+
+# Fields are normalized together, joined with a character that no rule changes and that
+# never combines with its neighbours, so it also keeps them apart for Unicode normalization
+SEPARATOR = "\0"
+BATCH_SIZE = 1024  # data points normalized together by iter_normalized
+
+
+class Normalizer:
+    """
+    Normalizes Tibetan text, and the 'source' and 'target' of data points, the same way
+    for every extractor.
+
+    Character replacements are compiled into one table. Text that is already normalized
+    is recognised with one search of a precompiled character class of the table, a few
+    substring searches and a Unicode quick check, all in C (see is_normalized), and is
+    returned as it is. Otherwise each character of the table found in the text is replaced
+    with str.replace: str.translate looks up every character of non-Latin text in the
+    table and is about 10 times slower on Tibetan text, and a regular expression
+    substitution calls back into Python for every match.
+
+    Parameters:
+    form (str): Unicode normalization form ('NFC', 'NFD', ...), or None to keep the text as is.
+    tsheg (bool): Replace the non-breaking tsheg (U+0F0C) with the tsheg (U+0F0B).
+    deprecated (bool): Replace the deprecated vowels U+0F77 and U+0F79 by their decomposition.
+    whitespace (bool): Replace tabs, newlines and other Unicode spaces with a plain space.
+    zero_width (bool): Remove zero-width spaces and joiners, soft hyphens and byte order marks.
+    attach_tsheg (bool): Remove spaces in front of a tsheg, which belongs to the syllable before it.
+    collapse_spaces (bool): Collapse runs of spaces into one and strip leading and trailing spaces.
+    fields (tuple): The fields of a data point that are normalized.
+    """
+
+    def __init__(
+        self,
+        form="NFD",
+        tsheg=True,
+        deprecated=True,
+        whitespace=True,
+        zero_width=True,
+        attach_tsheg=True,
+        collapse_spaces=True,
+        fields=("source", "target"),
+    ):
+        self.options = {
+            "form": form,
+            "tsheg": tsheg,
+            "deprecated": deprecated,
+            "whitespace": whitespace,
+            "zero_width": zero_width,
+            "attach_tsheg": attach_tsheg,
+            "collapse_spaces": collapse_spaces,
+            "fields": tuple(fields),
+        }
+        self.form = form
+        self.attach_tsheg = attach_tsheg
+        self.collapse_spaces = collapse_spaces
+        self.fields = tuple(fields)
+
+        table = {}
+        if tsheg:
+            table[NON_BREAKING_TSHEG] = TSHEG
+        if deprecated:
+            table.update(DEPRECATED_TIBETAN)
+        if whitespace:
+            table.update(dict.fromkeys(WHITESPACE, " "))
+        if zero_width:
+            table.update(dict.fromkeys(ZERO_WIDTH, ""))
+        self.table = table
+        self._replacements = list(table.items())
+        self._characters = None
+        if table:
+            self._characters = re.compile("[" + re.escape("".join(table)) + "]")
+        self._space_before_tsheg = re.compile(" +(?=" + TSHEG + ")")
+        self._spaces = re.compile(" {2,}")
+
+    def __repr__(self):
+        # Stable across runs: used in the cache key of processed files
+        arguments = ", ".join(f"{key}={value!r}" for key, value in self.options.items())
+        return f"Normalizer({arguments})"
+
+    def __eq__(self, other):
+        return isinstance(other, Normalizer) and self.options == other.options
+
+    def is_normalized(self, text):
+        """
+        Returns True if normalize() would return the text unchanged. Checking costs one
+        search of the precompiled character class, a few substring searches and a Unicode
+        quick check, all in C, and is the fast path of normalize().
+        """
+        if self._characters is not None and self._characters.search(text):
+            return False
+        if self.attach_tsheg and " " + TSHEG in text:
+            return False
+        if self.collapse_spaces and (
+            "  " in text or text[:1] == " " or text[-1:] == " "
+        ):
+            return False
+        return self.form is None or unicodedata.is_normalized(self.form, text)
+
+    def normalize(self, text):
+        """Returns the normalized text."""
+        if self.is_normalized(text):
+            return text
+        text = self.replace_characters(text)
+        if self.attach_tsheg and " " + TSHEG in text:
+            text = self._space_before_tsheg.sub("", text)
+        if self.collapse_spaces and (
+            "  " in text or text[:1] == " " or text[-1:] == " "
+        ):
+            text = " ".join([word for word in text.split(" ") if word])
+        # Unicode normalization does not add or remove spaces, so it can run last
+        if self.form is not None and not unicodedata.is_normalized(self.form, text):
+            text = unicodedata.normalize(self.form, text)
+        return text
+
+    def replace_characters(self, text):
+        """Returns the text with the characters of the table replaced."""
+        for character, replacement in self._replacements:
+            if character in text:
+                text = text.replace(character, replacement)
+        return text
+
+    def _normalize_joined(self, text):
+        # Like normalize(), on fields joined with SEPARATOR; returns text itself if unchanged
+        if self._characters is not None and self._characters.search(text):
+            text = self.replace_characters(text)
+        if self.attach_tsheg and " " + TSHEG in text:
+            text = self._space_before_tsheg.sub("", text)
+        if self.collapse_spaces and (
+            "  " in text
+            or " " + SEPARATOR in text
+            or SEPARATOR + " " in text
+            or text[:1] == " "
+            or text[-1:] == " "
+        ):
+            text = self._spaces.sub(" ", text)
+            text = text.replace(" " + SEPARATOR, SEPARATOR)
+            text = text.replace(SEPARATOR + " ", SEPARATOR).strip(" ")
+        if self.form is not None and not unicodedata.is_normalized(self.form, text):
+            text = unicodedata.normalize(self.form, text)
+        return text
+
+    def normalize_data_points(self, data_points):
+        """
+        Normalizes the fields of a list of data points in place, like calling the normalizer
+        on each of them, but with a few passes in C over all their fields at once instead
+        of several Python calls per field. Data points whose fields are missing, are not
+        strings or contain SEPARATOR are normalized one by one.
+        """
+        fields = self.fields
+        values = [
+            data_point.get(field) for data_point in data_points for field in fields
+        ]
+        try:
+            joined = SEPARATOR.join(values)
+        except TypeError:  # a field is missing or not a string
+            joined = None
+        if joined is not None:
+            normalized = self._normalize_joined(joined)
+            if normalized is joined:
+                return data_points
+            values = normalized.split(SEPARATOR)
+            if len(values) == len(fields) * len(data_points):
+                values = iter(values)
+                for data_point in data_points:
+                    for field in fields:
+                        data_point[field] = next(values)
+                return data_points
+        for data_point in data_points:
+            self(data_point)
+        return data_points
+
+    def __call__(self, data_point):
+        """Normalizes the fields of a data point in place and returns it."""
+        for field in self.fields:
+            value = data_point.get(field)
+            if value is not None:
+                data_point[field] = self.normalize(value)
+        return data_point
+
+
+def iter_normalized(iter_func, normalizer, file_path, data=None):
+    """
+    Yields the data points of iter_func(file_path), normalized BATCH_SIZE at a time (see
+    Normalizer.normalize_data_points). Used with functools.partial to normalize the output
+    of any extractor, also in worker processes.
+    """
+    data_points = extract(iter_func, file_path, data)
+    while True:
+        batch = list(islice(data_points, BATCH_SIZE))
+        if not batch:
+            return
+        yield from normalizer.normalize_data_points(batch)
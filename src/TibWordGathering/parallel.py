@@ -0,0 +1,309 @@
+import os
+from collections import deque
+from functools import partial
+
+from TibWordGathering.manifest import (
+    MANIFEST_FILENAME,
+    Manifest,
+    processor_key,
+    shard_paths,
+)
+from TibWordGathering.metrics import Metrics, get_metrics, stage
+from TibWordGathering.normalization import iter_normalized
+from TibWordGathering.prefetch import extract, iter_inputs, read_file
+from TibWordGathering.records import RecordStore, partition_records
+from TibWordGathering.splitting import iter_split
+from TibWordGathering.utils import (
+    RecordWriter,
+    iter_jsonl,
+    save_records,
+    write_data_points,
+)
+
+
+def resolve_workers(workers=None):
+    """Returns the number of worker processes to use; None means one per CPU core."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return max(1, workers)
+
+
+def partition_file(iter_func, file_path, metrics=None, validate=True, data=None):
+    """
+    Parses one file and splits its data points into a RecordStore of valid ones and a
+    RecordStore of invalid ones. With validate=False, every data point is taken as valid.
+    data is the content of the file if it was prefetched (see prefetch.extract).
+
+    With a Metrics collector, reading, parsing and validation are measured as the 'read',
+    'parse' and 'validate' stages of the file: the file is read before it is parsed, unless
+    it was prefetched or is larger than prefetch.PREFETCH_MAX_BYTES, in which case the
+    extractor streams it and reading is part of the 'parse' stage.
+    """
+    if metrics is None:
+        return partition_records(extract(iter_func, file_path, data), validate)
+    if data is None:
+        with metrics.stage("read", file_path) as entry:
+            data = read_file(file_path)
+            entry.bytes_read = 0 if data is None else len(data)
+    with metrics.stage("parse", file_path) as entry:
+        data_points = RecordStore()
+        data_points.extend(extract(iter_func, file_path, data))
+        if data is None:
+            entry.bytes_read = os.path.getsize(file_path)
+        entry.records_out = len(data_points)
+    if not validate:
+        return data_points, RecordStore()
+    with metrics.stage("validate", file_path) as entry:
+        valid_data, invalid_data = partition_records(data_points)
+        entry.records_in = len(data_points)
+        entry.records_out = entry.valid = len(valid_data)
+        entry.invalid = len(invalid_data)
+    return valid_data, invalid_data
+
+
+def _process_chunk(
+    iter_func, file_paths, collect_metrics=False, validate=True, prefetch=0
+):
+    # Runs inside a worker process: parse each file and split its data points.
+    # Metrics measured here are sent back to the parent along with the results.
+    metrics = Metrics() if collect_metrics else None
+    results = [
+        partition_file(iter_func, file_path, metrics, validate, data)
+        for file_path, data in iter_inputs(file_paths, prefetch)
+    ]
+    return results, metrics.entries if metrics is not None else []
+
+
+def imap_files(
+    iter_func, file_paths, workers=None, chunksize=1, validate=True, prefetch=0
+):
+    """
+    Parses files in a process pool and yields one (valid_data, invalid_data) tuple of
+    RecordStores per file, in the same order as file_paths.
+
+    Only a bounded number of chunks is in flight at any time, so results of files that finish
+    early do not pile up while an earlier, slower file is still being parsed.
+
+    Parameters:
+    iter_func (callable): A module-level function that yields the data points of one file.
+    file_paths (list): The files to process.
+    workers (int): Number of worker processes. None uses one per CPU core.
+    chunksize (int): Number of files handed to a worker in one task.
+    validate (bool): Validate the data points; False takes every data point as valid.
+    prefetch (int): Number of threads reading the files of a chunk ahead of parsing them
+        in each worker (see prefetch.prefetch_files); 0 lets the extractor read each file.
+    """
+    file_paths = list(file_paths)
+    chunksize = max(1, chunksize)
+    chunks = [
+        file_paths[i : i + chunksize]  # noqa: E203
+        for i in range(0, len(file_paths), chunksize)
+    ]
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = min(resolve_workers(workers), max(1, len(chunks)))
+    max_pending = workers * 2
+    metrics = get_metrics()
+
+    def results(future):
+        chunk_results, entries = future.result()
+        if metrics is not None:
+            metrics.add(entries)
+        return chunk_results
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: deque = deque()
+        for chunk in chunks:
+            pending.append(
+                executor.submit(
+                    _process_chunk,
+                    iter_func,
+                    chunk,
+                    metrics is not None,
+                    validate,
+                    prefetch,
+                )
+            )
+            if len(pending) >= max_pending:
+                yield from results(pending.popleft())
+        while pending:
+            yield from results(pending.popleft())
+
+
+def iter_file_results(
+    iter_func, file_paths, workers=None, chunksize=1, validate=True, prefetch=0
+):
+    """
+    Yields one (valid_data, invalid_data) tuple per file, in the order of file_paths,
+    using a process pool when more than one worker is requested.
+    """
+    if resolve_workers(workers) == 1:
+        metrics = get_metrics()
+        for file_path, data in iter_inputs(file_paths, prefetch):
+            yield partition_file(iter_func, file_path, metrics, validate, data)
+    else:
+        yield from imap_files(
+            iter_func, file_paths, workers, chunksize, validate, prefetch
+        )
+
+
+def process_files(
+    iter_func,
+    file_paths,
+    valid_output_file,
+    invalid_output_file,
+    workers=None,
+    chunksize=1,
+    lazy_invalid=True,
+    cache_dir=None,
+    validate=True,
+    omit_source=False,
+    normalizer=None,
+    diagnostics=False,
+    prefetch=0,
+    max_length=None,
+):
+    """
+    Processes the given files, in parallel when more than one worker is requested, and streams
+    the results into one valid and one invalid output file. Records are written in the order
+    of file_paths, so the output is the same whatever the number of workers.
+
+    Parameters:
+    iter_func (callable): A module-level function that yields the data points of one file.
+    file_paths (list): The files to process.
+    valid_output_file (str): The path where valid data will be saved.
+    invalid_output_file (str): The path where invalid data will be saved.
+    workers (int): Number of worker processes. None uses one per CPU core, 1 runs in-process.
+    chunksize (int): Number of files handed to a worker in one task.
+    lazy_invalid (bool): Only create the invalid output file if there is invalid data.
+    cache_dir (str): If given, the results of each file are cached in this folder and only
+        new or changed files are processed again (see process_files_incremental).
+    validate (bool): Validate the data points. Pass False for processors whose data points
+        are valid by construction (source built by joining the target words).
+    omit_source (bool): Write records without the 'source' that can be derived from the
+        target (see utils.RecordWriter); the readers of utils restore it.
+    normalizer (Normalizer): If given, normalizes every data point before it is validated
+        (see normalization.Normalizer).
+    diagnostics (bool): Write why each invalid record is invalid, and an error report
+        next to the invalid output file (see utils.RecordWriter).
+    prefetch (int): Number of threads reading files ahead of the parser, to hide the latency
+        of network file systems (see prefetch.prefetch_files). With several workers, each
+        worker reads ahead within its chunk, so use a chunksize above 1. 0 disables it.
+    max_length (int): If given, data points whose source is longer than this many characters
+        are split at shad or word boundaries, after normalization (see splitting.split_record).
+
+    Returns:
+    tuple: The number of valid and invalid records written.
+    """
+    if normalizer is not None:
+        iter_func = partial(iter_normalized, iter_func, normalizer)
+    if max_length is not None:
+        iter_func = partial(iter_split, iter_func, max_length)
+    if cache_dir is not None:
+        return process_files_incremental(
+            iter_func,
+            file_paths,
+            valid_output_file,
+            invalid_output_file,
+            cache_dir,
+            workers=workers,
+            chunksize=chunksize,
+            lazy_invalid=lazy_invalid,
+            validate=validate,
+            omit_source=omit_source,
+            diagnostics=diagnostics,
+            prefetch=prefetch,
+        )
+    with RecordWriter(
+        valid_output_file, omit_source=omit_source
+    ) as valid_writer, RecordWriter(
+        invalid_output_file, lazy=lazy_invalid, diagnose=diagnostics
+    ) as invalid_writer:
+        if resolve_workers(workers) == 1 and get_metrics() is None:
+            for file_path, data in iter_inputs(file_paths, prefetch):
+                write_data_points(
+                    extract(iter_func, file_path, data),
+                    valid_writer,
+                    invalid_writer,
+                    validate,
+                )
+        else:
+            results = iter_file_results(
+                iter_func, file_paths, workers, chunksize, validate, prefetch
+            )
+            for file_path, (valid_data, invalid_data) in zip(file_paths, results):
+                with stage("write", file_path) as entry:
+                    valid_writer.write_all(valid_data)
+                    invalid_writer.write_all(invalid_data)
+                    entry.records_in = entry.records_out = len(valid_data) + len(
+                        invalid_data
+                    )
+        return valid_writer.count, invalid_writer.count
+
+
+def process_files_incremental(
+    iter_func,
+    file_paths,
+    valid_output_file,
+    invalid_output_file,
+    cache_dir,
+    workers=None,
+    chunksize=1,
+    lazy_invalid=True,
+    validate=True,
+    omit_source=False,
+    diagnostics=False,
+    prefetch=0,
+):
+    """
+    Like process_files, but keeps the valid and invalid records of every input file in a
+    JSON Lines shard under cache_dir, together with a manifest of the size, modification time
+    and content hash of each file. On the next run only new or changed files are processed;
+    the shards of the other files are reused. Since every finished file is recorded right away,
+    an interrupted run resumes after the last finished file. Shards of files that are no longer
+    part of file_paths are deleted. Shards are written without the sources that can be
+    derived from the targets.
+
+    Returns:
+    tuple: The number of valid and invalid records written.
+    """
+    file_paths = list(file_paths)
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = Manifest(
+        os.path.join(cache_dir, MANIFEST_FILENAME), processor_key(iter_func)
+    )
+
+    stale_paths = [
+        file_path for file_path in file_paths if manifest.get(file_path) is None
+    ]
+    results = iter_file_results(
+        iter_func, stale_paths, workers, chunksize, validate, prefetch
+    )
+    for file_path, (valid_data, invalid_data) in zip(stale_paths, results):
+        shards = shard_paths(cache_dir, file_path)
+        save_records(valid_data, shards["valid"], omit_source=True)
+        save_records(invalid_data, shards["invalid"], omit_source=True)
+        manifest.record(
+            file_path, shards, valid=len(valid_data), invalid=len(invalid_data)
+        )
+    manifest.compact(keep=file_paths)
+
+    # Assemble the outputs from the shards, in the order of file_paths
+    with RecordWriter(
+        valid_output_file, omit_source=omit_source
+    ) as valid_writer, RecordWriter(
+        invalid_output_file, lazy=lazy_invalid, diagnose=diagnostics
+    ) as invalid_writer:
+        for file_path in file_paths:
+            shards = manifest.get(file_path)["shards"]
+            with stage("write", file_path) as entry:
+                count = valid_writer.count + invalid_writer.count
+                valid_writer.write_all(iter_jsonl(shards["valid"]))
+                invalid_writer.write_all(iter_jsonl(shards["invalid"]))
+                entry.records_in = entry.records_out = (
+                    valid_writer.count + invalid_writer.count - count
+                )
+                entry.bytes_read = sum(
+                    os.path.getsize(path) for path in shards.values()
+                )
+        return valid_writer.count, invalid_writer.count
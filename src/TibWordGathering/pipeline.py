@@ -0,0 +1,462 @@
+"""
+Runs the whole pipeline from one config file as a graph of stages.
+
+The source extractors do not depend on each other and run concurrently, each in its own
+process. combine and lexicon start as soon as every source is done, followed by dedup,
+labels, buckets and export.
+A stage is skipped when its outputs exist and neither its inputs nor its config changed
+since it last ran.
+"""
+import copy
+import hashlib
+import importlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, List, Optional, TypedDict
+
+from TibWordGathering import codec
+from TibWordGathering.metrics import disable_metrics, enable_metrics, get_metrics
+
+# Module and function that extract each source
+SOURCE_FUNCTIONS = {
+    "segpos": ("TibWordGathering.segpos", "process_folder"),
+    "segpos_kang_and_eteng": (
+        "TibWordGathering.segpos_kang_and_eteng",
+        "process_folder",
+    ),
+    "conllu": ("TibWordGathering.conllu_parser", "process_conllu_folder"),
+    "evaluation": ("TibWordGathering.evaluation_tib_word", "process_folder"),
+    "manual": ("TibWordGathering.manual_dataset", "process_data"),
+}
+SOURCES = list(SOURCE_FUNCTIONS)
+
+
+class Stage(TypedDict):
+    """A stage of the pipeline, as built by build_stages."""
+
+    inputs: List[str]
+    outputs: List[str]
+    deps: List[str]
+    options: Dict[str, Any]
+
+
+DEFAULT_CONFIG: Dict[str, Any] = {
+    "state_dir": "data/cache/tibwords",
+    "sources": {
+        "segpos": {
+            "input": "data/input/SegPos",
+            "valid": "data/output/segpos_tib_word/segpos_tib_word_valid_data.json",
+            "invalid": "data/output/segpos_tib_word/segpos_tib_word_invalid_data.json",
+            "cache_dir": "data/cache/segpos_tib_word",
+            # Split records longer than this many characters (see splitting), or None
+            "max_length": None,
+        },
+        "segpos_kang_and_eteng": {
+            "input": "data/input/SegPos-eKangyur-eTengyur",
+            "valid": "data/output/segpos_ekangyur_eTengyur_tib_word/segpos_ekangyur_eTengyur_tib_word_valid_data.json",  # noqa
+            "invalid": "data/output/segpos_ekangyur_eTengyur_tib_word/segpos_ekangyur_eTengyur_tib_word_invalid_data.json",  # noqa
+            "cache_dir": "data/cache/segpos_ekangyur_eTengyur_tib_word",
+            "max_length": None,
+        },
+        "conllu": {
+            "input": "data/input/Conllu",
+            "valid": "data/output/conllu_tib_words/conllu_valid_data.json",
+            "invalid": "data/output/conllu_tib_words/conllu_invalid_data.json",
+            "cache_dir": "data/cache/conllu_tib_words",
+        },
+        "evaluation": {
+            "input": "data/input/Tibetan",
+            "valid": "data/output/evaluate_tib_word/evaluate_valid_data.json",
+            "invalid": "data/output/evaluate_tib_word/evaluate_invalid_data.json",
+            "cache_dir": "data/cache/evaluate_tib_word",
+            "quarantine_dir": "data/quarantine/evaluate_tib_word",
+        },
+        "manual": {
+            "input": "data/input/Manual-dataset/manual_data.json",
+            "valid": "data/output/Manual-dataset/manual_data_valid_data.json",
+            "invalid": "data/output/Manual-dataset/manual_data_invalid_data.json",
+        },
+    },
+    "combine": {
+        "output": "data/output/combined_word_seg_data/combined_word_seg_data.json",
+        "tag_source": False,
+        "index": False,
+    },
+    "dedup": {
+        "output": "data/output/combined_word_seg_data/deduplicated_word_seg_data.json",
+        "near_duplicates": False,
+    },
+    "export": None,
+    # Segmentation label arrays for model training (see labels.write_label_arrays), e.g.
+    # {"output_dir": "data/output/labels", "schemes": ["bmes", "bio"]}, or None
+    "labels": None,
+    # Length-bucketed copies of the dataset (see splitting.write_length_buckets), e.g.
+    # {"output_dir": "data/output/buckets", "bounds": [64, 128, 256, 512]}, or None
+    "buckets": None,
+    # Normalizer options (see normalization.Normalizer) applied to every source, or None;
+    # a source can override them with its own 'normalize' option
+    "normalize": None,
+    "lexicon": {
+        "output_dir": "data/output/lexicon",
+        "cache_dir": "data/cache/lexicon",
+        "bigrams": False,
+        "min_count": 1,
+    },
+}
+
+
+def load_config(config_path=None):
+    """
+    Loads a JSON config file on top of DEFAULT_CONFIG. Sections of the file replace the
+    default sections key by key; a source, dedup, labels, buckets or export set to null
+    is disabled.
+    """
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if config_path is None:
+        return config
+    with open(config_path, "rb") as f:
+        overrides = codec.loads(f.read())
+    for key, value in overrides.items():
+        if key == "sources" and value is not None:
+            for source, options in value.items():
+                if source not in SOURCES:
+                    raise ValueError(f"Unknown source in {config_path}: {source}")
+                if options is None:
+                    config["sources"][source] = None
+                else:
+                    config["sources"][source] = {
+                        **(config["sources"].get(source) or {}),
+                        **options,
+                    }
+        elif isinstance(value, dict) and isinstance(config.get(key), dict):
+            config[key] = {**config[key], **value}
+        else:
+            config[key] = value
+    return config
+
+
+def build_stages(config):
+    """
+    Returns the stages of the pipeline in dependency order, as a dict of
+    name -> Stage.
+    """
+    stages: Dict[str, Stage] = {}
+    combine_inputs: List[str] = []
+    for source in SOURCES:
+        options = config["sources"].get(source)
+        if options is None:
+            continue
+        options = {"normalize": config.get("normalize"), **options}
+        stages[source] = {
+            "inputs": [options["input"]],
+            "outputs": [options["valid"]],
+            "deps": [],
+            "options": options,
+        }
+        combine_inputs.append(options["valid"])
+
+    # The output of the last stage of the chain, once there is one
+    last_output: str = ""
+    last_stage: Optional[str] = None
+    if config.get("combine") is not None and combine_inputs:
+        output = config["combine"]["output"]
+        stages["combine"] = {
+            "inputs": combine_inputs,
+            "outputs": [output],
+            "deps": [source for source in SOURCES if source in stages],
+            "options": config["combine"],
+        }
+        last_output, last_stage = output, "combine"
+    if config.get("dedup") is not None and last_stage is not None:
+        output = config["dedup"]["output"]
+        stages["dedup"] = {
+            "inputs": [last_output],
+            "outputs": [output],
+            "deps": [last_stage],
+            "options": config["dedup"],
+        }
+        last_output, last_stage = output, "dedup"
+    if config.get("lexicon") is not None and combine_inputs:
+        options = config["lexicon"]
+        deps = [source for source in SOURCES if source in stages]
+        # Sources processed with a cache are counted per input file from their shards
+        source_cache_dirs = {
+            source: stages[source]["options"].get("cache_dir") for source in deps
+        }
+        stages["lexicon"] = {
+            "inputs": combine_inputs,
+            "outputs": [os.path.join(options["output_dir"], "lexicon.tsv")],
+            "deps": deps,
+            "options": {**options, "source_cache_dirs": source_cache_dirs},
+        }
+    if config.get("labels") is not None and last_stage is not None:
+        options = config["labels"]
+        stages["labels"] = {
+            "inputs": [last_output],
+            "outputs": [options.get("output_dir", "data/output/labels")],
+            "deps": [last_stage],
+            "options": options,
+        }
+    if config.get("buckets") is not None and last_stage is not None:
+        options = config["buckets"]
+        stages["buckets"] = {
+            "inputs": [last_output],
+            "outputs": [options.get("output_dir", "data/output/buckets")],
+            "deps": [last_stage],
+            "options": options,
+        }
+    if config.get("export") is not None and last_stage is not None:
+        options = config["export"]
+        stages["export"] = {
+            "inputs": [last_output],
+            "outputs": [options.get("shard_dir", "data/output/shards")],
+            "deps": [last_stage],
+            "options": options,
+        }
+    return stages
+
+
+def _iter_files(path):
+    if os.path.isfile(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            yield os.path.join(root, filename)
+
+
+def stage_fingerprint(stage):
+    """
+    Returns a hash of the stage options and of the path, size and modification time of
+    every input file. It changes whenever the stage would produce a different output.
+    """
+    digest = hashlib.sha256(json.dumps(stage["options"], sort_keys=True).encode())
+    for path in stage["inputs"]:
+        for file_path in _iter_files(path):
+            stat = os.stat(file_path)
+            digest.update(f"{file_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def _stamp_path(state_dir, name):
+    return os.path.join(state_dir, f"{name}.stamp")
+
+
+def is_up_to_date(name, stage, state_dir, fingerprint=None):
+    """Returns True if the outputs of the stage exist and were built from the current inputs."""
+    if not all(os.path.exists(path) for path in stage["outputs"]):
+        return False
+    try:
+        with open(_stamp_path(state_dir, name), encoding="utf-8") as f:
+            stamp = f.read().strip()
+    except FileNotFoundError:
+        return False
+    return stamp == (fingerprint or stage_fingerprint(stage))
+
+
+def _makedirs_for(*file_paths):
+    for file_path in file_paths:
+        directory = os.path.dirname(str(file_path))
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+
+def run_stage(name, stage, workers=None, collect_metrics=False):
+    """
+    Runs one stage; called in a separate process by run_pipeline.
+
+    Returns:
+    tuple: The result of the stage function and the metrics entries measured while running it.
+    """
+    if collect_metrics:
+        enable_metrics()
+    options = stage["options"]
+    workers = options.get("workers", workers)
+    if name in SOURCES:
+        _makedirs_for(options["valid"], options["invalid"])
+        module, function = SOURCE_FUNCTIONS[name]
+        process = getattr(importlib.import_module(module), function)
+        normalizer = None
+        if options.get("normalize") is not None:
+            from TibWordGathering.normalization import Normalizer
+
+            normalizer = Normalizer(**options["normalize"])
+        if name == "manual":
+            result = process(
+                options["input"],
+                options["valid"],
+                options["invalid"],
+                normalizer=normalizer,
+                diagnostics=options.get("diagnostics", False),
+            )
+        else:
+            extra = {}
+            if name == "evaluation":
+                extra["quarantine_dir"] = options.get("quarantine_dir")
+            if name in ("segpos", "segpos_kang_and_eteng"):
+                extra["max_length"] = options.get("max_length")
+            result = process(
+                options["input"],
+                options["valid"],
+                options["invalid"],
+                workers=workers,
+                cache_dir=options.get("cache_dir"),
+                omit_source=options.get("omit_source", False),
+                normalizer=normalizer,
+                diagnostics=options.get("diagnostics", False),
+                prefetch=options.get("prefetch", 0),
+                **extra,
+            )
+    elif name == "combine":
+        from TibWordGathering.combine_word_seg import combine_json_files
+
+        _makedirs_for(options["output"])
+        result = combine_json_files(
+            stage["inputs"],
+            options["output"],
+            options.get("tag_source", False),
+            index=options.get("index", False),
+        )
+    elif name == "dedup":
+        from TibWordGathering.deduplication import deduplicate
+
+        _makedirs_for(options["output"])
+        dedup_options = {k: v for k, v in options.items() if k != "output"}
+        result = deduplicate(stage["inputs"][0], options["output"], **dedup_options)
+    elif name == "lexicon":
+        from TibWordGathering.lexicon import build_source_lexicons
+
+        sources = {
+            source: [path] for source, path in zip(stage["deps"], stage["inputs"])
+        }
+        result = build_source_lexicons(
+            sources,
+            options["output_dir"],
+            workers=workers,
+            bigrams=options.get("bigrams", False),
+            cache_dir=options.get("cache_dir"),
+            min_count=options.get("min_count", 1),
+            source_cache_dirs=options.get("source_cache_dirs"),
+        ).records
+    elif name == "labels":
+        from TibWordGathering.labels import export_labels
+
+        result = export_labels(
+            stage["inputs"][0],
+            stage["outputs"][0],
+            options.get("schemes", ("bmes", "bio")),
+        )
+    elif name == "buckets":
+        from TibWordGathering.splitting import bucket_by_length
+
+        bucket_options = {k: v for k, v in options.items() if k != "output_dir"}
+        result = bucket_by_length(
+            stage["inputs"][0], stage["outputs"][0], **bucket_options
+        )
+        print(
+            f"Wrote {sum(result.values())} records to {len(result)} bucket files "
+            f"in {stage['outputs'][0]}"
+        )
+    elif name == "export":
+        from TibWordGathering.export import export_to_hub
+
+        export_options = dict(options)
+        export_options.setdefault("shard_dir", stage["outputs"][0])
+        result = export_to_hub(stage["inputs"][0], **export_options)
+    else:
+        raise ValueError(f"Unknown stage: {name}")
+    metrics = disable_metrics() if collect_metrics else None
+    return result, metrics.entries if metrics is not None else []
+
+
+def run_pipeline(config, stages=None, force=False, dry_run=False, workers=None):
+    """
+    Runs the pipeline described by config. Independent stages run concurrently in separate
+    processes and every stage starts as soon as the stages it depends on are done, so a
+    full rebuild takes about as long as the slowest source plus combine, dedup and export.
+
+    Parameters:
+    config (dict): The pipeline config, see load_config.
+    stages (list): Only run these stages (and consider the others done). None runs all stages.
+    force (bool): Run the stages even if their outputs are up to date.
+    dry_run (bool): Only print which stages would run.
+    workers (int): Worker processes per source stage, unless the source config sets
+        'workers'. None uses one per CPU core divided between the sources.
+
+    Returns:
+    dict: The status of each stage: 'done', 'up to date', 'skipped' or 'failed'.
+    """
+    graph = build_stages(config)
+    state_dir = config["state_dir"]
+    os.makedirs(state_dir, exist_ok=True)
+    selected = set(graph) if stages is None else set(stages)
+    unknown = selected - set(graph)
+    if unknown:
+        raise ValueError(f"Unknown or disabled stages: {', '.join(sorted(unknown))}")
+    if workers is None:
+        sources = sum(name in SOURCES for name in selected)
+        workers = max(1, (os.cpu_count() or 1) // max(1, sources))
+
+    status = {name: "skipped" for name in graph if name not in selected}
+    rebuilt = set()
+    metrics = get_metrics()
+    pending: Dict[Future, str] = {}
+    fingerprints: Dict[str, str] = {}
+    with ProcessPoolExecutor(max_workers=max(1, len(selected))) as executor:
+        while len(status) < len(graph):
+            for name, stage in graph.items():
+                if name in status or name in pending.values():
+                    continue
+                if any(dep not in status for dep in stage["deps"]):
+                    continue
+                if any(status[dep] == "failed" for dep in stage["deps"]):
+                    status[name] = "failed"
+                    print(f"[{name}] not run: a stage it depends on failed")
+                    continue
+                if dry_run:
+                    upstream_rebuilt = any(dep in rebuilt for dep in stage["deps"])
+                    if (
+                        force
+                        or upstream_rebuilt
+                        or not is_up_to_date(name, stage, state_dir)
+                    ):
+                        print(f"[{name}] would run")
+                        rebuilt.add(name)
+                        status[name] = "done"
+                    else:
+                        print(f"[{name}] up to date")
+                        status[name] = "up to date"
+                    continue
+                # Taken before running, so that inputs changed during the run are seen next time
+                fingerprints[name] = stage_fingerprint(stage)
+                if not force and is_up_to_date(
+                    name, stage, state_dir, fingerprints[name]
+                ):
+                    print(f"[{name}] up to date")
+                    status[name] = "up to date"
+                    continue
+                print(f"[{name}] started")
+                future = executor.submit(
+                    run_stage, name, stage, workers, metrics is not None
+                )
+                pending[future] = name
+            if not pending:
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    _, entries = future.result()
+                except Exception as e:
+                    print(f"[{name}] failed: {e}")
+                    status[name] = "failed"
+                    continue
+                if metrics is not None:
+                    metrics.add(entries)
+                with open(_stamp_path(state_dir, name), "w", encoding="utf-8") as f:
+                    f.write(fingerprints[name])
+                print(f"[{name}] done")
+                status[name] = "done"
+    return status
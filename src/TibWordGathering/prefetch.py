@@ -0,0 +1,68 @@
+import os
+from collections import deque
+
+# Larger files are not prefetched: their extractor streams them
+PREFETCH_MAX_BYTES = 16 * 1024 * 1024
+
+
+def read_file(file_path, max_bytes=PREFETCH_MAX_BYTES):
+    """Returns the content of a file, or None if it is larger than max_bytes."""
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size > max_bytes:
+            return None
+        return f.read()
+
+
+def prefetch_files(
+    file_paths, threads=8, max_pending=None, max_bytes=PREFETCH_MAX_BYTES
+):
+    """
+    Reads files in a thread pool ahead of their use and yields one (file_path, data) tuple
+    per file, in the order of file_paths. Reading many small files is dominated by the
+    latency of the file system (especially over NFS); reading several at once in the
+    background overlaps that latency with the parsing of the files already read.
+
+    Parameters:
+    file_paths (list): The files to read.
+    threads (int): Number of reader threads.
+    max_pending (int): Maximum number of files read ahead; defaults to twice the threads.
+    max_bytes (int): Files larger than this are not read: their data is None.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    max_pending = max_pending or 2 * threads
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending: deque = deque()
+        for file_path in file_paths:
+            pending.append(
+                (file_path, executor.submit(read_file, file_path, max_bytes))
+            )
+            if len(pending) >= max_pending:
+                file_path, future = pending.popleft()
+                yield file_path, future.result()
+        while pending:
+            file_path, future = pending.popleft()
+            yield file_path, future.result()
+
+
+def iter_inputs(file_paths, prefetch=0):
+    """
+    Yields one (file_path, data) tuple per file. With prefetch reader threads, data is the
+    content of the file read ahead by prefetch_files; otherwise it is None and the file is
+    read by its extractor.
+    """
+    if prefetch:
+        yield from prefetch_files(file_paths, threads=prefetch)
+    else:
+        for file_path in file_paths:
+            yield file_path, None
+
+
+def extract(iter_func, file_path, data=None):
+    """
+    Calls an extractor on one file. Extractors that accept a 'data' argument parse the
+    prefetched content instead of reading the file again.
+    """
+    if data is None:
+        return iter_func(file_path)
+    return iter_func(file_path, data=data)
@@ -1,12 +1,10 @@
-import pandas as pd
-from datasets import Dataset, DatasetDict
-
-
 def get_data_df(json_file):
     """
     This function reads a JSON file and converts it into a pandas DataFrame.
     The JSON file is expected to contain 'source', 'target', and 'filename' fields.
     """
+    import pandas as pd
+
     # Load JSON data into pandas DataFrame
     df = pd.read_json(json_file)
 
@@ -20,6 +18,8 @@ def push_df_to_hub(train_df):
     """
     This function directly pushes a pandas DataFrame to the Hugging Face Hub.
     """
+    from datasets import Dataset, DatasetDict
+
     # Convert the pandas DataFrame to Hugging Face Dataset
     train_dataset = Dataset.from_pandas(train_df)
 
@@ -34,7 +34,22 @@ def push_df_to_hub(train_df):
     dataset_dict.push_to_hub("Jimpa2000/without_deduplication_combined_word_seg_data")
 
 
-# Usage example
-json_file = "data/output/combined_word_seg_data copy/combined_word_seg_data.json"
-df = get_data_df(json_file)
-push_df_to_hub(df)
+def push_records_to_hub(
+    json_file, repo_id, shard_dir="data/output/shards", dry_run_dir=None
+):
+    """
+    Publishes a JSON or JSON Lines dataset to the Hugging Face Hub without pandas:
+    records are streamed into size-bounded Parquet shards, and each shard is uploaded
+    as soon as it is written. With dry_run_dir, shards are copied there instead.
+    """
+    from TibWordGathering.export import export_to_hub
+
+    return export_to_hub(json_file, repo_id, shard_dir, dry_run_dir=dry_run_dir)
+
+
+if __name__ == "__main__":
+    # Usage example
+    json_file = "data/output/combined_word_seg_data copy/combined_word_seg_data.json"
+    push_records_to_hub(
+        json_file, "Jimpa2000/without_deduplication_combined_word_seg_data"
+    )
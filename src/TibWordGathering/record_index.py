@@ -0,0 +1,143 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, List, Tuple, Union
+
+from TibWordGathering import codec
+from TibWordGathering.utils import is_jsonl_path, restore_source
+
+INDEX_MAGIC = b"TIBIDX01"
+INDEX_SUFFIX = ".idx"
+UINT64 = struct.Struct("<Q")
+HEADER = struct.Struct(
+    "<8sQQQ"
+)  # magic, records, data size, size of the filename ranges
+
+
+def index_path(file_path):
+    """Returns the path of the sidecar index of an output file, e.g. data.json.idx."""
+    return str(file_path) + INDEX_SUFFIX
+
+
+def check_indexable(file_path):
+    """Raises ValueError if file_path is compressed: offsets into it could not be seeked to."""
+    if str(file_path).endswith((".gz", ".zst")):
+        raise ValueError(f"Cannot index the compressed file {file_path}")
+
+
+def write_record_index(offsets, ranges, data_size, file_path):
+    """
+    Writes a record index: a header (the magic bytes, the number of records n, the size of
+    the indexed file and the size of the filename ranges), n + 1 little-endian uint64 byte
+    offsets (where each record starts, then where the last one ends) and the filename
+    ranges as JSON, a list of [filename, first record, record after the last] blocks.
+    """
+    offsets = array("Q", offsets)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    encoded_ranges = codec.dumps(ranges)
+    with open(file_path, "wb") as f:
+        f.write(
+            HEADER.pack(INDEX_MAGIC, len(offsets) - 1, data_size, len(encoded_ranges))
+        )
+        f.write(offsets.tobytes())
+        f.write(encoded_ranges)
+
+
+class RecordIndex:
+    """
+    Random access to the records of an output file written with an index (see
+    utils.RecordWriter): record number n, or all the records of one 'filename', are read
+    by seeking to their byte offsets instead of parsing the whole file. Both files are
+    memory-mapped, so opening even a multi-GB dataset is instant.
+
+    Parameters:
+    file_path (str): The indexed '.json' or '.jsonl' file.
+    index_file (str): Its index; defaults to index_path(file_path).
+
+    Raises:
+    ValueError: If the index is not a record index or does not match the file, e.g. because
+        the file was written again without an index.
+    """
+
+    def __init__(self, file_path, index_file=None):
+        index_file = index_file or index_path(file_path)
+        self.file_path = str(file_path)
+        self.jsonl = is_jsonl_path(file_path)
+        with open(index_file, "rb") as f:
+            index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(index) < HEADER.size or index[: len(INDEX_MAGIC)] != INDEX_MAGIC:
+            index.close()
+            raise ValueError(f"{index_file} is not a record index")
+        _, self._size, data_size, ranges_size = HEADER.unpack_from(index)
+        start = HEADER.size + (self._size + 1) * 8
+        if len(index) != start + ranges_size:
+            index.close()
+            raise ValueError(f"{index_file} is truncated")
+        self._index = index
+        self.ranges: Dict[str, List[Tuple[int, int]]] = {}
+        for filename, first, stop in codec.loads(index[start:]):
+            self.ranges.setdefault(filename, []).append((first, stop))
+
+        # An empty file cannot be mapped, and has no records
+        self._buffer: Union[mmap.mmap, bytes] = b""
+        self._file = open(self.file_path, "rb")
+        if os.fstat(self._file.fileno()).st_size != data_size:
+            self.close()
+            raise ValueError(f"{index_file} does not match {self.file_path}")
+        if data_size:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _offset(self, index):
+        return UINT64.unpack_from(self._index, HEADER.size + index * 8)[0]
+
+    def __len__(self):
+        return self._size
+
+    def _decode(self, line):
+        # Records of a JSON array are followed by ',' (see RecordWriter)
+        line = line.rstrip()
+        if not self.jsonl and line.endswith(b","):
+            line = line[:-1]
+        return restore_source(codec.decode_record(line))
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("record index out of range")
+        start = self._offset(index)
+        return self._decode(self._buffer[start : self._offset(index + 1)])  # noqa: E203
+
+    def records(self, start=0, stop=None):
+        """Yields the records from number start up to (without) number stop, in order."""
+        stop = self._size if stop is None else min(stop, self._size)
+        if start >= stop:
+            return
+        block = self._buffer[self._offset(start) : self._offset(stop)]  # noqa: E203
+        for line in block.split(b"\n"):
+            if line.strip():
+                yield self._decode(line)
+
+    def filenames(self):
+        """Returns the filenames of the records, in order of first appearance."""
+        return list(self.ranges)
+
+    def by_filename(self, filename):
+        """Yields the records of one 'filename', reading only the blocks it occupies."""
+        for first, stop in self.ranges.get(filename, []):
+            yield from self.records(first, stop)
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._index.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
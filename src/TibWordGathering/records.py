@@ -0,0 +1,214 @@
+import sys
+from array import array
+
+from TibWordGathering.utils import is_valid_data_point
+
+TEXT_ENCODING = "utf-16-le"  # 2 bytes per Tibetan character, like a Python str
+CHAR_BYTES = 2
+TIBETAN_BLOCK = 0x0F  # high byte of the Tibetan Unicode block U+0F00-U+0FFF
+# Kinds of target storage
+DERIVED = 0  # target is source with spaces inserted; only the word lengths are kept
+RAW = 1  # target is stored as text
+MISSING = 2  # the record has no target
+TARGET_KIND = 0x03
+PACKED_SOURCE = 0x04  # flag: every source character is in the Tibetan block
+
+
+def _pack_text(text):
+    """
+    Returns (data, packed): text as UTF-16-LE, or as one byte per character (the low byte)
+    when every character is in the Tibetan block, which is the case for most sources.
+    """
+    data = text.encode(TEXT_ENCODING)
+    high = data[1::2]
+    if high.count(TIBETAN_BLOCK) == len(high):
+        return data[0::2], True
+    return data, False
+
+
+def _unpack_text(data, packed):
+    if not packed:
+        return data.decode(TEXT_ENCODING)
+    buffer = bytearray(2 * len(data))
+    buffer[0::2] = data
+    buffer[1::2] = bytes([TIBETAN_BLOCK]) * len(data)
+    return buffer.decode(TEXT_ENCODING)
+
+
+def _encode_lengths(lengths):
+    # Varint encoding: word lengths below 128 characters take a single byte
+    if max(lengths, default=0) < 0x80:
+        return bytes(lengths)
+    data = bytearray()
+    for length in lengths:
+        while length >= 0x80:
+            data.append((length & 0x7F) | 0x80)
+            length >>= 7
+        data.append(length)
+    return data
+
+
+def _decode_lengths(data):
+    if max(data, default=0) < 0x80:
+        return data
+    lengths = []
+    length = shift = 0
+    for byte in data:
+        length |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            lengths.append(length)
+            length = shift = 0
+    return lengths
+
+
+class RecordStore:
+    """
+    A compact, append-only container of records, used instead of a list of dicts to hold
+    many records in memory (and to send them between processes).
+
+    The 'source' texts are kept in one buffer with an offset array, with one byte per
+    character when the text only uses the Tibetan block. A 'target' that is the
+    source with spaces inserted, which is the case for every valid record, is stored as the
+    lengths of its words only; other targets are stored as text. Every other field (such
+    as 'filename') is stored as an index into a table of distinct values, so a file name
+    shared by millions of records is kept once. Values that cannot be interned, such as
+    lists and dicts, are kept as they are.
+
+    Records are returned as new dicts, with keys in the order they were first seen.
+    'source' and 'target' must be strings, except that 'target' may be missing or None.
+    """
+
+    def __init__(self):
+        self._source = bytearray()
+        self._source_offsets = array("Q", [0])
+        self._kinds = bytearray()
+        self._target = bytearray()
+        self._target_offsets = array("Q", [0])
+        self._keys = ["source", "target"]
+        self._labels = {}  # field -> array of indices into self._values[field]
+        self._values = {}  # field -> list of distinct values, None first
+        self._value_ids = {}  # field -> {value: index}
+
+    def __len__(self):
+        return len(self._kinds)
+
+    def append(self, record):
+        source = record["source"]
+        target = record.get("target")
+        data, packed = _pack_text(source)
+        self._source += data
+        self._source_offsets.append(len(self._source))
+        flags = PACKED_SOURCE if packed else 0
+        words = None if target is None else target.split(" ")
+        if words is not None and "".join(words) == source:
+            self._kinds.append(flags | DERIVED)
+            self._target += _encode_lengths([len(word) for word in words])
+        elif target is not None:
+            self._kinds.append(flags | RAW)
+            self._target += target.encode(TEXT_ENCODING)
+        else:
+            self._kinds.append(flags | MISSING)
+        self._target_offsets.append(len(self._target))
+
+        count = len(self._kinds) - 1
+        for key, value in record.items():
+            if key == "source" or key == "target":
+                continue
+            if key not in self._labels:
+                self._keys.append(key)
+                self._labels[key] = array("I", bytes(4 * count))
+                self._values[key] = [None]
+                self._value_ids[key] = {(type(None), None): 0}
+            values = self._values[key]
+            try:
+                # Typed, so that 1, 1.0 and True are kept apart
+                value_key = value if type(value) is str else (type(value), value)
+                value_id = self._value_ids[key].setdefault(value_key, len(values))
+            except TypeError:  # unhashable, such as a list or a dict
+                value_id = len(values)
+            if value_id == len(values):
+                values.append(value)
+            self._labels[key].append(value_id)
+        for labels in self._labels.values():
+            if len(labels) == count:
+                labels.append(0)  # the field is missing from this record
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def _source_text(self, index):
+        start, end = self._source_offsets[index], self._source_offsets[index + 1]
+        packed = self._kinds[index] & PACKED_SOURCE
+        return _unpack_text(self._source[start:end], packed)
+
+    def _target_text(self, index, source):
+        start, end = self._target_offsets[index], self._target_offsets[index + 1]
+        data = self._target[start:end]
+        kind = self._kinds[index] & TARGET_KIND
+        if kind == RAW:
+            return data.decode(TEXT_ENCODING)
+        if kind == MISSING:
+            return None
+        words = []
+        position = 0
+        for length in _decode_lengths(data):
+            words.append(source[position : position + length])  # noqa: E203
+            position += length
+        return " ".join(words)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("record index out of range")
+        source = self._source_text(index)
+        record = {"source": source, "target": self._target_text(index, source)}
+        for key in self._keys[2:]:
+            value = self._values[key][self._labels[key][index]]
+            if value is not None:
+                record[key] = value
+        if record["target"] is None:
+            del record["target"]
+        return record
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def nbytes(self):
+        """Returns the approximate memory used by the stored records, in bytes."""
+        size = (
+            len(self._source)
+            + len(self._target)
+            + len(self._kinds)
+            + (len(self._source_offsets) + len(self._target_offsets)) * 8
+        )
+        for key, labels in self._labels.items():
+            size += len(labels) * labels.itemsize
+            size += sum(
+                len(value) * CHAR_BYTES if type(value) is str else sys.getsizeof(value)
+                for value in self._values[key][1:]
+            )
+        return size
+
+
+def partition_records(data_points, validate=True):
+    """
+    Splits data points into a RecordStore of valid ones and a RecordStore of invalid ones,
+    like utils.partition_data_points but without keeping the dicts. With validate=False,
+    every data point is taken as valid.
+    """
+    valid_data = RecordStore()
+    invalid_data = RecordStore()
+    if not validate:
+        valid_data.extend(data_points)
+        return valid_data, invalid_data
+    for data_point in data_points:
+        if is_valid_data_point(data_point):
+            valid_data.append(data_point)
+        else:
+            invalid_data.append(data_point)
+    return valid_data, invalid_data
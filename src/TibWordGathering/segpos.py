@@ -1,105 +1,103 @@
 import os
-from typing import List
+from functools import partial
+from typing import Iterator, Optional
 
-from TibWordGathering.utils import is_valid_data_point, save_json
+from TibWordGathering.normalization import Normalizer
+from TibWordGathering.parallel import process_files
+from TibWordGathering.segpos_engine import SEGPOS_MARKERS, iter_file_data_points
+from TibWordGathering.utils import list_subfolder_files, partition_data_points
 
 
-def process_file(file_path: str):
+def iter_data_points(
+    file_path: str, use_mmap: bool = False, data: Optional[bytes] = None
+) -> Iterator[dict]:
     """
-    Processes a single text file and returns a list of valid data points.
+    Reads a single text file and yields its data points one at a time.
     Each data point is a dictionary with 'source', 'target', and 'filename' keys.
+    Sentences end at '<utt>' and at page markers such as 'p12'.
 
     Parameters:
     file_path (str): The path to the text file.
+    use_mmap (bool): Memory-map the file and decode it one window at a time.
+    data (bytes): The content of the file, if it was already read (see prefetch).
 
-    Returns:
-    tuple: A tuple containing two lists - valid data and invalid data.
+    Yields:
+    dict: The next data point found in the file.
     """
-    valid_data: List[dict] = []
-    invalid_data: List[dict] = []
-    current_sentence: List[str] = []
-    filename = os.path.basename(file_path)
-
-    with open(file_path, encoding="utf-8") as file:
-        for line in file:
-            line = line.strip()
-            words = line.split()
-
-            for word in words:
-                if word == "<utt>":
-                    if current_sentence:
-                        source = "".join(current_sentence)
-                        target = " ".join(current_sentence)
-                        data_point = {
-                            "source": source,
-                            "target": target,
-                            "filename": filename,
-                        }
-                        if is_valid_data_point(data_point):
-                            valid_data.append(data_point)
-                        else:
-                            invalid_data.append(data_point)
-                        current_sentence = []
-                elif word.startswith("p") and word[1:].isdigit():
-                    # Found a page number within the text
-                    if current_sentence:
-                        # Save the current sentence before changing the page
-                        source = "".join(current_sentence)
-                        target = " ".join(current_sentence)
-                        data_point = {
-                            "source": source,
-                            "target": target,
-                            "filename": filename,
-                        }
-                        if is_valid_data_point(data_point):
-                            valid_data.append(data_point)
-                        else:
-                            invalid_data.append(data_point)
-                    current_sentence = []
-                else:
-                    current_sentence.append(word)
+    return iter_file_data_points(file_path, SEGPOS_MARKERS, use_mmap, data)
 
-    # Handle any remaining sentence
-    if current_sentence:
-        source = "".join(current_sentence)
-        target = " ".join(current_sentence)
-        data_point = {"source": source, "target": target, "filename": filename}
-        if is_valid_data_point(data_point):
-            valid_data.append(data_point)
-        else:
-            invalid_data.append(data_point)
 
-    return valid_data, invalid_data
+def process_file(file_path: str):
+    """
+    Processes a single text file and returns a list of valid data points.
+    Each data point is a dictionary with 'source', 'target', and 'filename' keys.
 
+    Parameters:
+    file_path (str): The path to the text file.
 
-def process_folder(folder_path: str, valid_output_file: str, invalid_output_file: str):
+    Returns:
+    tuple: A tuple containing two lists - valid data and invalid data.
+    """
+    return partition_data_points(iter_data_points(file_path))
+
+
+def process_folder(
+    folder_path: str,
+    valid_output_file: str,
+    invalid_output_file: str,
+    workers: Optional[int] = None,
+    chunksize: int = 1,
+    use_mmap: bool = False,
+    cache_dir: Optional[str] = None,
+    omit_source: bool = False,
+    normalizer: Optional[Normalizer] = None,
+    diagnostics: bool = False,
+    prefetch: int = 0,
+    max_length: Optional[int] = None,
+):
     """
     Processes all text files in the given folder and aggregates the results into two JSON files:
-    one for valid data and one for invalid data.
+    one for valid data and one for invalid data. A '.jsonl' output path (optionally ending in
+    '.gz' or '.zst') writes JSON Lines instead.
 
     Parameters:
     folder_path (str): The path to the folder containing text files.
     valid_output_file (str): The file path where valid data will be saved.
     invalid_output_file (str): The file path where invalid data will be saved.
-    """
-    all_valid_data = []
-    all_invalid_data = []
-
-    for root, dirs, files in os.walk(folder_path):
-        for dir in dirs:
-            for filename in os.listdir(os.path.join(root, dir)):
-                if filename.endswith(".txt"):
-                    file_path = os.path.join(root, dir, filename)
-                    valid_data, invalid_data = process_file(file_path)
-                    all_valid_data.extend(valid_data)
-                    all_invalid_data.extend(invalid_data)
+    workers (int): Number of worker processes. None uses one per CPU core, 1 runs in-process.
+    chunksize (int): Number of files handed to a worker process at a time.
+    use_mmap (bool): Memory-map the input files instead of reading them into memory.
+    cache_dir (str): Folder where per-file results and a manifest are kept, so that a rerun
+        only processes new or changed files.
+    omit_source (bool): Write valid records without their 'source', which the readers in
+        utils derive from the target.
+    normalizer (Normalizer): Normalizes the source and target of every data point.
+    diagnostics (bool): Write why each invalid data point is invalid, and an error report.
+    prefetch (int): Number of threads reading files ahead of the parser (0: none).
+    max_length (int): Split data points whose source is longer than this many characters,
+        e.g. pages without '<utt>' markers, at shad or word boundaries.
 
-    # Save all valid data into one JSON file
-    save_json(all_valid_data, valid_output_file)
-
-    # Save all invalid data into another JSON file
-    if all_invalid_data:
-        save_json(all_invalid_data, invalid_output_file)
+    Returns:
+    tuple: The number of valid and invalid data points written.
+    """
+    file_paths = list_subfolder_files(folder_path, ".txt")
+    return process_files(
+        partial(iter_data_points, use_mmap=use_mmap),
+        file_paths,
+        valid_output_file,
+        invalid_output_file,
+        workers=workers,
+        chunksize=chunksize,
+        cache_dir=cache_dir,
+        # source is built from the target words, so every data point is valid,
+        # unless normalization changed one of them
+        validate=normalizer is not None,
+        omit_source=omit_source,
+        normalizer=normalizer,
+        diagnostics=diagnostics,
+        prefetch=prefetch,
+        max_length=max_length,
+    )
 
 
 if __name__ == "__main__":
@@ -111,4 +109,9 @@ if __name__ == "__main__":
     # Ensure the parent directories exist
     os.makedirs(os.path.dirname(valid_output_file), exist_ok=True)
     os.makedirs(os.path.dirname(invalid_output_file), exist_ok=True)
-    process_folder(folder_path, valid_output_file, invalid_output_file)
+    process_folder(
+        folder_path,
+        valid_output_file,
+        invalid_output_file,
+        cache_dir="data/cache/segpos_tib_word",
+    )
@@ -0,0 +1,191 @@
+import mmap
+import os
+import re
+from typing import Iterator, List, Optional, Sequence
+
+# Markers found in SegPos-style corpora. A marker is always a whole whitespace-separated token.
+UTT_MARKER = r"<utt>"  # end of an utterance
+PAGE_MARKER = r"p[0-9]+"  # page number, e.g. p12
+LINE_MARKER = r"ln[0-9]+"  # line number, e.g. ln3
+
+# Size of the pieces a file is parsed in, in characters (text) or bytes (buffers)
+WINDOW_SIZE = 1 << 20
+
+
+class MarkerTable:
+    """
+    Precompiled marker table for one corpus format.
+
+    Break markers end the current sentence and skip markers are dropped; both are only
+    recognised when they make up a whole whitespace-separated token. Text is processed a
+    whole buffer at a time with a few passes in C: the spacing is normalised first, so that
+    every token is surrounded by single spaces, then literal markers such as '<utt>' are
+    replaced with str.replace and the others with one regex per kind of marker, whose
+    leading space lets the regex engine skip ahead to its literal prefix.
+
+    Parameters:
+    break_markers (list): Regex patterns of the tokens that end a sentence.
+    skip_markers (list): Regex patterns of the tokens that are removed from the text.
+    """
+
+    def __init__(self, break_markers: Sequence[str], skip_markers: Sequence[str] = ()):
+        self.break_markers = list(break_markers)
+        self.skip_markers = list(skip_markers)
+        self.break_literals, self.break_pattern = self._compile(self.break_markers)
+        self.skip_literals, self.skip_pattern = self._compile(self.skip_markers)
+
+    @staticmethod
+    def _compile(markers):
+        # Markers without regex syntax are replaced as plain strings, being much faster
+        literals = [f" {marker} " for marker in markers if re.escape(marker) == marker]
+        patterns = [marker for marker in markers if re.escape(marker) != marker]
+        if not patterns:
+            return literals, None
+        return literals, re.compile(" (?:" + "|".join(patterns) + ")(?= )")
+
+    def split_sentences(self, text: str) -> str:
+        """
+        Returns the sentences of a text separated by newlines, with their words separated by
+        single spaces. Consecutive break markers give empty sentences, and the last sentence
+        is the one that was not ended by a break marker (it may be empty too).
+        """
+        text = " " + text.replace("\n", " ")
+        if text[-1] != " ":
+            # Windows end with a newline, which must not leave a double space to remove
+            text += " "
+        if not text.isprintable():
+            # Tabs, carriage returns or other Unicode spaces
+            text = f" {' '.join(text.split())} "
+        while "  " in text:
+            text = text.replace("  ", " ")
+        for literal in self.skip_literals:
+            # Twice, as a replaced marker cannot also provide the space of the next one
+            text = text.replace(literal, " ").replace(literal, " ")
+        if self.skip_pattern is not None:
+            text = self.skip_pattern.sub("", text)
+        for literal in self.break_literals:
+            text = text.replace(literal, " \n ").replace(literal, " \n ")
+        if self.break_pattern is not None:
+            text = self.break_pattern.sub(" \n", text)
+        return text.replace("\n ", "\n").replace(" \n", "\n").strip(" ")
+
+
+SEGPOS_MARKERS = MarkerTable([UTT_MARKER, PAGE_MARKER])
+KANGYUR_TENGYUR_MARKERS = MarkerTable([UTT_MARKER, PAGE_MARKER], [LINE_MARKER])
+
+
+def _iter_window_bounds(buffer, newline, window_size):
+    # Cuts a buffer into windows that end after a newline, so that no word is cut
+    start, length = 0, len(buffer)
+    while start < length:
+        end = start + window_size
+        if end < length:
+            cut = buffer.rfind(newline, start, end)
+            end = cut + 1 if cut >= 0 else buffer.find(newline, end) + 1 or length
+        else:
+            end = length
+        yield start, end
+        start = end
+
+
+def _iter_text_windows(text, window_size=WINDOW_SIZE):
+    for start, end in _iter_window_bounds(text, "\n", window_size):
+        yield text[start:end]
+
+
+def _iter_buffer_windows(buffer, window_size=WINDOW_SIZE):
+    # Decodes a UTF-8 buffer one window at a time; a newline never cuts a UTF-8 sequence
+    view = memoryview(buffer)
+    try:
+        for start, end in _iter_window_bounds(buffer, b"\n", window_size):
+            yield str(view[start:end], "utf-8")
+    finally:
+        view.release()
+
+
+def _iter_mapped_file_windows(file_path, window_size=WINDOW_SIZE):
+    with open(file_path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return  # empty files cannot be memory-mapped
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield from _iter_buffer_windows(buffer, window_size)
+
+
+def _iter_sentence_blocks(windows, markers):
+    # Yields blocks of newline-separated sentences (see MarkerTable.split_sentences), where
+    # the sentence left open at the end of a window is completed by the next windows
+    pending: List[str] = []
+    for window in windows:
+        block = markers.split_sentences(window)
+        start = 0
+        if pending:
+            start = block.find("\n") + 1
+            if not start:
+                if block:
+                    pending.append(block)
+                continue
+            if start > 1:
+                pending.append(block[: start - 1])
+            yield " ".join(pending)
+            pending = []
+        end = block.rfind("\n")
+        if end >= start:
+            yield block[start:end]
+        last = block[end + 1 :]  # noqa: E203
+        if last:
+            pending.append(last)
+    if pending:
+        yield " ".join(pending)
+
+
+def iter_targets(
+    text: str, markers: MarkerTable, window_size: int = WINDOW_SIZE
+) -> Iterator[str]:
+    """
+    Splits a text buffer into sentences at the break markers and yields each non-empty
+    sentence with its words separated by single spaces.
+
+    Parameters:
+    text (str): The text to split, usually the content of a whole file.
+    markers (MarkerTable): The markers of the corpus format.
+    window_size (int): The number of characters parsed at a time.
+    """
+    for block in _iter_sentence_blocks(_iter_text_windows(text, window_size), markers):
+        for target in block.split("\n"):
+            if target:
+                yield target
+
+
+def iter_file_data_points(
+    file_path: str,
+    markers: MarkerTable,
+    use_mmap: bool = False,
+    data: Optional[bytes] = None,
+) -> Iterator[dict]:
+    """
+    Reads a SegPos-style text file and yields one data point per sentence.
+    Each data point is a dictionary with 'source', 'target', and 'filename' keys.
+
+    Parameters:
+    file_path (str): The path to the text file.
+    markers (MarkerTable): The markers of the corpus format.
+    use_mmap (bool): Memory-map the file and decode it one window at a time instead of
+        reading and decoding the whole file, so that memory use does not grow with the
+        size of the file.
+    data (bytes): The content of the file, if it was already read (see prefetch).
+    """
+    filename = os.path.basename(file_path)
+    if data is not None:
+        windows = _iter_buffer_windows(data)
+    elif use_mmap:
+        windows = _iter_mapped_file_windows(file_path)
+    else:
+        with open(file_path, "rb") as file:
+            windows = _iter_buffer_windows(file.read())
+    for block in _iter_sentence_blocks(windows, markers):
+        # Same as make_data_point(target.split(" "), filename) for every sentence
+        targets = block.split("\n")
+        sources = block.replace(" ", "").split("\n")
+        for source, target in zip(sources, targets):
+            if target:
+                yield {"source": source, "target": target, "filename": filename}
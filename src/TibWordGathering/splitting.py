@@ -0,0 +1,139 @@
+import bisect
+import os
+from itertools import accumulate
+
+from TibWordGathering.metrics import stage
+from TibWordGathering.prefetch import extract
+from TibWordGathering.utils import RecordWriter, derive_source, iter_records
+
+SHAD = "།"  # U+0F0D, ends a sentence or clause
+LENGTH_BUCKETS = [32, 64, 128, 256, 512]
+
+
+def _last_clause_end(tokens, start, end):
+    # A clause ends after a token ending with a shad that is not followed by another shad
+    for index in range(end, start, -1):
+        if tokens[index - 1].endswith(SHAD) and not tokens[index].startswith(SHAD):
+            return index
+    return end
+
+
+def split_tokens(tokens, max_length):
+    """
+    Splits a list of tokens into pieces whose joined length is at most max_length
+    characters. A piece ends at the last clause end (shad) that fits in the budget, else at
+    the last token that fits. Tokens are never cut, so that their boundaries stay true word
+    boundaries (which are always syllable boundaries); a token longer than max_length
+    becomes a piece of its own.
+
+    Returns:
+    list: The pieces, each a list of tokens.
+    """
+    offsets = list(accumulate(map(len, tokens), initial=0))  # length of tokens[:i]
+    pieces = []
+    start = 0
+    while start < len(tokens):
+        end = bisect.bisect_right(offsets, offsets[start] + max_length) - 1
+        if end == len(tokens):
+            pieces.append(tokens[start:])
+            break
+        if end == start:
+            end = start + 1
+        else:
+            end = _last_clause_end(tokens, start, end)
+        pieces.append(tokens[start:end])
+        start = end
+    return pieces
+
+
+def split_record(record, max_length):
+    """
+    Splits a record whose source is longer than max_length characters into several records
+    (see split_tokens), each with the same other fields and with its source and target
+    still aligned. Records whose source is not their target without spaces, and so cannot
+    be split consistently, are returned as they are.
+
+    Returns:
+    list: The records.
+    """
+    source = record["source"]
+    if len(source) <= max_length:
+        return [record]
+    target = record["target"]
+    if source != derive_source(target):
+        return [record]
+    tokens = [token for token in target.split(" ") if token]
+    return [
+        {**record, "source": "".join(piece), "target": " ".join(piece)}
+        for piece in split_tokens(tokens, max_length)
+    ]
+
+
+def iter_split(iter_func, max_length, file_path, data=None):
+    """
+    Yields the data points of iter_func(file_path), with the over-long ones split (see
+    split_record). Used with functools.partial to split the output of any extractor, also
+    in worker processes.
+    """
+    for data_point in extract(iter_func, file_path, data):
+        if len(data_point["source"]) <= max_length:
+            yield data_point
+        else:
+            yield from split_record(data_point, max_length)
+
+
+def bucket_path(output_dir, bound, prefix="bucket", extension=".jsonl"):
+    """Returns the file of the bucket of records up to `bound` characters (None: longer)."""
+    name = "longer" if bound is None else f"{bound:05d}"
+    return os.path.join(output_dir, f"{prefix}_{name}{extension}")
+
+
+def write_length_buckets(
+    records, output_dir, bounds=LENGTH_BUCKETS, prefix="bucket", extension=".jsonl"
+):
+    """
+    Writes records into one file per length bucket, so that training batches drawn from one
+    bucket need little padding. A record goes to the first bucket whose bound is at least
+    the length of its source; records longer than the last bound go to a 'longer' bucket.
+    Records keep their order within a bucket, and files are only created for buckets that
+    receive records.
+
+    Parameters:
+    records (iterable): The records to write, e.g. utils.iter_records(json_file).
+    output_dir (str): The folder of the bucket files.
+    bounds (list): The maximum source length of each bucket, in characters.
+    prefix (str): Bucket file name prefix.
+    extension (str): '.jsonl' or '.json', optionally followed by '.gz' or '.zst'.
+
+    Returns:
+    dict: The number of records written to each bucket file.
+    """
+    bounds = sorted(bounds)
+    os.makedirs(output_dir, exist_ok=True)
+    writers = [
+        RecordWriter(bucket_path(output_dir, bound, prefix, extension), lazy=True)
+        for bound in [*bounds, None]
+    ]
+    try:
+        with stage("buckets", output_dir) as entry:
+            for record in records:
+                writers[bisect.bisect_left(bounds, len(record["source"]))].write(record)
+                entry.records_in += 1
+            entry.records_out = entry.records_in
+    finally:
+        for writer in writers:
+            writer.close()
+    return {writer.file_path: writer.count for writer in writers if writer.count}
+
+
+def bucket_by_length(json_file, output_dir, **bucket_options):
+    """Writes the records of a JSON or JSON Lines dataset into length buckets."""
+    return write_length_buckets(iter_records(json_file), output_dir, **bucket_options)
+
+
+if __name__ == "__main__":
+    json_file = "data/output/combined_word_seg_data/deduplicated_word_seg_data.json"
+    output_dir = "data/output/buckets"
+    counts = bucket_by_length(json_file, output_dir)
+    for file_path, count in counts.items():
+        print(f"Wrote {count} records to {file_path}")
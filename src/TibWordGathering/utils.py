@@ -1,4 +1,14 @@
+import gzip
+import io
 import json
+import os
+from array import array
+from itertools import islice
+from typing import Any, Dict, Optional
+
+from TibWordGathering import codec
+
+ERROR_CONTEXT = 10  # characters shown on each side of the first mismatch
 
 
 # Function to calculate Manhattan distance between two strings
@@ -14,21 +24,512 @@ def manhattan_distance(str1, str2):
 
 # Function to validate if the source and target match after removing spaces
 def is_valid_data_point(data_point):
-    # Remove spaces from both source and target
+    source = data_point["source"]
+    target = data_point["target"]
+    source_spaces = source.count(" ")
+    target_spaces = target.count(" ")
+
+    # Check if lengths are equal after space removal, without building new strings
+    if len(source) - source_spaces != len(target) - target_spaces:
+        return False
+
+    # Only strings that actually contain spaces need a space-free copy;
+    # the comparison itself runs in C instead of a per-character Python loop
+    if source_spaces:
+        source = source.replace(" ", "")
+    if target_spaces:
+        target = target.replace(" ", "")
+    return source == target
+
+
+def _common_prefix_length(str1, str2):
+    # Binary search on slice comparisons, which run in C
+    low, high = 0, min(len(str1), len(str2))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if str1[:middle] == str2[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def diagnose_data_point(data_point, context=ERROR_CONTEXT):
+    """
+    Explains why a data point is invalid. Meant to be called only for data points that
+    failed is_valid_data_point, so that validation itself stays as fast as before.
+
+    Returns:
+    dict: None for a valid data point. Otherwise 'error' (the kind of mismatch: 'empty' if
+    one side is empty, 'length' if the lengths differ, 'char' if only characters differ),
+    'error_offset' (the first differing character, not counting spaces) and 'error_source'
+    and 'error_target' (up to `context` characters on each side of it, without spaces).
+    """
     source = data_point["source"].replace(" ", "")
     target = data_point["target"].replace(" ", "")
+    if source == target:
+        return None
+    if not source or not target:
+        kind = "empty"
+    elif len(source) != len(target):
+        kind = "length"
+    else:
+        kind = "char"
+    offset = _common_prefix_length(source, target)
+    start = max(0, offset - context)
+    return {
+        "error": kind,
+        "error_offset": offset,
+        "error_source": source[start : offset + context],  # noqa: E203
+        "error_target": target[start : offset + context],  # noqa: E203
+    }
+
+
+def error_report_path(file_path):
+    """Returns the path of the error report written next to an invalid records file."""
+    name = str(file_path)
+    for suffix in (".gz", ".zst", ".jsonl", ".json"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    return name + "_errors.json"
+
+
+def validate_data_points(data_points):
+    """
+    Validates a list of data points at once and returns a list of booleans,
+    one per data point, in the same order.
+    """
+    validate = is_valid_data_point
+    return [validate(data_point) for data_point in data_points]
+
+
+def save_json(data, file_path, indent=False):
+    """Saves data as JSON, compact unless indent is True (see codec)."""
+    with open(file_path, "wb") as f:
+        f.write(codec.dumps(data, indent))
+
+
+def open_binary(file_path, mode="rb"):
+    """
+    Opens a file in binary mode, transparently (de)compressing it when the name ends
+    with '.gz' (gzip) or '.zst' (zstandard, requires the optional 'zstandard' package).
+    """
+    file_path = str(file_path)
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, mode)
+    if file_path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                "Reading or writing '.zst' files requires the 'zstandard' package"
+            )
+        return zstandard.open(file_path, mode)
+    return open(file_path, mode)
+
+
+def is_jsonl_path(file_path):
+    """Returns True if the file name (ignoring a compression suffix) ends with '.jsonl'."""
+    name = str(file_path)
+    for suffix in (".gz", ".zst"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    return name.endswith(".jsonl")
+
+
+def derive_source(target):
+    """Returns the source text of a target, i.e. the target without its spaces."""
+    return target.replace(" ", "")
+
+
+def compact_record(record):
+    """
+    Returns the record without its 'source' when the source can be derived from the
+    target (see derive_source), otherwise the record itself.
+    """
+    target = record.get("target")
+    if target is None or record.get("source") != derive_source(target):
+        return record
+    return {key: value for key, value in record.items() if key != "source"}
+
+
+def restore_source(record):
+    """Adds the 'source' derived from the target back to a record written without it."""
+    if "source" in record or "target" not in record:
+        return record
+    return {"source": derive_source(record["target"]), **record}
+
+
+class RecordWriter:
+    """
+    Streams records to disk one at a time so that peak memory does not depend on the
+    size of the corpus.
+
+    The output format is picked from the file name: '.jsonl' writes one JSON object
+    per line, anything else writes a JSON array with one record per line, which is
+    still readable with json.load. Both can be compressed with '.gz' or '.zst'.
+
+    Parameters:
+    file_path (str): The path to the output file.
+    lazy (bool): If True, the file is only created once the first record is written.
+    omit_source (bool): Leave out the 'source' of records whose source is their target
+        without spaces; the readers of this module derive it again (see compact_record).
+    diagnose (bool): Add to every invalid record why it is invalid (see diagnose_data_point)
+        and, when closing, write the number of errors of each kind per file to an error
+        report next to the output (see error_report_path).
+    index (bool): When closing, write a sidecar index of the byte offset of every record
+        and of the block of records of every 'filename', for record_index.RecordIndex.
+        Compressed files cannot be indexed.
+    """
+
+    def __init__(
+        self, file_path, lazy=False, omit_source=False, diagnose=False, index=False
+    ):
+        self.file_path = file_path
+        self.omit_source = omit_source
+        self.diagnose = diagnose
+        self.errors: Dict[str, Dict[str, int]] = {}  # filename -> {kind: count}
+        self.jsonl = is_jsonl_path(file_path)
+        self.count = 0
+        self._file: Any = None  # a file, or a gzip or zstd stream (see open_binary)
+        self._offsets: Optional[array] = None
+        if index:
+            from TibWordGathering.record_index import check_indexable
+
+            check_indexable(file_path)
+            self._offsets = array("Q")
+            self._ranges = []  # [filename, first record, record after the last]
+            self._position = 0
+        if not lazy:
+            self._open()
+
+    def _open(self):
+        self._file = open_binary(self.file_path, "wb")
+        if not self.jsonl:
+            self._file.write(b"[")
+            self._position = 1
+
+    def write(self, record):
+        if self._file is None:
+            self._open()
+        if self.omit_source:
+            record = compact_record(record)
+        if self.diagnose:
+            diagnostics = diagnose_data_point(record)
+            if diagnostics is not None:
+                record = {**record, **diagnostics}
+                counts = self.errors.setdefault(record.get("filename", ""), {})
+                counts[record["error"]] = counts.get(record["error"], 0) + 1
+        line = codec.dumps(record)
+        if self.jsonl:
+            data = line + b"\n"
+        else:
+            data = (b",\n" if self.count else b"\n") + line
+        self._file.write(data)
+        if self._offsets is not None:
+            self._index_record(
+                self._offsets, record.get("filename"), len(data), len(line)
+            )
+        self.count += 1
+
+    def _index_record(self, offsets, filename, size, line_size):
+        # A JSON array's separator comes before the record, a JSON Lines newline after it
+        if self.jsonl:
+            offsets.append(self._position)
+        else:
+            offsets.append(self._position + size - line_size)
+        self._position += size
+        if self._ranges and self._ranges[-1][0] == filename:
+            self._ranges[-1][2] += 1
+        else:
+            self._ranges.append([filename, self.count, self.count + 1])
 
-    # Check if lengths are equal after space removal
-    if len(source) != len(target):
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        if self._file is None:
+            return
+        end = b"" if self.jsonl else b"\n]\n" if self.count else b"]\n"
+        self._file.write(end)
+        self._file.close()
+        self._file = None
+        if self.diagnose:
+            self.write_error_report(error_report_path(self.file_path))
+        if self._offsets is not None:
+            from TibWordGathering.record_index import index_path, write_record_index
+
+            self._offsets.append(self._position)
+            write_record_index(
+                self._offsets,
+                self._ranges,
+                self._position + len(end),
+                index_path(self.file_path),
+            )
+
+    def write_error_report(self, file_path):
+        """Writes the number of errors of each kind, in total and per file, as JSON."""
+        total: Dict[str, int] = {}
+        for counts in self.errors.values():
+            for kind, count in counts.items():
+                total[kind] = total.get(kind, 0) + count
+        save_json({"total": total, "files": self.errors}, file_path, indent=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def save_records(records, file_path, omit_source=False, diagnose=False, index=False):
+    """
+    Streams an iterable of records into a JSON or JSON Lines file and returns the
+    number of records written.
+    """
+    with RecordWriter(
+        file_path, omit_source=omit_source, diagnose=diagnose, index=index
+    ) as writer:
+        writer.write_all(records)
+    return writer.count
+
+
+def _iter_binary_lines(f, head=b"", chunk_size=1 << 20):
+    # Splits a binary stream into lines, for every file object that has read()
+    rest = b""
+    chunk = head or f.read(chunk_size)
+    while chunk:
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        yield from lines
+        chunk = f.read(chunk_size)
+    if rest:
+        yield rest
+
+
+def iter_jsonl(file_path):
+    """Yields the records of a (possibly compressed) JSON Lines file one by one."""
+    decode_record = codec.decode_record
+    with open_binary(file_path) as f:
+        for line in _iter_binary_lines(f):
+            line = line.strip()
+            if line:
+                yield restore_source(decode_record(line))
+
+
+def is_json_records_path(file_path):
+    """Returns True for '.json' and '.jsonl' files, optionally compressed with '.gz' or '.zst'."""
+    name = str(file_path)
+    for suffix in (".gz", ".zst"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    return name.endswith(".json") or name.endswith(".jsonl")
+
+
+def _is_record_per_line(head):
+    # RecordWriter output: '[', then one record per line, each but the last ending with ','.
+    # Only the first line is checked: iter_json_array falls back to the json parser at the
+    # first line that is not a whole record.
+    if not head.startswith(b"[\n{"):
         return False
+    end = head.find(b"\n", 2)
+    return end != -1 and head[2:end].rstrip(b"\r ,").endswith(b"}")
+
+
+def iter_json_array(file_path, chunk_size=1 << 20):
+    """
+    Yields the records of a (possibly compressed) JSON array file one by one, reading the
+    file in chunks instead of loading the whole array with json.load.
+
+    Arrays written by RecordWriter, with one record per line, are decoded line by line
+    with the codec; other layouts (e.g. indented JSON) go through the slower json parser.
+    So does the rest of an array whose records turn out to span several lines.
+    """
+    count = 0
+    with open_binary(file_path) as f:
+        head = f.read(chunk_size)
+        if _is_record_per_line(head):
+            decode_record = codec.decode_record
+            lines = _iter_binary_lines(f, head, chunk_size)
+            next(lines)  # '['
+            for line in lines:
+                line = line.strip()
+                if line == b"]":
+                    return
+                if line.endswith(b","):
+                    line = line[:-1]
+                try:
+                    record = decode_record(line)
+                except ValueError:
+                    # Not a whole record: the first line of a record never parses by itself
+                    # when the record spans several lines, so the records yielded so far
+                    # are the first ones of the array
+                    break
+                yield restore_source(record)
+                count += 1
+            else:
+                raise ValueError(f"{file_path} ends before the end of its JSON array")
+    yield from islice(_iter_json_array_stream(file_path, chunk_size), count, None)
+
+
+def _iter_json_array_stream(file_path, chunk_size):
+    decoder = json.JSONDecoder()
+    with open_binary(file_path) as f:
+        reader = io.TextIOWrapper(f, encoding="utf-8")
+        buffer = ""
+        position = 0
+        eof = False
+
+        def refill():
+            nonlocal buffer, position, eof
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                eof = True
+            buffer = buffer[position:] + chunk
+            position = 0
+
+        def next_char():
+            # Skips whitespace and returns the next character, or "" at the end of the file
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n":
+                    position += 1
+                if position < len(buffer) or eof:
+                    return buffer[position : position + 1]  # noqa: E203
+                refill()
+
+        if next_char() != "[":
+            raise ValueError(f"{file_path} does not contain a JSON array")
+        position += 1
+        expect_item = True
+        while True:
+            char = next_char()
+            if char == "]":
+                return
+            if not expect_item:
+                if char != ",":
+                    raise ValueError(f"Expected ',' or ']' in {file_path}")
+                position += 1
+                next_char()
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    refill()  # the item continues in the next chunk
+                    continue
+                if end == len(buffer) and not eof:
+                    refill()  # a number or literal might continue in the next chunk
+                    continue
+                break
+            position = end
+            expect_item = False
+            yield restore_source(item)
+
+
+def iter_records(file_path):
+    """
+    Yields the records of a JSON array or JSON Lines file (optionally compressed)
+    one by one, without loading the whole file.
+    """
+    if is_jsonl_path(file_path):
+        return iter_jsonl(file_path)
+    return iter_json_array(file_path)
+
+
+def make_data_point(words, filename):
+    """
+    Builds a data point from a list of words: 'source' is the words joined without
+    spaces and 'target' is the words separated by spaces.
+    """
+    source = "".join(words)
+    target = " ".join(words)
+    return {"source": source, "target": target, "filename": filename}
+
+
+def write_data_points(data_points, valid_writer, invalid_writer, validate=True):
+    """
+    Validates data points as they are produced and routes each one to the valid or
+    invalid writer. Returns a tuple with the number of valid and invalid data points.
+    With validate=False, every data point is taken as valid.
+    """
+    if not validate:
+        count = valid_writer.count
+        valid_writer.write_all(data_points)
+        return valid_writer.count - count, 0
+    valid_count = 0
+    invalid_count = 0
+    for data_point in data_points:
+        if is_valid_data_point(data_point):
+            valid_writer.write(data_point)
+            valid_count += 1
+        else:
+            invalid_writer.write(data_point)
+            invalid_count += 1
+    return valid_count, invalid_count
+
+
+def partition_data_points(data_points):
+    """
+    Splits data points into a list of valid ones and a list of invalid ones.
+    """
+    data_points = list(data_points)
+    valid_data = []
+    invalid_data = []
+    for data_point, is_valid in zip(data_points, validate_data_points(data_points)):
+        if is_valid:
+            valid_data.append(data_point)
+        else:
+            invalid_data.append(data_point)
+    return valid_data, invalid_data
+
+
+def walk_files(folder_path, extension, min_depth=0):
+    """
+    Returns the sorted paths of the files with the given extension in folder_path and in its
+    sub-folders at any depth, with one os.scandir call per folder. The file types come from
+    the directory listing, so files are not stat-ed one by one. Symbolic links to folders
+    are followed, but no folder is visited twice.
+
+    Parameters:
+    folder_path (str): The folder to walk.
+    extension (str): The end of the file names to keep.
+    min_depth (int): Skip files less than this many folders below folder_path
+        (1 skips the files directly inside folder_path).
+    """
+    file_paths = []
+    visited = set()
+    folders = [(str(folder_path), 0)]
+    while folders:
+        folder, depth = folders.pop()
+        stat = os.stat(folder)
+        if (stat.st_dev, stat.st_ino) in visited:
+            continue
+        visited.add((stat.st_dev, stat.st_ino))
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    folders.append((entry.path, depth + 1))
+                elif depth >= min_depth and entry.name.endswith(extension):
+                    file_paths.append(entry.path)
+    return sorted(file_paths)
 
-    # Calculate Manhattan distance between source and target
-    distance = manhattan_distance(source, target)
 
-    # Return True if the distance is 0, meaning the strings are identical
-    return distance == 0
+def list_subfolder_files(folder_path, extension):
+    """
+    Returns the sorted paths of all files with the given extension found in the
+    sub-folders (at any depth) of folder_path. Files directly inside folder_path are skipped.
+    """
+    return walk_files(folder_path, extension, min_depth=1)
 
 
-def save_json(data, file_path):
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def list_folder_files(folder_path, extension):
+    """Returns the sorted paths of the files with the given extension directly inside folder_path."""
+    with os.scandir(folder_path) as entries:
+        return sorted(
+            entry.path
+            for entry in entries
+            if entry.name.endswith(extension) and not entry.is_dir()
+        )
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from TibWordGathering import codec
+from TibWordGathering.utils import iter_json_array, iter_jsonl, save_records
+
+RECORDS = [
+    {
+        "source": "བཀྲ་ཤིས་བདེ་ལེགས།",
+        "target": "བཀྲ་ཤིས་ བདེ་ལེགས།",
+        "filename": "a.txt",
+    },
+    {"source": 'ཀ"\\', "target": 'ཀ"\\', "filename": "b.txt", "error": None},
+]
+
+
+def available_backends():
+    backends = []
+    for name in codec.BACKENDS:
+        try:
+            codec.use_backend(name)
+        except ImportError:
+            continue
+        backends.append(name)
+    codec.use_backend()
+    return backends
+
+
+@pytest.fixture(params=available_backends())
+def backend(request):
+    codec.use_backend(request.param)
+    yield request.param
+    codec.use_backend()
+
+
+def test_backends_write_the_same_bytes(backend):
+    expected = json.dumps(RECORDS, ensure_ascii=False, separators=(",", ":"))
+    assert codec.dumps(RECORDS) == expected.encode("utf-8")
+    assert json.loads(codec.dumps(RECORDS, indent=True)) == RECORDS
+    assert codec.loads(codec.dumps(RECORDS)) == RECORDS
+
+
+def test_decode_record(backend):
+    assert codec.decode_record(codec.dumps(RECORDS[0])) == RECORDS[0]
+    with pytest.raises(ValueError):
+        codec.decode_record(b'["not", "a", "record"]')
+    with pytest.raises(ValueError):
+        codec.decode_record(b'{"source": 1, "target": "a"}')
+    with pytest.raises(ValueError):
+        codec.decode_record(b'{"source": "a"')
+
+
+def test_records_round_trip(tmp_path, backend):
+    for name, iter_records in [
+        ("data.json", iter_json_array),
+        ("data.jsonl", iter_jsonl),
+    ]:
+        file_path = tmp_path / name
+        save_records(RECORDS, file_path)
+        assert list(iter_records(file_path)) == RECORDS
+
+
+def test_json_array_layouts(tmp_path):
+    # Indented or single-line arrays are not one record per line: they take the slow path
+    for indent in [2, None]:
+        file_path = tmp_path / "data.json"
+        file_path.write_text(
+            json.dumps(RECORDS, ensure_ascii=False, indent=indent), encoding="utf-8"
+        )
+        assert list(iter_json_array(file_path, chunk_size=16)) == RECORDS
+    file_path.write_text("[\n]\n", encoding="utf-8")
+    assert list(iter_json_array(file_path)) == []
+    # A record-per-line array cut short by an interrupted run
+    save_records(RECORDS, file_path)
+    file_path.write_bytes(file_path.read_bytes()[:-3])
+    with pytest.raises(ValueError):
+        list(iter_json_array(file_path))
+
+
+def test_json_array_multi_line_records(tmp_path):
+    # The first line of a record ends with a nested '}', like a record per line would
+    file_path = tmp_path / "data.json"
+    lines = [
+        '{"source": "ཀ", "target": "ཀ", "meta": {"page": 1},',
+        ' "filename": "a.txt"},',
+        '{"source": "ཁ", "target": "ཁ", "filename": "b.txt"}',
+    ]
+    expected = json.loads("[" + "".join(lines) + "]")
+    file_path.write_text("[\n" + "\n".join(lines) + "\n]\n", encoding="utf-8")
+    assert list(iter_json_array(file_path, chunk_size=16)) == expected
+    # A multi-line record after records that were decoded line by line
+    lines = [json.dumps(RECORDS[0], ensure_ascii=False) + ","] + lines
+    file_path.write_text("[\n" + "\n".join(lines) + "\n]\n", encoding="utf-8")
+    assert list(iter_json_array(file_path)) == [RECORDS[0]] + expected
@@ -0,0 +1,37 @@
+import json
+
+from TibWordGathering.combine_word_seg import combine_json_files
+from TibWordGathering.utils import iter_json_array, iter_records, save_records
+
+
+def test_iter_json_array_small_chunks():
+    """
+    Reading a JSON array in tiny chunks must give the same items as json.load.
+    """
+    input_file = "tests/data/expected/segpos.json"
+    with open(input_file, encoding="utf-8") as f:
+        expected = json.load(f)
+    assert list(iter_json_array(input_file, chunk_size=7)) == expected
+
+
+def test_combine_json_files_streams_and_tags(tmp_path):
+    """
+    JSON and JSON Lines sources are combined in order, tagged with their corpus and counted.
+    """
+    json_source = "tests/data/expected/conllu.json"
+    jsonl_source = tmp_path / "evaluate_tib_word" / "evaluate_valid_data.jsonl.gz"
+    jsonl_source.parent.mkdir()
+    save_records(iter_json_array("tests/data/expected/evaluate.json"), jsonl_source)
+    output_file = tmp_path / "combined.jsonl"
+
+    counts = combine_json_files(
+        [json_source, str(jsonl_source), "README.md"], output_file, tag_source=True
+    )
+
+    with open(json_source, encoding="utf-8") as f:
+        json_records = json.load(f)
+    combined = list(iter_records(output_file))
+    assert counts == {json_source: len(json_records), str(jsonl_source): 4}
+    assert len(combined) == len(json_records) + 4
+    assert combined[0] == dict(json_records[0], corpus="expected")
+    assert combined[-1]["corpus"] == "evaluate_tib_word"
@@ -1,7 +1,14 @@
 import json
+import os
+from collections import Counter
 from pathlib import Path
 
-from TibWordGathering.conllu_parser import process_conllu_file
+from TibWordGathering.conllu_parser import (
+    iter_conllu_file,
+    process_conllu_file,
+    process_conllu_folder,
+)
+from TibWordGathering.metrics import disable_metrics, enable_metrics
 
 
 def test_conllu_parser():
@@ -38,3 +45,60 @@ def test_conllu_parser():
     assert (
         valid_data_json_format == expected_data
     ), f"Mismatch between processed data and expected data.\nProcessed: {valid_data_json_format}\nExpected: {expected_data}"  # noqa
+
+
+def test_conllu_parser_lean_matches_parse_incr():
+    input_file_path = "tests/data/conllu_sample/conllu.conllu"
+    lean = list(iter_conllu_file(input_file_path))
+    parsed = list(iter_conllu_file(input_file_path, lean=False))
+    assert lean == parsed
+    assert len(lean) == 4
+
+
+def test_conllu_parser_skips_sentences_without_text(tmp_path):
+    conllu_file = tmp_path / "missing_text.conllu"
+    conllu_file.write_text(
+        "# text = ཀ་ཁ།\n1\tཀ་\n2\tཁ།\n\n"
+        "# sent_id = 2\n1\tག་\n\n"
+        "# text = ང་\n1\n\n",
+        encoding="utf-8",
+    )
+    for lean in (True, False):
+        errors = Counter()
+        data_points = list(iter_conllu_file(conllu_file, lean=lean, errors=errors))
+        assert [dp["source"] for dp in data_points] == ["ཀ་ཁ།"]
+        assert data_points[0]["target"] == "ཀ་ ཁ།"
+        assert errors["missing '# text'"] == 1
+
+
+def test_conllu_skipped_sentences_metrics(tmp_path):
+    """
+    Skipped sentences are added to the 'skipped' counter of the parse stage of their file,
+    also when the files are parsed in worker processes.
+    """
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    (input_dir / "a.conllu").write_text(
+        "# text = ཀ་ཁ།\n1\tཀ་\n2\tཁ།\n\n# sent_id = 2\n1\tག་\n\n# text = ང་\n1\n\n",
+        encoding="utf-8",
+    )
+    (input_dir / "b.conllu").write_text("# sent_id = 3\n1\tཅ་\n\n", encoding="utf-8")
+    for workers in (1, 2):
+        metrics = enable_metrics()
+        try:
+            valid, invalid = process_conllu_folder(
+                input_dir,
+                tmp_path / "valid.jsonl",
+                tmp_path / "invalid.jsonl",
+                workers=workers,
+            )
+        finally:
+            disable_metrics()
+        assert (valid, invalid) == (1, 0)
+        skipped = {
+            os.path.basename(entry["file"]): entry["skipped"]
+            for entry in metrics.entries
+            if entry["stage"] == "parse"
+        }
+        assert skipped == {"a.conllu": 2, "b.conllu": 1}
+        assert metrics.summary()["validate"]["skipped"] == 0
@@ -0,0 +1,90 @@
+import codecs
+import json
+
+import pytest
+
+from TibWordGathering.decoding import (
+    CHUNK_SIZE,
+    check_decoding,
+    detect_encoding,
+    iter_lines,
+)
+from TibWordGathering.evaluation_tib_word import (
+    process_folder,
+    read_and_process_tibetan_data,
+)
+from TibWordGathering.utils import iter_records
+
+SAMPLE = "tests/data/evaluate_tibetan_sample/Tibetan_labeled_2.5w.txt"
+
+
+def test_detect_encoding():
+    text = "བཀྲ་ཤིས་/བདེ་ལེགས།/\n" * 10
+    assert detect_encoding(text.encode("utf-8")) == "utf-8"
+    assert detect_encoding(codecs.BOM_UTF8 + text.encode("utf-8")) == "utf-8-sig"
+    assert detect_encoding(text.encode("utf-16")) == "utf-16"
+    assert detect_encoding(text.encode("utf-32")) == "utf-32"
+    assert detect_encoding(text.encode("utf-16-le")) == "utf-16-le"
+    assert detect_encoding(text.encode("utf-16-be")) == "utf-16-be"
+    # A sample cut in the middle of a character
+    assert detect_encoding(text.encode("utf-8")[:-1]) == "utf-8"
+    assert detect_encoding(b"\xc3\x28" * 10) is None
+
+
+def test_iter_lines_decodes_in_chunks(tmp_path):
+    with open(SAMPLE, encoding="utf-16") as f:
+        text = f.read()
+    for encoding in ["utf-16", "utf-16-be", "utf-8"]:
+        file_path = tmp_path / "sample.txt"
+        file_path.write_bytes(text.encode(encoding))
+        # Chunks much smaller than the file and not aligned on characters
+        lines = list(iter_lines(file_path, chunk_size=1001))
+        assert lines == text.split("\n")[: len(lines)]
+        assert "\n".join(lines) == text.rstrip("\n")
+
+
+def test_check_decoding(tmp_path):
+    text = "བཀྲ་ཤིས་/བདེ་ལེགས།/\n" * 100
+    file_path = tmp_path / "sample.txt"
+    file_path.write_bytes(text.encode("utf-16"))
+    assert check_decoding(file_path, chunk_size=7) == "utf-16"
+    data = text.encode("utf-8") + b"\xc3\x28"
+    assert check_decoding(None, "utf-8", data=data[:-2]) == "utf-8"
+    with pytest.raises(UnicodeError):
+        check_decoding(None, data=data, chunk_size=7)
+
+
+def test_process_folder_detects_encodings_and_quarantines(tmp_path):
+    with open(SAMPLE, encoding="utf-16") as f:
+        text = f.read()
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    (input_dir / "a.txt").write_bytes(text.encode("utf-16"))
+    (input_dir / "b.txt").write_bytes(text.encode("utf-8"))
+    (input_dir / "c.txt").write_bytes(b"\xc3\x28" * 100)
+    # Decodes for more than a chunk before an invalid byte: none of its lines are kept
+    valid_start = text.encode("utf-8") * (CHUNK_SIZE // len(text.encode("utf-8")) + 1)
+    (input_dir / "d.txt").write_bytes(valid_start + b"\xc3\x28")
+    valid_file = tmp_path / "valid.jsonl"
+    quarantine_dir = tmp_path / "quarantine"
+
+    valid, invalid = process_folder(
+        str(input_dir),
+        valid_file,
+        tmp_path / "invalid.jsonl",
+        workers=1,
+        quarantine_dir=str(quarantine_dir),
+    )
+
+    expected, _ = read_and_process_tibetan_data(SAMPLE)
+    records = list(iter_records(valid_file))
+    assert [record["source"] for record in records] == [
+        record["source"] for record in expected
+    ] * 2
+    assert (quarantine_dir / "c.txt").exists()
+    with open(quarantine_dir / "quarantine.jsonl", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert [entry["file"] for entry in entries] == [
+        str(input_dir / "c.txt"),
+        str(input_dir / "d.txt"),
+    ]
@@ -0,0 +1,89 @@
+import unicodedata
+
+from TibWordGathering import deduplication
+from TibWordGathering.deduplication import (
+    MinHashLSH,
+    deduplicate,
+    find_exact_duplicates,
+)
+from TibWordGathering.utils import iter_records, save_records
+
+SENTENCE = "བཅོམ་ལྡན་འདས་ཤཱཀྱ་སེང་གེ་ལ་ཕྱག་འཚལ་ལོ་དེ་བཞིན་གཤེགས་པ་དགྲ་བཅོམ་པ་ཡང་དག་པར་རྫོགས་པའི་སངས་རྒྱས།"
+
+
+def make_records(sources):
+    return [{"source": s, "target": s, "filename": "a.txt"} for s in sources]
+
+
+def test_find_exact_duplicates_in_memory_and_spilled():
+    """
+    Exact duplicates ignore whitespace, keep the first occurrence, and are found the same
+    way whether the hashes fit in memory or are spilled to disk.
+    """
+    records = make_records(["ཀ་ཁ", "ག", "ཀ་ ཁ", "ང", "ག", "ཀ་ཁ", "ཅ"])
+    assert list(find_exact_duplicates(records)) == [2, 4, 5]
+    assert list(find_exact_duplicates(records, memory_budget_mb=0)) == [2, 4, 5]
+
+
+def test_find_exact_duplicates_spills_duplicate_indices(tmp_path, monkeypatch):
+    """
+    With many duplicates, the indices are spilled in sorted runs as well, yielded in order,
+    and every spilled file is removed.
+    """
+    sources = [str(number % 7) for number in range(50)] + ["a", "b", "a", "c", "b"]
+    records = make_records(sources)
+    expected = [
+        index for index, source in enumerate(sources) if source in sources[:index]
+    ]
+    # Room for 3 entries: hashes and duplicates are spilled many times
+    monkeypatch.setattr(deduplication, "SET_ENTRY_BYTES", 1024 * 1024 // 3)
+    assert list(find_exact_duplicates(records, 1, tmp_path)) == expected
+    monkeypatch.setattr(deduplication, "SET_ENTRY_BYTES", 1024 * 1024 // 20)
+    assert list(find_exact_duplicates(records, 1, tmp_path)) == expected
+    assert not list(tmp_path.iterdir())
+
+
+def test_find_exact_duplicates_normalizes_sources():
+    """
+    Sources are normalized before they are compared: a precomposed vowel and its
+    decomposition, or a zero-width space, do not make a different source.
+    """
+    composed = "ཀ\u0f73་ཁ"  # KA + vowel sign II
+    decomposed = unicodedata.normalize("NFD", composed)
+    assert decomposed != composed
+    records = make_records([composed, decomposed, "ཀ\u0f73་\u200bཁ", "ཀ་ཁ"])
+    assert list(find_exact_duplicates(records)) == [1, 2]
+
+
+def test_minhash_estimates_jaccard_similarity():
+    """The share of equal signature values estimates the Jaccard similarity of the shingles."""
+    lsh = MinHashLSH(num_perm=256, bands=16, shingle_size=1)
+    syllables = [f"ཀ{index}" for index in range(200)]
+    first = "་".join(syllables[:150])
+    second = "་".join(syllables[50:])  # 100 shared syllables of 200: similarity 0.5
+    similarity = lsh.similarity(lsh.signature(first), lsh.signature(second))
+    assert abs(similarity - 0.5) < 0.1
+
+
+def test_deduplicate_near_duplicates(tmp_path):
+    """
+    With near_duplicates, a sentence that differs from an earlier one by a single syllable
+    is removed too.
+    """
+    near_duplicate = SENTENCE.replace("ཤཱཀྱ", "ཤཱཀ")
+    input_file = tmp_path / "combined.jsonl"
+    save_records(make_records([SENTENCE, SENTENCE, near_duplicate, "ཀ་ཁ"]), input_file)
+
+    stats = deduplicate(input_file, tmp_path / "exact.jsonl")
+    assert stats == {
+        "records": 4,
+        "exact_duplicates": 1,
+        "near_duplicates": 0,
+        "kept": 3,
+    }
+
+    output_file = tmp_path / "near.json"
+    # The shingle sets have a Jaccard similarity of 0.76
+    stats = deduplicate(input_file, output_file, near_duplicates=True, threshold=0.6)
+    assert stats["near_duplicates"] == 1
+    assert [r["source"] for r in iter_records(output_file)] == [SENTENCE, "ཀ་ཁ"]
@@ -1,7 +1,10 @@
 import json
 
-from TibWordGathering.evaluation_tib_word import read_and_process_tibetan_data
-from TibWordGathering.utils import save_json
+from TibWordGathering.evaluation_tib_word import (
+    process_folder,
+    read_and_process_tibetan_data,
+)
+from TibWordGathering.utils import iter_records, save_json
 
 
 def test_evaluate_tib_word():
@@ -23,7 +26,7 @@ def test_evaluate_tib_word():
     valid_data_json_format = [
         {"source": item["source"], "target": item["target"]} for item in valid_data
     ]
-    save_json(valid_data, valid_output_path)
+    save_json(valid_data, valid_output_path, indent=True)
     # Load the expected data from the expected JSON output file
     with open(output_file_path, encoding="utf-8") as expected_output_file:
         expected_data = json.load(expected_output_file)
@@ -35,5 +38,29 @@ def test_evaluate_tib_word():
     print("Test passed: The source and target fields match the expected output.")
 
 
+def test_evaluate_process_folder_skips_validation(tmp_path):
+    """
+    Evaluation records are valid by construction: skipping validation must give the same
+    output as validating them, also when the sources are left out of the file.
+    """
+    valid_data, invalid_data = read_and_process_tibetan_data(
+        "tests/data/evaluate_tibetan_sample/Tibetan_labeled_2.5w.txt"
+    )
+    assert invalid_data == []
+
+    valid_output_file = tmp_path / "valid.jsonl"
+    invalid_output_file = tmp_path / "invalid.jsonl"
+    counts = process_folder(
+        "tests/data/evaluate_tibetan_sample",
+        valid_output_file,
+        invalid_output_file,
+        workers=1,
+        omit_source=True,
+    )
+    assert counts == (len(valid_data), 0)
+    assert list(iter_records(valid_output_file)) == valid_data
+    assert not invalid_output_file.exists()
+
+
 if __name__ == "__main__":
     test_evaluate_tib_word()
@@ -0,0 +1,32 @@
+import pytest
+
+from TibWordGathering.export import publish_shards, write_shards
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def test_write_and_publish_shards_dry_run(tmp_path):
+    """
+    Records are split into size-bounded shards and copied to the dry-run folder with the
+    repository layout, without reaching the Hub.
+    """
+    records = (
+        {"source": f"ཀ{i}", "target": f"ཀ {i}", "filename": "a.txt"} for i in range(25)
+    )
+    shards = write_shards(
+        records, tmp_path / "shards", max_records_per_shard=10, batch_size=4
+    )
+    published = publish_shards(shards, dry_run_dir=tmp_path / "hub")
+
+    assert published == [
+        "data/train-00000.parquet",
+        "data/train-00001.parquet",
+        "data/train-00002.parquet",
+    ]
+    tables = [pq.read_table(tmp_path / "hub" / path) for path in published]
+    assert [table.num_rows for table in tables] == [10, 10, 5]
+    assert tables[2].to_pylist()[-1] == {
+        "source": "ཀ24",
+        "target": "ཀ 24",
+        "filename": "a.txt",
+    }
@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+HEAVY_MODULES = ["pandas", "datasets", "conllu", "pyarrow", "huggingface_hub"]
+
+
+def test_modules_import_without_heavy_dependencies(tmp_path):
+    """
+    Importing the package modules must not do any work or pull in the heavy libraries;
+    they are only loaded by the code paths that use them.
+    """
+    modules = [
+        "combine_word_seg",
+        "conllu_parser",
+        "deduplication",
+        "evaluation_tib_word",
+        "export",
+        "manual_dataset",
+        "parallel",
+        "pushing_data_to_hugging_hub",
+        "segpos",
+        "segpos_kang_and_eteng",
+    ]
+    code = (
+        "import sys\n"
+        + "".join(f"import TibWordGathering.{module}\n" for module in modules)
+        + f"print([m for m in {HEAVY_MODULES!r} if m in sys.modules])\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=tmp_path,  # nothing may be read or written relative to the working directory
+        env={"PYTHONPATH": ":".join(sys.path)},
+    )
+    assert result.stdout == "[]\n"
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from TibWordGathering.labels import NpyWriter, open_npy, write_label_arrays
+
+RECORDS = [
+    {"source": "ཀཁག", "target": "ཀཁ ག"},
+    {"source": "", "target": ""},
+    {"source": "ངཅཆཇ།", "target": "ངཅཆཇ །"},
+]
+
+
+def test_write_label_arrays(tmp_path):
+    metadata = write_label_arrays(RECORDS, tmp_path)
+
+    assert metadata["records"] == 3 and metadata["tokens"] == 4
+    text = open_npy(tmp_path / "text.npy")
+    assert "".join(map(chr, text)) == "ཀཁགངཅཆཇ།"
+    assert open_npy(tmp_path / "boundaries.npy").tolist() == [0, 2, 3, 7, 8]
+    assert open_npy(tmp_path / "labels_bmes.npy").tolist() == [0, 2, 3, 0, 1, 1, 2, 3]
+    assert open_npy(tmp_path / "labels_bio.npy").tolist() == [0, 1, 0, 0, 1, 1, 1, 0]
+    # Record n spans text[offsets[n][0]:offsets[n + 1][0]]
+    offsets = open_npy(tmp_path / "offsets.npy")
+    assert offsets.shape == (4, 2)
+    assert offsets.tolist() == [[0, 0], [3, 2], [3, 2], [8, 4]]
+    with open(tmp_path / "labels.json", encoding="utf-8") as f:
+        assert json.load(f) == metadata
+
+    with pytest.raises(ValueError):
+        write_label_arrays(RECORDS, tmp_path, schemes=["bilou"])
+
+
+def test_write_label_arrays_closes_writers_on_error(tmp_path):
+    def records():
+        yield RECORDS[0]
+        raise RuntimeError("broken input")
+
+    with pytest.raises(RuntimeError):
+        write_label_arrays(records(), tmp_path)
+    # The headers were filled in with the shapes of what had been written
+    assert "".join(map(chr, open_npy(tmp_path / "text.npy"))) == "ཀཁག"
+    assert open_npy(tmp_path / "labels_bio.npy").tolist() == [0, 1, 0]
+
+
+def test_npy_header_is_readable_by_numpy(tmp_path):
+    np = pytest.importorskip("numpy")
+    with NpyWriter(tmp_path / "offsets.npy", "<i8", columns=2) as writer:
+        writer.write((1).to_bytes(8, "little") * 6)
+    array = np.load(tmp_path / "offsets.npy", mmap_mode="r")
+    assert array.shape == (3, 2) and array.dtype == np.int64 and array.sum() == 6
@@ -0,0 +1,121 @@
+import shutil
+from collections import Counter
+
+from TibWordGathering.lexicon import (
+    Lexicon,
+    LexiconIndex,
+    build_lexicon,
+    build_source_lexicons,
+    write_lexicon,
+)
+from TibWordGathering.segpos import iter_data_points, process_folder
+from TibWordGathering.utils import save_records
+
+
+def test_lexicon_counts_merge_and_lookup(tmp_path):
+    records = list(iter_data_points("tests/data/segpos_sample/segpos.txt"))
+    expected = Counter(
+        token for record in records for token in record["target"].split()
+    )
+
+    # Counting two halves separately and merging them gives the counts of the whole
+    half = len(records) // 2
+    first, second = tmp_path / "first.jsonl", tmp_path / "second.jsonl"
+    save_records(records[:half], first)
+    save_records(records[half:], second)
+    lexicon = build_lexicon([first, second], workers=2, bigrams=True)
+    assert lexicon.tokens == expected
+    assert lexicon.records == len(records)
+    assert sum(lexicon.bigrams.values()) == sum(
+        len(record["target"].split()) - 1 for record in records
+    )
+
+    tsv_path, binary_path, _ = write_lexicon(lexicon, tmp_path / "lexicon")
+    with open(tsv_path, encoding="utf-8") as f:
+        header, top = f.readline(), f.readline()
+    assert header == "token\tcount\tfiles\n"
+    token, count, files = top.rstrip("\n").split("\t")
+    assert int(count) == max(expected.values()) == expected[token]
+    # The file of the records was counted in two parts
+    assert int(files) == 2
+
+    with LexiconIndex(binary_path) as index:
+        assert len(index) == len(expected)
+        assert all(index[token] == count for token, count in expected.items())
+        assert index.get("not a token") == 0
+        assert "not a token" not in index
+        assert dict(index.items()) == dict(expected)
+
+
+def test_build_lexicon_reuses_cached_counts(tmp_path):
+    records = [
+        {"source": "ཀཁ", "target": "ཀ ཁ", "filename": "a.txt"},
+        {"source": "ཀ", "target": "ཀ", "filename": "b.txt"},
+    ]
+    file_path = tmp_path / "valid.jsonl"
+    save_records(records, file_path)
+    cache_dir = tmp_path / "cache"
+
+    lexicon = build_lexicon([file_path], workers=1, cache_dir=cache_dir)
+    assert lexicon.tokens == {"ཀ": 2, "ཁ": 1}
+    assert lexicon.files == {"ཀ": 2, "ཁ": 1}
+
+    # Cached partial counts are loaded instead of reading the file again
+    saved = Lexicon.load(next(cache_dir.glob("*.counts.json")))
+    assert saved.tokens == lexicon.tokens
+    assert (
+        build_lexicon([file_path], workers=1, cache_dir=cache_dir).tokens
+        == lexicon.tokens
+    )
+
+    save_records(records[:1], file_path)
+    assert build_lexicon([file_path], workers=1, cache_dir=cache_dir).tokens == {
+        "ཀ": 1,
+        "ཁ": 1,
+    }
+
+
+def test_build_source_lexicons_counts_cached_sources_per_input_file(tmp_path):
+    input_dir = tmp_path / "input"
+    volume_dir = input_dir / "volume"
+    volume_dir.mkdir(parents=True)
+    for name in ["a.txt", "b.txt"]:
+        shutil.copy("tests/data/segpos_sample/segpos.txt", volume_dir / name)
+    valid_file = tmp_path / "valid.jsonl"
+    source_cache = tmp_path / "cache" / "segpos"
+
+    def build():
+        process_folder(
+            str(input_dir),
+            valid_file,
+            tmp_path / "invalid.jsonl",
+            workers=1,
+            cache_dir=str(source_cache),
+        )
+        return build_source_lexicons(
+            {"segpos": [valid_file]},
+            tmp_path / "lexicon",
+            workers=2,
+            cache_dir=tmp_path / "cache" / "lexicon",
+            source_cache_dirs={"segpos": str(source_cache)},
+        )
+
+    # Counting the shards of the input files gives the counts of the output
+    lexicon = build()
+    expected = build_lexicon([valid_file], workers=1)
+    assert lexicon.tokens == expected.tokens
+    assert lexicon.files == expected.files
+    assert lexicon.records == expected.records > 0
+    counts = sorted((tmp_path / "cache" / "lexicon" / "segpos").glob("*.counts.json"))
+    assert [path.name.split("-")[0] for path in counts] == ["a", "b"]
+
+    # Only the changed input file is counted again
+    mtimes = [path.stat().st_mtime_ns for path in counts]
+    (volume_dir / "b.txt").write_text("ཀ་ ཁ <utt>", encoding="utf-8")
+    lexicon = build()
+    assert lexicon.tokens == build_lexicon([valid_file], workers=1).tokens
+    assert [path.stat().st_mtime_ns for path in counts] == [
+        mtimes[0],
+        counts[1].stat().st_mtime_ns,
+    ]
+    assert counts[1].stat().st_mtime_ns != mtimes[1]
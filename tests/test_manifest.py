@@ -0,0 +1,61 @@
+import os
+import shutil
+
+from TibWordGathering.parallel import process_files
+from TibWordGathering.segpos_kang_and_eteng import iter_data_points
+from TibWordGathering.utils import iter_jsonl
+
+processed_files = []
+
+
+def tracking_iter_data_points(file_path):
+    processed_files.append(os.path.basename(file_path))
+    return iter_data_points(file_path)
+
+
+def test_incremental_processing_only_reprocesses_changed_files(tmp_path):
+    """
+    A rerun with a cache folder must reuse the results of unchanged files, reprocess
+    changed or new files, forget removed files, and still write the complete output.
+    """
+    sample_file = (
+        "tests/data/segpos_kangyur_and_eTengyur_sample/segpos_kangyur_and_eTengyur.txt"
+    )
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    file_paths = []
+    for name in ["a.txt", "b.txt", "c.txt"]:
+        shutil.copy(sample_file, input_dir / name)
+        file_paths.append(str(input_dir / name))
+    cache_dir = str(tmp_path / "cache")
+    valid_output_file = tmp_path / "valid.jsonl"
+    invalid_output_file = tmp_path / "invalid.jsonl"
+
+    def run(paths):
+        processed_files.clear()
+        process_files(
+            tracking_iter_data_points,
+            paths,
+            valid_output_file,
+            invalid_output_file,
+            workers=1,
+            cache_dir=cache_dir,
+        )
+        return list(iter_jsonl(valid_output_file))
+
+    first_output = run(file_paths)
+    assert processed_files == ["a.txt", "b.txt", "c.txt"]
+
+    # Nothing changed, touching a file without changing it does not count as a change
+    os.utime(file_paths[0], ns=(0, 0))
+    assert run(file_paths) == first_output
+    assert processed_files == []
+
+    with open(file_paths[1], "a", encoding="utf-8") as f:
+        f.write("ཀ་ ཁ་ <utt>\n")
+    second_output = run(file_paths[1:])
+    assert processed_files == ["b.txt"]
+    assert second_output[-1]["filename"] == "c.txt"
+    assert {"source": "ཀ་ཁ་", "target": "ཀ་ ཁ་", "filename": "b.txt"} in second_output
+    assert not any(item["filename"] == "a.txt" for item in second_output)
+    assert len(os.listdir(cache_dir)) == 1 + 2 * 2  # manifest and two shards per file
@@ -0,0 +1,24 @@
+import json
+
+from TibWordGathering.manual_dataset import process_data
+from TibWordGathering.utils import iter_records
+
+
+def test_process_data_keeps_extra_fields(tmp_path):
+    records = [
+        {"source": "ཀཁ", "target": "ཀ ཁ", "tags": ["a"], "page": 3},
+        {"source": "ཀཁ", "target": "ཀ ག", "meta": {"note": "typo"}},
+    ]
+    input_file = tmp_path / "manual_data.json"
+    input_file.write_text(
+        "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records),
+        encoding="utf-8",
+    )
+    valid_file = tmp_path / "output" / "valid.json"
+    invalid_file = tmp_path / "output" / "invalid.json"
+
+    assert process_data(input_file, valid_file, invalid_file) == (1, 1)
+
+    filename = {"filename": "manual_data.json"}
+    assert list(iter_records(valid_file)) == [{**records[0], **filename}]
+    assert list(iter_records(invalid_file)) == [{**records[1], **filename}]
@@ -0,0 +1,64 @@
+import json
+import os
+import pstats
+import sys
+
+from TibWordGathering.metrics import disable_metrics, enable_metrics, peak_rss_bytes
+from TibWordGathering.parallel import process_files
+from TibWordGathering.segpos import iter_data_points
+
+
+def test_process_files_metrics(tmp_path):
+    """
+    With metrics enabled, every file gets a read, parse, validate and write entry, also when
+    the files are parsed in worker processes, and the reports are written as JSON and
+    Prometheus text.
+    """
+    file_path = "tests/data/segpos_sample/segpos.txt"
+    for workers in (1, 2):
+        metrics = enable_metrics(profile_stage="parse", profile_dir=tmp_path)
+        try:
+            valid, invalid = process_files(
+                iter_data_points,
+                [file_path, file_path],
+                tmp_path / "valid.jsonl",
+                tmp_path / "invalid.jsonl",
+                workers=workers,
+            )
+        finally:
+            disable_metrics()
+
+        summary = metrics.summary()
+        assert [
+            summary[stage]["inputs"] for stage in ["read", "parse", "validate", "write"]
+        ] == [2, 2, 2, 2]
+        assert summary["read"]["bytes_read"] == 2 * os.path.getsize(file_path)
+        assert summary["parse"]["bytes_read"] == 0
+        assert summary["parse"]["records_out"] == valid + invalid
+        assert summary["validate"]["valid"] == valid
+        assert summary["validate"]["invalid"] == invalid
+        assert summary["write"]["records_out"] == valid + invalid
+        assert summary["parse"]["peak_rss_bytes"] > 0
+        if workers == 1:
+            # Only stages run in the current process are profiled
+            pstats.Stats(metrics.write_profile())
+
+    metrics.write_json(tmp_path / "metrics.json")
+    with open(tmp_path / "metrics.json", encoding="utf-8") as f:
+        report = json.load(f)
+    assert len(report["stages"]) == 8
+    assert report["stages"][0]["file"] == file_path
+
+    metrics.write_prometheus(tmp_path / "metrics.prom")
+    text = (tmp_path / "metrics.prom").read_text(encoding="utf-8")
+    assert (
+        f'tibwords_stage_records_out_total{{stage="write"}} {valid + invalid}' in text
+    )
+    assert "# TYPE tibwords_stage_valid_ratio gauge" in text
+
+
+def test_peak_rss_bytes_without_resource(monkeypatch):
+    """Peak memory is reported as 0 where the resource module does not exist."""
+    assert peak_rss_bytes() > 0
+    monkeypatch.setitem(sys.modules, "resource", None)
+    assert peak_rss_bytes() == 0
@@ -0,0 +1,123 @@
+import pickle
+from functools import partial
+
+from TibWordGathering.manifest import processor_key
+from TibWordGathering.normalization import Normalizer, iter_normalized
+from TibWordGathering.segpos import iter_data_points, process_folder
+from TibWordGathering.utils import is_valid_data_point, iter_jsonl
+
+
+def test_normalize_text():
+    normalizer = Normalizer()
+    # non-breaking tsheg, no-break space, zero-width space and stray spaces
+    assert normalizer.normalize(" ཀ༌ཁ  ག​ ་  ") == "ཀ་ཁ ག་"
+    # composed vowel and deprecated vocalic rr are decomposed
+    assert normalizer.normalize("ཀཱི ཷ") == "ཀཱི ྲཱྀ"
+    assert normalizer.normalize("ཀ་ཁ ག") == "ཀ་ཁ ག"
+
+
+def test_is_normalized_matches_normalize():
+    normalizer = Normalizer()
+    texts = [
+        "ཀ་ཁ ག",
+        " ཀ",
+        "ཀ ",
+        "ཀ  ཁ",
+        "ཀ ་",
+        "ཀ༌",
+        "ཀ​ཁ",
+        "ཀ\u0f73",
+        "ཀ\u0f71\u0f72",
+        "ཀ\tཁ",
+        "",
+    ]
+    for text in texts:
+        assert normalizer.is_normalized(text) == (normalizer.normalize(text) == text)
+    assert Normalizer(form=None, attach_tsheg=False).is_normalized("ཀཱི ་")
+
+
+def test_rules_can_be_disabled():
+    normalizer = Normalizer(
+        form=None, tsheg=False, attach_tsheg=False, collapse_spaces=False
+    )
+    assert normalizer.normalize("ཀ༌ ་ཁ ") == "ཀ༌ ་ཁ "
+    assert normalizer.normalize("ཀ ཁ​") == "ཀ ཁ"
+
+
+def test_normalize_data_point():
+    normalizer = Normalizer()
+    data_point = {"source": "ཀ་ཁ ", "target": "ཀ༌ ཁ", "filename": "a.txt"}
+    assert not is_valid_data_point(data_point)
+    assert normalizer(data_point) is data_point
+    assert data_point == {"source": "ཀ་ཁ", "target": "ཀ་ ཁ", "filename": "a.txt"}
+    assert is_valid_data_point(data_point)
+
+
+def test_normalizer_cache_key():
+    normalizer = pickle.loads(pickle.dumps(Normalizer(form="NFC")))
+    assert normalizer == Normalizer(form="NFC")
+    key = processor_key(partial(iter_normalized, iter_data_points, normalizer))
+    assert key == processor_key(
+        partial(iter_normalized, iter_data_points, Normalizer(form="NFC"))
+    )
+    assert key != processor_key(
+        partial(iter_normalized, iter_data_points, Normalizer())
+    )
+    assert "0x" not in key
+
+
+def test_process_folder_normalized(tmp_path):
+    # The same file, with non-breaking tshegs and a zero-width space
+    with open("tests/data/segpos_sample/segpos.txt", encoding="utf-8") as f:
+        text = f.read()
+    volume_dir = tmp_path / "input" / "volume"
+    volume_dir.mkdir(parents=True)
+    noisy_text = text.replace("་", "༌").replace("།", "​།")
+    (volume_dir / "segpos.txt").write_text(noisy_text, encoding="utf-8")
+    valid_file = tmp_path / "valid.jsonl"
+    invalid_file = tmp_path / "invalid.jsonl"
+
+    normalizer = Normalizer()
+    process_folder(
+        str(tmp_path / "input"),
+        valid_file,
+        invalid_file,
+        workers=1,
+        normalizer=normalizer,
+    )
+
+    expected = [
+        normalizer(data_point)
+        for data_point in iter_data_points("tests/data/segpos_sample/segpos.txt")
+    ]
+    assert list(iter_jsonl(valid_file)) == expected
+    assert not invalid_file.exists()
+
+
+def test_normalize_data_points_matches_normalizer():
+    normalizer = Normalizer()
+    data_points = [
+        {"source": "ཀ་ཁ", "target": "ཀ་ ཁ"},
+        {"source": " ཀ༌ཁ  ག​ ་  ", "target": "ཀཱི ཷ "},
+        {"source": " ", "target": "  ་ཀ"},
+        {"source": "ཀ\0 ཁ", "target": "ཁ"},
+        {"source": "ཀ  ཁ"},
+        {"source": "ཀ  ཁ", "target": None},
+    ]
+    for start in range(len(data_points)):
+        batch = [dict(data_point) for data_point in data_points[start:]]
+        expected = [normalizer(dict(data_point)) for data_point in batch]
+        assert normalizer.normalize_data_points(batch) == expected
+    clean = [{"source": "ཀ་ཁ", "target": "ཀ་ ཁ"}]
+    assert normalizer.normalize_data_points(clean) == [
+        {"source": "ཀ་ཁ", "target": "ཀ་ ཁ"}
+    ]
+
+
+def test_iter_normalized_batches(monkeypatch):
+    monkeypatch.setattr("TibWordGathering.normalization.BATCH_SIZE", 3)
+    normalizer = Normalizer()
+    file_path = "tests/data/segpos_sample/segpos.txt"
+    expected = [normalizer(data_point) for data_point in iter_data_points(file_path)]
+    assert len(expected) > 3
+    assert list(iter_normalized(iter_data_points, normalizer, file_path)) == expected
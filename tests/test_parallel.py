@@ -0,0 +1,43 @@
+import shutil
+
+from TibWordGathering.parallel import process_files
+from TibWordGathering.segpos_kang_and_eteng import iter_data_points
+from TibWordGathering.utils import iter_jsonl
+
+
+def test_process_files_parallel_matches_sequential(tmp_path):
+    """
+    Processing files in a process pool must write exactly the same records, in the same order,
+    as processing them one by one in the current process.
+    """
+    file_paths = []
+    for name in ["a.txt", "b.txt", "c.txt"]:
+        file_path = tmp_path / name
+        shutil.copy(
+            "tests/data/segpos_kangyur_and_eTengyur_sample/segpos_kangyur_and_eTengyur.txt",
+            file_path,
+        )
+        file_paths.append(str(file_path))
+
+    sequential_output = tmp_path / "sequential.jsonl"
+    parallel_output = tmp_path / "parallel.jsonl"
+    process_files(
+        iter_data_points,
+        file_paths,
+        sequential_output,
+        tmp_path / "sequential_invalid.jsonl",
+        workers=1,
+    )
+    process_files(
+        iter_data_points,
+        file_paths,
+        parallel_output,
+        tmp_path / "parallel_invalid.jsonl",
+        workers=2,
+        chunksize=2,
+    )
+
+    sequential_data = list(iter_jsonl(sequential_output))
+    assert sequential_data
+    assert [item["filename"] for item in sequential_data][0] == "a.txt"
+    assert list(iter_jsonl(parallel_output)) == sequential_data
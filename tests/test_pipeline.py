@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+
+from TibWordGathering.cli import main
+from TibWordGathering.utils import iter_records
+
+
+def write_config(tmp_path):
+    segpos_folder = tmp_path / "SegPos" / "volume1"
+    segpos_folder.mkdir(parents=True)
+    shutil.copy("tests/data/segpos_sample/segpos.txt", segpos_folder)
+    output = tmp_path / "output"
+    config = {
+        "state_dir": str(tmp_path / "state"),
+        "sources": {
+            "segpos": {
+                "input": str(tmp_path / "SegPos"),
+                "valid": str(output / "segpos" / "valid.jsonl"),
+                "invalid": str(output / "segpos" / "invalid.jsonl"),
+                "cache_dir": None,
+                "max_length": 60,
+            },
+            "conllu": {
+                "input": "tests/data/conllu_sample",
+                "valid": str(output / "conllu" / "valid.jsonl"),
+                "invalid": str(output / "conllu" / "invalid.jsonl"),
+                "cache_dir": None,
+            },
+            "segpos_kang_and_eteng": None,
+            "evaluation": None,
+            "manual": None,
+        },
+        "combine": {"output": str(output / "combined.jsonl")},
+        "dedup": {"output": str(output / "deduplicated.jsonl")},
+        "labels": {"output_dir": str(output / "labels"), "schemes": ["bmes"]},
+        "buckets": {"output_dir": str(output / "buckets"), "bounds": [50, 100]},
+        "lexicon": {
+            "output_dir": str(output / "lexicon"),
+            "cache_dir": str(tmp_path / "cache" / "lexicon"),
+        },
+    }
+    config_path = tmp_path / "tibwords.json"
+    config_path.write_text(json.dumps(config), encoding="utf-8")
+    return config_path, config
+
+
+def test_tibwords_runs_the_pipeline_and_skips_up_to_date_stages(tmp_path, capsys):
+    config_path, config = write_config(tmp_path)
+    metrics_path = tmp_path / "metrics.json"
+    argv = ["--config", str(config_path), "--workers", "1"]
+
+    assert main(argv + ["--metrics-json", str(metrics_path)]) == 0
+    combined = list(iter_records(config["combine"]["output"]))
+    segpos = list(iter_records(config["sources"]["segpos"]["valid"]))
+    conllu = list(iter_records(config["sources"]["conllu"]["valid"]))
+    assert combined == segpos + conllu
+    assert os.path.exists(config["dedup"]["output"])
+    assert all(len(record["source"]) <= 60 for record in segpos)
+    assert os.listdir(config["buckets"]["output_dir"])
+    for name in ["segpos", "conllu", "lexicon"]:
+        assert os.path.exists(
+            os.path.join(config["lexicon"]["output_dir"], f"{name}.tsv")
+        )
+    with open(metrics_path, encoding="utf-8") as f:
+        assert {"parse", "combine", "dedup"} <= set(json.load(f)["summary"])
+
+    capsys.readouterr()
+    assert main(argv) == 0
+    output = capsys.readouterr().out
+    for stage in [
+        "segpos",
+        "conllu",
+        "combine",
+        "dedup",
+        "lexicon",
+        "labels",
+        "buckets",
+    ]:
+        assert f"[{stage}] up to date" in output
+
+    # Changing one source reruns it and everything downstream, but not the other source
+    segpos_file = tmp_path / "SegPos" / "volume1" / "segpos.txt"
+    with open(segpos_file, "a", encoding="utf-8") as f:
+        f.write("\nཀ་ ཁ་ <utt>\n")
+    assert main(argv) == 0
+    output = capsys.readouterr().out
+    assert "[conllu] up to date" in output
+    for stage in ["segpos", "combine", "dedup", "lexicon"]:
+        assert f"[{stage}] done" in output
+
+    # Enabling normalization changes the options of every source, so they all rerun
+    config["normalize"] = {"form": "NFD"}
+    config_path.write_text(json.dumps(config), encoding="utf-8")
+    assert main(argv) == 0
+    output = capsys.readouterr().out
+    for stage in ["segpos", "conllu", "combine"]:
+        assert f"[{stage}] done" in output
+
+
+def test_tibwords_with_nested_worker_pools(tmp_path, capsys):
+    """
+    With --workers 2 every source stage runs its own process pool inside the pipeline's
+    pool; the per-file results written to the manifest by those processes must give the
+    same output as a run in one process, and be reused by the next run.
+    """
+    config_path, config = write_config(tmp_path)
+    for name in ["volume2", "volume3"]:
+        volume_dir = tmp_path / "SegPos" / name
+        volume_dir.mkdir()
+        shutil.copy("tests/data/segpos_sample/segpos.txt", volume_dir)
+    for source in ["segpos", "conllu"]:
+        config["sources"][source]["cache_dir"] = str(tmp_path / "cache" / source)
+    config_path.write_text(json.dumps(config), encoding="utf-8")
+
+    assert main(["--config", str(config_path), "--workers", "2"]) == 0
+    combined = list(iter_records(config["combine"]["output"]))
+    manifest_path = tmp_path / "cache" / "segpos" / "manifest.jsonl"
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = [json.loads(line) for line in f]
+    assert sorted(os.path.basename(os.path.dirname(e["path"])) for e in manifest) == [
+        "volume1",
+        "volume2",
+        "volume3",
+    ]
+
+    # The same corpus processed in one process, without the cache
+    one_process = config["combine"]["output"] + ".single.jsonl"
+    single_config = json.loads(json.dumps(config))
+    single_config["state_dir"] = str(tmp_path / "state_single")
+    single_config["combine"]["output"] = one_process
+    for source in ["segpos", "conllu"]:
+        options = single_config["sources"][source]
+        options["cache_dir"] = None
+        options["valid"] += ".single.jsonl"
+    single_path = tmp_path / "single.json"
+    single_path.write_text(json.dumps(single_config), encoding="utf-8")
+    assert main(["--config", str(single_path), "--workers", "1"]) == 0
+    assert combined == list(iter_records(one_process))
+
+    # A forced rerun with two workers reuses every cached file
+    capsys.readouterr()
+    assert main(["--config", str(config_path), "--workers", "2", "--force"]) == 0
+    assert list(iter_records(config["combine"]["output"])) == combined
+    with open(manifest_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == len(manifest)
@@ -0,0 +1,86 @@
+import os
+import shutil
+
+from TibWordGathering.conllu_parser import process_conllu_folder
+from TibWordGathering.prefetch import prefetch_files
+from TibWordGathering.segpos import process_folder
+from TibWordGathering.utils import (
+    iter_records,
+    list_folder_files,
+    list_subfolder_files,
+    walk_files,
+)
+
+
+def test_walk_files(tmp_path):
+    for relative_path in ["a.txt", "b/c.txt", "b/d.csv", "b/e/f.txt", "g/h.txt"]:
+        file_path = tmp_path / relative_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text("ཀ", encoding="utf-8")
+    # A link back to the top folder must not be walked forever
+    os.symlink(tmp_path, tmp_path / "b" / "loop")
+    root = str(tmp_path)
+
+    expected = [
+        os.path.join(root, path) for path in ["b/c.txt", "b/e/f.txt", "g/h.txt"]
+    ]
+    assert list_subfolder_files(root, ".txt") == expected
+    assert walk_files(root, ".txt") == [os.path.join(root, "a.txt")] + expected
+    assert list_folder_files(root, ".txt") == [os.path.join(root, "a.txt")]
+
+
+def test_prefetch_files_keeps_order(tmp_path):
+    file_paths = []
+    for index in range(50):
+        file_path = tmp_path / f"{index}.txt"
+        file_path.write_bytes(str(index).encode() * (index + 1))
+        file_paths.append(str(file_path))
+
+    results = list(prefetch_files(file_paths, threads=4, max_bytes=40))
+    assert [file_path for file_path, _ in results] == file_paths
+    for index, (_, data) in enumerate(results):
+        expected = str(index).encode() * (index + 1)
+        assert data == (expected if len(expected) <= 40 else None)
+
+
+def test_process_folder_with_prefetch(tmp_path):
+    input_dir = tmp_path / "input"
+    for volume in range(3):
+        (input_dir / f"volume{volume}").mkdir(parents=True)
+        shutil.copy(
+            "tests/data/segpos_sample/segpos.txt",
+            input_dir / f"volume{volume}" / "segpos.txt",
+        )
+    expected_file = tmp_path / "expected.jsonl"
+    process_folder(str(input_dir), expected_file, tmp_path / "invalid.jsonl", workers=1)
+    expected = list(iter_records(expected_file))
+
+    for workers in [1, 2]:
+        valid_file = tmp_path / f"valid_{workers}.jsonl"
+        process_folder(
+            str(input_dir),
+            valid_file,
+            tmp_path / "invalid.jsonl",
+            workers=workers,
+            chunksize=2,
+            prefetch=2,
+        )
+        assert list(iter_records(valid_file)) == expected
+
+    counts = process_conllu_folder(
+        "tests/data/conllu_sample",
+        tmp_path / "conllu.jsonl",
+        tmp_path / "conllu_invalid.jsonl",
+        workers=1,
+    )
+    prefetched_counts = process_conllu_folder(
+        "tests/data/conllu_sample",
+        tmp_path / "conllu_prefetched.jsonl",
+        tmp_path / "conllu_prefetched_invalid.jsonl",
+        workers=1,
+        prefetch=2,
+    )
+    assert prefetched_counts == counts
+    assert list(iter_records(tmp_path / "conllu_prefetched.jsonl")) == list(
+        iter_records(tmp_path / "conllu.jsonl")
+    )
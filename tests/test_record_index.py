@@ -0,0 +1,66 @@
+import pytest
+
+from TibWordGathering.combine_word_seg import combine_json_files
+from TibWordGathering.record_index import RecordIndex, index_path
+from TibWordGathering.utils import iter_records, save_records
+
+RECORDS = [
+    {"source": "ཀཁ", "target": "ཀ ཁ", "filename": "a.txt"},
+    {"source": "ག", "target": "ག", "filename": "a.txt"},
+    {"source": "ང,", "target": "ང ,", "filename": "b.txt"},
+    {"source": "ཅ", "target": "ཆ", "filename": "a.txt"},
+]
+
+
+@pytest.mark.parametrize("name", ["data.json", "data.jsonl"])
+def test_random_access(tmp_path, name):
+    file_path = tmp_path / name
+    save_records(RECORDS, file_path, omit_source=True, index=True)
+
+    with RecordIndex(file_path) as index:
+        assert len(index) == len(RECORDS)
+        assert [index[n] for n in range(len(RECORDS))] == RECORDS
+        assert index[-1] == RECORDS[-1]
+        with pytest.raises(IndexError):
+            index[len(RECORDS)]
+        assert list(index.records(1, 3)) == RECORDS[1:3]
+        assert list(index.records()) == RECORDS
+        assert index.filenames() == ["a.txt", "b.txt"]
+        assert list(index.by_filename("a.txt")) == RECORDS[:2] + RECORDS[3:]
+        assert list(index.by_filename("missing.txt")) == []
+
+
+def test_empty_and_stale_index(tmp_path):
+    file_path = tmp_path / "data.jsonl"
+    save_records([], file_path, index=True)
+    with RecordIndex(file_path) as index:
+        assert len(index) == 0 and list(index.records()) == []
+
+    # Written again without an index: the old index no longer matches
+    save_records(RECORDS, file_path)
+    with pytest.raises(ValueError):
+        RecordIndex(file_path)
+    with pytest.raises(ValueError):
+        save_records(RECORDS, tmp_path / "data.jsonl.gz", index=True)
+
+
+def test_combine_json_files_index(tmp_path):
+    source = tmp_path / "records.jsonl"
+    save_records(RECORDS, source)
+    output_file = tmp_path / "combined.json"
+    combine_json_files(
+        ["tests/data/expected/segpos.json", str(source)], output_file, index=True
+    )
+
+    combined = list(iter_records(output_file))
+    with open(index_path(output_file), "rb") as f:
+        assert f.read(8) == b"TIBIDX01"
+    with RecordIndex(output_file) as index:
+        assert len(index) == len(combined)
+        assert index[len(combined) // 2] == combined[len(combined) // 2]
+        assert index.filenames() == [None, "a.txt", "b.txt"]
+        for filename in index.filenames():
+            expected = [
+                record for record in combined if record.get("filename") == filename
+            ]
+            assert list(index.by_filename(filename)) == expected
@@ -0,0 +1,43 @@
+import pickle
+
+from TibWordGathering.records import RecordStore, partition_records
+from TibWordGathering.segpos import iter_data_points
+from TibWordGathering.utils import partition_data_points
+
+
+def test_record_store_round_trip():
+    records = list(iter_data_points("tests/data/segpos_sample/segpos.txt"))
+    records += [
+        # invalid record: the target is stored as text
+        {"source": "ཀཁ", "target": "ཀ ག", "filename": "a.txt"},
+        # characters outside the Tibetan block and a word longer than 127 characters
+        {
+            "source": "abc" + "ཀ" * 200,
+            "target": "abc " + "ཀ" * 200,
+            "filename": "b.txt",
+        },
+        # missing target and an extra field
+        {"source": "ཀ", "filename": "a.txt", "corpus": "SegPos"},
+        {"source": "", "target": "", "filename": "a.txt"},
+        # values that are not strings, some of them unhashable
+        {"source": "ཀཁ", "target": "ཀ ཁ", "tags": ["a"], "meta": {"page": 1}},
+        {"source": "ཀཁ", "target": "ཀ ཁ", "tags": ["a"], "count": 1},
+        {"source": "ཀཁ", "target": "ཀ ཁ", "count": True},
+    ]
+    store = RecordStore()
+    store.extend(records)
+
+    assert len(store) == len(records)
+    assert list(store) == records
+    assert store[-2] == records[-2]
+    assert list(pickle.loads(pickle.dumps(store))) == records
+    assert store[-1]["count"] is True and store.nbytes() > 0
+
+
+def test_partition_records_matches_partition_data_points():
+    records = list(iter_data_points("tests/data/segpos_sample/segpos.txt"))
+    records.append({"source": "ཀཁ", "target": "ཀ ག", "filename": "a.txt"})
+    valid_data, invalid_data = partition_records(records)
+    expected_valid, expected_invalid = partition_data_points(records)
+    assert list(valid_data) == expected_valid
+    assert list(invalid_data) == expected_invalid
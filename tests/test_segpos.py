@@ -1,6 +1,8 @@
 import json
+import shutil
 
-from TibWordGathering.segpos import process_file
+from TibWordGathering.segpos import process_file, process_folder
+from TibWordGathering.utils import iter_jsonl
 
 
 def test_segpos():
@@ -31,3 +33,20 @@ def test_segpos():
     assert (
         valid_data_json_format == expected_data
     ), f"Mismatch between processed data and expected data.\nProcessed: {valid_data_json_format}\nExpected: {expected_data}"  # noqa
+
+
+def test_segpos_process_folder_streams_jsonl(tmp_path):
+    """
+    process_folder must stream the same valid records as process_file into a JSON Lines file.
+    """
+    volume_dir = tmp_path / "input" / "volume"
+    volume_dir.mkdir(parents=True)
+    shutil.copy("tests/data/segpos_sample/segpos.txt", volume_dir / "segpos.txt")
+    valid_output_file = tmp_path / "valid.jsonl"
+    invalid_output_file = tmp_path / "invalid.jsonl"
+
+    process_folder(str(tmp_path / "input"), valid_output_file, invalid_output_file)
+
+    valid_data, invalid_data = process_file("tests/data/segpos_sample/segpos.txt")
+    assert list(iter_jsonl(valid_output_file)) == valid_data
+    assert invalid_output_file.exists() == bool(invalid_data)
@@ -0,0 +1,80 @@
+from TibWordGathering.segpos_engine import (
+    KANGYUR_TENGYUR_MARKERS,
+    SEGPOS_MARKERS,
+    MarkerTable,
+    iter_file_data_points,
+    iter_targets,
+)
+
+
+def test_iter_targets_markers():
+    """
+    '<utt>' and page markers end a sentence only when they are whole tokens, and sentences
+    may span several lines.
+    """
+    text = "p1 ཀ་ ཁ ། <utt>\nག་ ང་ p2 ཅ་\nཆ xp3 ཇ<utt> p <utt>\n\n"
+    assert list(iter_targets(text, SEGPOS_MARKERS)) == [
+        "ཀ་ ཁ །",
+        "ག་ ང་",
+        "ཅ་ ཆ xp3 ཇ<utt> p",
+    ]
+    # Only ASCII digits make a marker
+    assert list(iter_targets("ཀ p¹ ཁ p١ ln² ག", KANGYUR_TENGYUR_MARKERS)) == [
+        "ཀ p¹ ཁ p١ ln² ག"
+    ]
+
+
+def test_iter_targets_skip_markers():
+    """
+    Line markers are dropped without ending the sentence in the eKangyur/eTengyur format,
+    but are kept as words in the SegPos format.
+    """
+    text = "p2 ln1 ཀ་ ཁ་\nln2 ག་ ། <utt>"
+    assert list(iter_targets(text, KANGYUR_TENGYUR_MARKERS)) == ["ཀ་ ཁ་ ག་ །"]
+    assert list(iter_targets(text, SEGPOS_MARKERS)) == ["ln1 ཀ་ ཁ་ ln2 ག་ །"]
+
+    custom_markers = MarkerTable([r"<s>"], [r"#\d+"])
+    assert list(iter_targets("ཀ #1 ཁ <s> ག", custom_markers)) == ["ཀ ཁ", "ག"]
+
+
+def test_iter_targets_windows():
+    """
+    Sentences, repeated markers and skip markers that span several parsing windows give
+    the same targets as parsing the whole text at once.
+    """
+    text = "p1 ཀ་ ཁ\nln1 ག་\n<utt>\n<utt> <utt> ང་ ln2\nln3\nཅ་ །\np2\n\n"
+    for markers in [SEGPOS_MARKERS, KANGYUR_TENGYUR_MARKERS]:
+        expected = list(iter_targets(text, markers))
+        for window_size in [1, 4, 9]:
+            assert list(iter_targets(text, markers, window_size)) == expected
+    assert list(iter_targets(text, KANGYUR_TENGYUR_MARKERS, 1)) == [
+        "ཀ་ ཁ ག་",
+        "ང་ ཅ་ །",
+    ]
+
+
+def test_mmap_reader_matches_text_reader(tmp_path):
+    """
+    The memory-mapped reader must yield the same data points as the regular reader,
+    including for empty files and when iteration stops early.
+    """
+    for sample_file, markers in [
+        ("tests/data/segpos_sample/segpos.txt", SEGPOS_MARKERS),
+        (
+            "tests/data/segpos_kangyur_and_eTengyur_sample/segpos_kangyur_and_eTengyur.txt",
+            KANGYUR_TENGYUR_MARKERS,
+        ),
+    ]:
+        expected = list(iter_file_data_points(sample_file, markers))
+        assert expected
+        assert list(iter_file_data_points(sample_file, markers, use_mmap=True)) == (
+            expected
+        )
+
+        data_points = iter_file_data_points(sample_file, markers, use_mmap=True)
+        assert next(data_points) == expected[0]
+        data_points.close()
+
+    empty_file = tmp_path / "empty.txt"
+    empty_file.write_bytes(b"")
+    assert list(iter_file_data_points(str(empty_file), SEGPOS_MARKERS, True)) == []
@@ -0,0 +1,81 @@
+import shutil
+
+from TibWordGathering.segpos import iter_data_points, process_folder
+from TibWordGathering.splitting import (
+    bucket_path,
+    split_record,
+    split_tokens,
+    write_length_buckets,
+)
+from TibWordGathering.utils import iter_jsonl
+
+
+def test_split_tokens_prefers_shad():
+    tokens = ["ཀ་", "ཁ", "།", "ག་", "ང་", "ཅ", "།", "།", "ཆ་ཇ"]
+    # Cut after the first clause, not after the last token that fits
+    assert split_tokens(tokens, 7) == [
+        ["ཀ་", "ཁ", "།"],
+        ["ག་", "ང་", "ཅ", "།", "།"],
+        ["ཆ་ཇ"],
+    ]
+    # The double shad stays together
+    assert split_tokens(tokens, 11) == [tokens[:8], ["ཆ་ཇ"]]
+    # Without a shad in the budget, cut at a word; a long word is a piece of its own
+    assert split_tokens(["ཀ་ཁ་", "ག་ང་ཅ་ཆ་", "ཇ"], 4) == [["ཀ་ཁ་"], ["ག་ང་ཅ་ཆ་"], ["ཇ"]]
+
+
+def test_split_record():
+    record = {"source": "ཀ་ཁ།ག་ང།", "target": "ཀ་ ཁ ། ག་ ང །", "filename": "a.txt"}
+    assert split_record(record, 10) == [record]
+    assert split_record(record, 5) == [
+        {"source": "ཀ་ཁ།", "target": "ཀ་ ཁ །", "filename": "a.txt"},
+        {"source": "ག་ང།", "target": "ག་ ང །", "filename": "a.txt"},
+    ]
+    # A source that differs from its target cannot be split consistently
+    invalid = dict(record, source="ཀ་ཁ།ག་ཅ།")
+    assert split_record(invalid, 5) == [invalid]
+
+
+def test_process_folder_splits_long_records(tmp_path):
+    volume_dir = tmp_path / "input" / "volume"
+    volume_dir.mkdir(parents=True)
+    shutil.copy("tests/data/segpos_sample/segpos.txt", volume_dir)
+    valid_file = tmp_path / "valid.jsonl"
+
+    process_folder(
+        str(tmp_path / "input"),
+        valid_file,
+        tmp_path / "invalid.jsonl",
+        workers=1,
+        max_length=30,
+    )
+
+    records = list(iter_jsonl(valid_file))
+    original = list(iter_data_points("tests/data/segpos_sample/segpos.txt"))
+    assert len(records) > len(original)
+    assert all(
+        len(record["source"]) <= 30 or " " not in record["target"] for record in records
+    )
+    assert "".join(record["source"] for record in records) == "".join(
+        record["source"] for record in original
+    )
+    assert " ".join(record["target"] for record in records) == " ".join(
+        record["target"] for record in original
+    )
+
+
+def test_write_length_buckets(tmp_path, capsys):
+    records = [
+        {"source": "ཀ" * length, "target": "ཀ" * length} for length in [1, 5, 4, 9, 20]
+    ]
+
+    counts = write_length_buckets(records, tmp_path, bounds=[4, 8, 16])
+    assert capsys.readouterr().out == ""
+
+    assert counts == {
+        bucket_path(tmp_path, 4): 2,
+        bucket_path(tmp_path, 8): 1,
+        bucket_path(tmp_path, 16): 1,
+        bucket_path(tmp_path, None): 1,
+    }
+    assert list(iter_jsonl(bucket_path(tmp_path, 4))) == [records[0], records[2]]
@@ -0,0 +1,127 @@
+import gzip
+import json
+
+from TibWordGathering.utils import (
+    RecordWriter,
+    diagnose_data_point,
+    error_report_path,
+    is_valid_data_point,
+    iter_jsonl,
+    iter_records,
+    save_records,
+    validate_data_points,
+)
+
+
+def test_record_writer_json_array(tmp_path):
+    """
+    Records streamed into a '.json' file must still load as a regular JSON array.
+    """
+    records = [
+        {"source": "ཀ་ཁ", "target": "ཀ་ ཁ", "filename": "a.txt"},
+        {"source": "ག", "target": "ག", "filename": "a.txt"},
+    ]
+    output_file = tmp_path / "data.json"
+    assert save_records(iter(records), output_file) == 2
+
+    with open(output_file, encoding="utf-8") as f:
+        assert json.load(f) == records
+
+    empty_file = tmp_path / "empty.json"
+    save_records([], empty_file)
+    with open(empty_file, encoding="utf-8") as f:
+        assert json.load(f) == []
+
+
+def test_record_writer_jsonl_gz(tmp_path):
+    """
+    '.jsonl.gz' outputs are written as compressed JSON Lines and read back one record at a time.
+    Lazy writers must not create a file when nothing is written.
+    """
+    records = [{"source": "ཀ", "target": "ཀ", "filename": "a.txt"}] * 3
+    output_file = tmp_path / "data.jsonl.gz"
+    save_records(records, output_file)
+
+    with gzip.open(output_file, "rt", encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
+    assert list(iter_jsonl(output_file)) == records
+
+    lazy_file = tmp_path / "invalid.jsonl"
+    with RecordWriter(lazy_file, lazy=True):
+        pass
+    assert not lazy_file.exists()
+
+
+def test_validate_data_points():
+    """
+    A data point is valid only when source and target are identical once spaces are removed.
+    """
+    data_points = [
+        {"source": "ཀ་ཁ་", "target": "ཀ་ ཁ་"},
+        {"source": "ཀ་ ཁ་", "target": "ཀ་ཁ་"},
+        {"source": "ཀ་ཁ་", "target": "ཀ་ ག་"},
+        {"source": "ཀ་ཁ་", "target": "ཀ་"},
+        {"source": "", "target": "   "},
+    ]
+    expected = [True, True, False, False, True]
+    assert [is_valid_data_point(data_point) for data_point in data_points] == expected
+    assert validate_data_points(data_points) == expected
+
+
+def test_record_writer_omit_source(tmp_path):
+    """
+    With omit_source, sources that are the target without spaces are left out of the file
+    and derived again by the readers; other sources are kept.
+    """
+    records = [
+        {"source": "ཀ་ཁ", "target": "ཀ་ ཁ", "filename": "a.txt"},
+        {"source": "ཀ་ ཁ", "target": "ཀ་ ཁ", "filename": "a.txt"},
+        {"source": "ཀ", "target": "ག", "filename": "a.txt"},
+    ]
+    for name in ["data.json", "data.jsonl"]:
+        output_file = tmp_path / name
+        with RecordWriter(output_file, omit_source=True) as writer:
+            writer.write_all(records)
+        assert list(iter_records(output_file)) == records
+
+    with open(tmp_path / "data.jsonl", encoding="utf-8") as f:
+        stored = [json.loads(line) for line in f]
+    assert [("source" in record) for record in stored] == [False, True, True]
+
+
+def test_diagnose_data_point():
+    assert diagnose_data_point({"source": "ཀ་ཁ", "target": "ཀ་ ཁ"}) is None
+    assert diagnose_data_point({"source": "", "target": "ཀ"})["error"] == "empty"
+
+    source = "ཀ་ཁ་ག་ང་ཅ་ཆ་ཇ་ཉ་ཏ་ཐ་ད"
+    target = "ཀ་ ཁ་ ག་ ང་ ཅ་ ཆ་ ཇ་ ཉ་ ཏ་ ཐ་ ན"
+    diagnostics = diagnose_data_point({"source": source, "target": target})
+    assert diagnostics == {
+        "error": "char",
+        "error_offset": 20,
+        "error_source": "ཆ་ཇ་ཉ་ཏ་ཐ་ད",
+        "error_target": "ཆ་ཇ་ཉ་ཏ་ཐ་ན",
+    }
+    diagnostics = diagnose_data_point({"source": "ཀཁག", "target": "ཀ ཁ ག ང"})
+    assert diagnostics["error"] == "length"
+    assert diagnostics["error_offset"] == 3
+
+
+def test_record_writer_diagnose(tmp_path):
+    records = [
+        {"source": "ཀཁ", "target": "ཀ ག", "filename": "a.txt"},
+        {"source": "ཀཁ", "target": "ཀ", "filename": "a.txt"},
+        {"source": "ཀཁ", "target": "ཀ ཆ", "filename": "b.txt"},
+    ]
+    file_path = tmp_path / "invalid.jsonl"
+    save_records(records, file_path, diagnose=True)
+
+    written = list(iter_jsonl(file_path))
+    assert [record["error"] for record in written] == ["char", "length", "char"]
+    assert [record["error_offset"] for record in written] == [1, 1, 1]
+    assert error_report_path(file_path) == str(tmp_path / "invalid_errors.json")
+    with open(error_report_path(file_path), encoding="utf-8") as f:
+        assert json.load(f) == {
+            "total": {"char": 2, "length": 1},
+            "files": {"a.txt": {"char": 1, "length": 1}, "b.txt": {"char": 1}},
+        }